@@ -0,0 +1,267 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+# --------------------------------------------------
+# Admission control
+# --------------------------------------------------
+# At most `max_in_flight` chat requests run the full pipeline (encode,
+# retrieval, LLM call). The rest wait in per-user queues that are
+# served round-robin, so one chatty user cannot starve the others.
+#
+#   queue full             503 (+ Retry-After), nothing is started
+#   user's queue full      429
+#   waited past deadline   503; the deadline is ADMISSION_QUEUE_TIMEOUT,
+#                          or the client's X-Request-Timeout-Ms if sooner
+#
+# Queue depth also picks a degraded mode for what gets admitted:
+#   >= degrade_depth       no_extraction  (answer, skip memory extraction)
+#   >= cache_only_depth    cache_only     (serve cache hits, 503 on miss;
+#                                          these skip the queue)
+# --------------------------------------------------
+
+NORMAL = "normal"
+NO_EXTRACTION = "no_extraction"
+CACHE_ONLY = "cache_only"
+
+
+class Rejected(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    __slots__ = ("mode", "slot", "waited", "started")
+
+    def __init__(self, mode, slot, waited=0.0):
+        self.mode = mode
+        self.slot = slot
+        self.waited = waited
+        self.started = time.monotonic()
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "enqueued")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued = time.monotonic()
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_in_flight=16,
+        max_queue=64,
+        max_queue_per_user=4,
+        queue_timeout=10.0,
+        degrade_depth=16,
+        cache_only_depth=48
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.degrade_depth = degrade_depth
+        self.cache_only_depth = cache_only_depth
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.depth = 0
+        self.queues = OrderedDict()  # user_id -> deque of waiters, round-robin order
+
+        self.waits = deque(maxlen=1000)
+        self.service_times = deque(maxlen=200)
+        self.metrics = {
+            "requests": 0,
+            "admitted": 0,
+            "queued": 0,
+            "shed_queue_full": 0,
+            "shed_user_limit": 0,
+            "shed_timeout": 0,
+            "shed_cache_miss": 0,
+            NO_EXTRACTION: 0,
+            CACHE_ONLY: 0
+        }
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    @contextmanager
+    def admit(self, user_id, timeout=None):
+        """
+        Holds a slot for the block. Raises Rejected when shed.
+        """
+        ticket = self.acquire(user_id, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def acquire(self, user_id, timeout=None):
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+
+        with self.lock:
+            self.metrics["requests"] += 1
+            mode = self._mode()
+
+            if mode == CACHE_ONLY:
+                self.metrics[CACHE_ONLY] += 1
+                return Ticket(mode, slot=False)
+
+            if self.in_flight < self.max_in_flight and not self.depth:
+                self.in_flight += 1
+                return self._admitted(mode, 0.0)
+
+            if self.depth >= self.max_queue:
+                self.metrics["shed_queue_full"] += 1
+                raise Rejected(503, "Server overloaded", self._retry_after())
+
+            queue = self.queues.setdefault(user_id, deque())
+            if len(queue) >= self.max_queue_per_user:
+                self.metrics["shed_user_limit"] += 1
+                raise Rejected(429, "Too many concurrent requests for this user", self._retry_after())
+
+            waiter = _Waiter()
+            queue.append(waiter)
+            self.depth += 1
+            self.metrics["queued"] += 1
+
+        waiter.event.wait(timeout)
+
+        with self.lock:
+            waited = time.monotonic() - waiter.enqueued
+            self.waits.append(waited)
+
+            # A grant racing the timeout wins: the slot is already ours
+            if not waiter.granted:
+                queue = self.queues[user_id]
+                queue.remove(waiter)
+                if not queue:
+                    del self.queues[user_id]
+                self.depth -= 1
+                self.metrics["shed_timeout"] += 1
+                raise Rejected(503, "Timed out waiting for capacity", self._retry_after())
+
+            return self._admitted(self._mode(), waited)
+
+    def release(self, ticket):
+        if not ticket.slot:
+            return
+
+        with self.lock:
+            self.service_times.append(time.monotonic() - ticket.started)
+
+            # Hand the slot straight to the next user in line
+            if self.queues:
+                user_id, queue = next(iter(self.queues.items()))
+                waiter = queue.popleft()
+                if queue:
+                    self.queues.move_to_end(user_id)
+                else:
+                    del self.queues[user_id]
+                self.depth -= 1
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self.in_flight -= 1
+
+    def shed_cache_miss(self):
+        """
+        Rejected for a cache_only request that missed the cache.
+        """
+        with self.lock:
+            self.metrics["shed_cache_miss"] += 1
+            return Rejected(503, "Server overloaded (serving cached answers only)", self._retry_after())
+
+    def busy(self):
+        """
+        True when new work would queue (speculative work should not start).
+        """
+        with self.lock:
+            return bool(self.depth) or self.in_flight >= self.max_in_flight
+
+    def stats(self):
+        with self.lock:
+            m = dict(self.metrics)
+            waits = sorted(self.waits)
+            m.update({
+                "in_flight": self.in_flight,
+                "queue_depth": self.depth,
+                "queued_users": len(self.queues),
+                "mode": self._mode()
+            })
+
+        shed = sum(m[key] for key in m if key.startswith("shed_"))
+        m["shed_rate"] = round(shed / m["requests"], 3) if m["requests"] else 0.0
+        for label, q in (("p50", 0.50), ("p95", 0.95)):
+            m[f"queue_wait_{label}_ms"] = (
+                round(waits[min(int(len(waits) * q), len(waits) - 1)] * 1000, 1) if waits else None
+            )
+        return m
+
+    # --------------------------------------------------
+    # Internals (caller holds self.lock)
+    # --------------------------------------------------
+    def _mode(self):
+        if self.depth >= self.cache_only_depth:
+            return CACHE_ONLY
+        if self.depth >= self.degrade_depth:
+            return NO_EXTRACTION
+        return NORMAL
+
+    def _admitted(self, mode, waited):
+        self.metrics["admitted"] += 1
+        if mode != NORMAL:
+            self.metrics[mode] += 1
+        return Ticket(mode, slot=True, waited=waited)
+
+    def _retry_after(self):
+        """
+        Seconds until the current queue has likely drained.
+        """
+        if not self.service_times:
+            return 1
+        typical = sorted(self.service_times)[len(self.service_times) // 2]
+        return max(1, math.ceil(typical * (self.depth + 1) / self.max_in_flight))
+
+
+def client_timeout(value):
+    """
+    Seconds from an X-Request-Timeout-Ms header value, or None when it
+    is missing, malformed, non-positive or not finite (the queue's own
+    deadline applies then).
+    """
+    try:
+        timeout_ms = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(timeout_ms) or timeout_ms <= 0:
+        return None
+    return timeout_ms / 1000
+
+
+def create_admission():
+    """
+    AdmissionController from ADMISSION_* env vars, or None when
+    ADMISSION=0.
+    """
+    if os.getenv("ADMISSION", "1") != "1":
+        return None
+
+    return AdmissionController(
+        max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "16")),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+        max_queue_per_user=int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "4")),
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+        degrade_depth=int(os.getenv("ADMISSION_DEGRADE_DEPTH", "16")),
+        cache_only_depth=int(os.getenv("ADMISSION_CACHE_ONLY_DEPTH", "48"))
+    )
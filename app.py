@@ -1,11 +1,17 @@
-from flask import Flask, render_template, request, jsonify
-from embeddings import EmbeddingModel
-from episodic_memory import EpisodicMemory
-from semantic_memory import SemanticMemory
-from semantic_cache import SemanticCache
+from flask import Flask, Response, render_template, request, jsonify
 from prompt import build_prompt
-from llm import call_llm, extract_semantic_memory
-from short_term_memory import ShortTermMemory
+from llm import call_llm, get_llm_client
+from llm_client import LLMError
+from batch_chat import chat_batch, MAX_BATCH_SIZE
+from runtime import create_runtime
+from coalesce import create_single_flight
+from prefetch import create_prefetch_cache
+from admission import CACHE_ONLY, NO_EXTRACTION, NORMAL, Rejected, Ticket, client_timeout, create_admission
+from serialization import json_response, lean_result
+from contextlib import nullcontext
+import atexit
+import hmac
+import os
 import time
 
 app = Flask(__name__)
@@ -13,11 +19,56 @@ app = Flask(__name__)
 # --------------------------------------------------
 # Global instances (prototype-level)
 # --------------------------------------------------
-embedder = EmbeddingModel()
-episodic = EpisodicMemory()
-semantic = SemanticMemory()
-cache = SemanticCache()
-short_term = ShortTermMemory(k=3)
+# Components load in the background: the model once, the three indexes
+# in parallel (or a connection to index_service.py when
+# INDEX_SERVICE_SOCKET is set). Requests wait up to STARTUP_WAIT_SECONDS
+# for them and get a 503 otherwise.
+runtime = create_runtime().start()
+atexit.register(runtime.shutdown)
+
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", "5"))
+
+# When the LLM provider is down, answer from a looser cache match
+DEGRADED_CACHE_THRESHOLD = float(os.getenv("DEGRADED_CACHE_THRESHOLD", "0.75"))
+
+# Concurrent cache misses for the same query share one LLM call
+coalescer = create_single_flight()
+
+# Retrieval for drafts posted to /prefetch, reused by /chat
+prefetcher = create_prefetch_cache()
+PREFETCH_MIN_CHARS = int(os.getenv("PREFETCH_MIN_CHARS", "8"))
+
+# Bounded in-flight /chat work, per-user fair queue, load shedding
+admission = create_admission()
+
+
+def _not_ready():
+    return jsonify({
+        'error': 'Service is starting up',
+        'startup': runtime.report()
+    }), 503
+
+
+def _admit(key):
+    """
+    Admission slot for one request. The client may send its remaining
+    budget in X-Request-Timeout-Ms; queueing past it is pointless.
+    Malformed or non-positive values are ignored.
+    """
+    if admission is None:
+        return nullcontext(Ticket(NORMAL, slot=False))
+
+    timeout = client_timeout(request.headers.get('X-Request-Timeout-Ms'))
+    return admission.admit(key, timeout)
+
+
+def _shed(rejected):
+    response = jsonify({
+        'error': rejected.reason,
+        'retry_after': rejected.retry_after
+    })
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response, rejected.status
 
 
 # --------------------------------------------------
@@ -36,14 +87,42 @@ def chat():
     user_input = data.get('message', '').strip()
     memory_limit = int(data.get('memory_limit', 3))
     user_id = data.get('user_id', 'test_user_1')
+    session_id = data.get('session_id')
+    verbose = bool(data.get('verbose', False))
 
     if not user_input:
         return jsonify({'error': 'Empty message'}), 400
 
+    if not runtime.wait_ready(STARTUP_WAIT_SECONDS):
+        return _not_ready()
+
+    try:
+        with _admit(user_id) as ticket:
+            return _chat(user_id, user_input, memory_limit, session_id, verbose, ticket, start_time)
+    except Rejected as e:
+        return _shed(e)
+
+
+def _chat(user_id, user_input, memory_limit, session_id, verbose, ticket, start_time):
+    embedder = runtime.embedder
+    episodic, semantic, cache = runtime.episodic, runtime.semantic, runtime.cache
+    short_term = runtime.short_term
+
+    # --------------------------------------------------
+    # Prefetched draft (see /prefetch)
+    # --------------------------------------------------
+    prefetch_match, draft = (
+        prefetcher.take(session_id, user_id, user_input, memory_limit)
+        if prefetcher is not None else (None, None)
+    )
+
     # --------------------------------------------------
     # Embedding
     # --------------------------------------------------
-    query_embedding = embedder.encode(user_input)
+    if prefetch_match == "exact":
+        query_embedding = draft.embedding
+    else:
+        query_embedding = embedder.encode(user_input)
 
     # --------------------------------------------------
     # Semantic Cache Lookup (FAST PATH)
@@ -57,38 +136,122 @@ def chat():
         processing_time = time.time() - start_time
         short_term.add(user_input, cached_response)
 
-        return jsonify({
+        return _chat_response({
             "response": cached_response,
             "cache_hit": True,
             "episodic_hits": [],
             "semantic_hits": [],
             "processing_time": round(processing_time * 1000, 2),
             "memory_count": 0,
+            "prefetch": prefetch_match,
+            "mode": ticket.mode,
+            "queue_wait_ms": round(ticket.waited * 1000, 2),
             "context": {
                 "note": "Response served from semantic cache"
             },
             "timestamp": time.time()
-        })
+        }, verbose)
+
+    # Overloaded: only cache hits are served
+    if ticket.mode == CACHE_ONLY:
+        raise admission.shed_cache_miss()
+
+    # --------------------------------------------------
+    # Cache miss: retrieve, prompt, call the LLM, store.
+    # Concurrent identical queries share one run (single-flight).
+    # --------------------------------------------------
+    retrieved = draft.retrieved if prefetch_match else None
+
+    def answer_miss():
+        return _answer_miss(
+            user_id, user_input, query_embedding, memory_limit,
+            episodic, semantic, cache, short_term.load(),
+            retrieved=retrieved,
+            extract=ticket.mode != NO_EXTRACTION
+        )
+
+    coalesced = False
+    try:
+        if coalescer is None:
+            result = answer_miss()
+        else:
+            result, coalesced = coalescer.do(
+                coalescer.key(user_id, user_input, query_embedding),
+                answer_miss,
+                embedding=query_embedding
+            )
+    except LLMError as e:
+        # Provider degraded (timeouts, breaker open): fall back to the
+        # closest cached answer rather than failing the request.
+        fallback = cache.lookup(
+            query_embedding,
+            user_id=user_id,
+            similarity_threshold=DEGRADED_CACHE_THRESHOLD
+        )
+        if not fallback:
+            return jsonify({
+                'error': 'LLM provider unavailable',
+                'detail': str(e)
+            }), 503
+
+        short_term.add(user_input, fallback)
+        return _chat_response({
+            "response": fallback,
+            "cache_hit": True,
+            "degraded": True,
+            "episodic_hits": [],
+            "semantic_hits": [],
+            "processing_time": round((time.time() - start_time) * 1000, 2),
+            "memory_count": 0,
+            "context": {
+                "note": f"LLM unavailable ({e}); served closest cached response"
+            },
+            "timestamp": time.time()
+        }, verbose)
+
+    short_term.add(user_input, result["response"])
+
+    # --------------------------------------------------
+    # Response
+    # --------------------------------------------------
+    return _chat_response(dict(
+        result,
+        cache_hit=False,
+        coalesced=coalesced,
+        prefetch=prefetch_match,
+        mode=ticket.mode,
+        queue_wait_ms=round(ticket.waited * 1000, 2),
+        processing_time=round((time.time() - start_time) * 1000, 2),
+        timestamp=time.time()
+    ), verbose)
+
 
+def _chat_response(payload, verbose):
+    """
+    Debug context and score breakdowns only when the request asked
+    for them ("verbose": true, as the web UI does).
+    """
+    return json_response(payload if verbose else lean_result(payload))
+
+
+def _retrieve(user_id, user_input, query_embedding, memory_limit, episodic, semantic):
+    """
+    Episodic hits and type-aware semantic hits for one query.
+    """
     # --------------------------------------------------
     # Episodic Memory Retrieval
     # --------------------------------------------------
     episodic_hits = episodic.search(
         query_embedding,
-        k=min(memory_limit, 5)
+        k=min(memory_limit, 5),
+        user_id=user_id
     )
 
     # --------------------------------------------------
     # 🔑 HYBRID TYPE-AWARE SEMANTIC RETRIEVAL
     # --------------------------------------------------
-    persona_hits = semantic.search(
-        embedding=query_embedding,
-        query_text=user_input,
-        k=2,
-        mem_type="persona",
-        user_id=user_id,
-        similarity_threshold=0.10
-    )
+    # Whole (cached) profile: persona is relevant to every question
+    persona_hits = semantic.persona_profile(user_id)
 
     knowledge_hits = semantic.search(
         embedding=query_embedding,
@@ -108,10 +271,31 @@ def chat():
         similarity_threshold=0.30
     )
 
+    return episodic_hits, {
+        "persona": persona_hits,
+        "knowledge": knowledge_hits,
+        "process": process_hits
+    }
+
+
+def _answer_miss(
+    user_id,
+    user_input,
+    query_embedding,
+    memory_limit,
+    episodic,
+    semantic,
+    cache,
+    short_term_context,
+    retrieved=None,
+    extract=True
+):
     # --------------------------------------------------
-    # Short-term Memory
+    # Retrieval (or the prefetched result for this draft)
     # --------------------------------------------------
-    short_term_context = short_term.load()
+    episodic_hits, semantic_hits = retrieved or _retrieve(
+        user_id, user_input, query_embedding, memory_limit, episodic, semantic
+    )
 
     # --------------------------------------------------
     # Build Prompt + Context (TYPE-AWARE)
@@ -119,11 +303,7 @@ def chat():
     prompt, context_debug = build_prompt(
         user_input,
         episodic_hits,
-        {
-            "persona": persona_hits,
-            "knowledge": knowledge_hits,
-            "process": process_hits
-        },
+        semantic_hits,
         short_term_context
     )
 
@@ -131,10 +311,23 @@ def chat():
     # LLM Call
     # --------------------------------------------------
     response = call_llm(prompt)
-    processing_time = time.time() - start_time
 
     # --------------------------------------------------
-    # Store in Semantic Cache
+    # Semantic Memory Extraction (pre-filtered, batched per user)
+    # Submitted before cache.add so the pre-filter compares against
+    # earlier cached queries, not this one. Skipped under load.
+    # --------------------------------------------------
+    if extract:
+        runtime.extractor.submit(
+            user_id,
+            user_input,
+            response,
+            query_embedding=query_embedding
+        )
+
+    # --------------------------------------------------
+    # Store in Semantic Cache (still inside the single-flight, so
+    # requests arriving after the leader finishes hit the cache)
     # --------------------------------------------------
     cache.add(
         query_embedding,
@@ -146,57 +339,211 @@ def chat():
     # --------------------------------------------------
     # Update Memories
     # --------------------------------------------------
-    short_term.add(user_input, response)
-    episodic.add_episode(query_embedding, user_input, response)
+    episodic.add_episode(query_embedding, user_input, response, user_id=user_id)
 
-    # --------------------------------------------------
-    # Semantic Memory Extraction
-    # --------------------------------------------------
-    memory = extract_semantic_memory(
-        f"User: {user_input}\nAssistant: {response}"
-    )
+    return {
+        "response": response,
+        "episodic_hits": episodic_hits,
+        "semantic_hits": semantic_hits,
+        "memory_count": len(episodic_hits) + sum(len(hits) for hits in semantic_hits.values()),
+        "context": context_debug
+    }
+
+
+@app.route('/prefetch', methods=['POST'])
+def prefetch():
+    """
+    Warm retrieval for a draft while the user types. Never waits: when
+    the app is still loading or the draft is short it does nothing.
+    """
+    start_time = time.time()
 
-    if memory:
-        semantic_embedding = embedder.encode(memory["content"])
-        semantic.add_memory(
-            semantic_embedding,
-            memory["content"],
-            mem_type=memory["type"],
-            user_id=user_id
+    data = request.get_json() or {}
+    draft = data.get('message', '').strip()
+    memory_limit = int(data.get('memory_limit', 3))
+    user_id = data.get('user_id', 'test_user_1')
+    session_id = data.get('session_id')
+
+    if prefetcher is None or not session_id or len(draft) < PREFETCH_MIN_CHARS or not runtime.ready:
+        return jsonify({"prefetched": False})
+
+    # Speculative work is the first thing to go when /chat is queueing
+    if admission is not None and admission.busy():
+        return jsonify({"prefetched": False, "shed": True})
+
+    if not prefetcher.current(session_id, user_id, draft, memory_limit):
+        embedding = runtime.embedder.encode(draft)
+
+        # A cache hit makes retrieval unnecessary; /chat re-runs the
+        # (cheap) lookup so hit counts stay exact
+        cached = runtime.cache.lookup(embedding, user_id=user_id, count_hits=False)
+        retrieved = None if cached else _retrieve(
+            user_id, draft, embedding, memory_limit, runtime.episodic, runtime.semantic
         )
+        prefetcher.put(session_id, user_id, draft, embedding, retrieved, memory_limit)
 
-    # --------------------------------------------------
-    # Response
-    # --------------------------------------------------
     return jsonify({
-        "response": response,
-        "cache_hit": False,
-        "episodic_hits": episodic_hits,
-        "semantic_hits": {
-            "persona": persona_hits,
-            "knowledge": knowledge_hits,
-            "process": process_hits
-        },
-        "processing_time": round(processing_time * 1000, 2),
-        "memory_count": (
-            len(episodic_hits)
-            + len(persona_hits)
-            + len(knowledge_hits)
-            + len(process_hits)
-        ),
-        "context": context_debug,
+        "prefetched": True,
+        "processing_time": round((time.time() - start_time) * 1000, 2)
+    })
+
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch_route():
+    start_time = time.time()
+
+    data = request.get_json() or {}
+    items = data.get('items', [])
+    memory_limit = int(data.get('memory_limit', 3))
+    max_concurrency = int(data.get('max_concurrency', 4))
+    verbose = bool(data.get('verbose', False))
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Empty batch'}), 400
+
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({
+            'error': f'Batch too large (max {MAX_BATCH_SIZE} items)'
+        }), 400
+
+    if not runtime.wait_ready(STARTUP_WAIT_SECONDS):
+        return _not_ready()
+
+    # A batch takes one slot in the shared "batch" queue; it has no
+    # cache-only form, so it is shed instead
+    try:
+        with _admit("__batch__") as ticket:
+            if ticket.mode == CACHE_ONLY:
+                raise admission.shed_cache_miss()
+
+            results = chat_batch(
+                items,
+                runtime.embedder,
+                runtime.episodic,
+                runtime.semantic,
+                runtime.cache,
+                extractor=runtime.extractor,
+                memory_limit=memory_limit,
+                max_concurrency=max_concurrency,
+                extract_memories=(
+                    bool(data.get('extract_memories', True)) and ticket.mode != NO_EXTRACTION
+                )
+            )
+    except Rejected as e:
+        return _shed(e)
+
+    if not verbose:
+        results = [lean_result(r) for r in results]
+
+    return json_response({
+        "results": results,
+        "count": len(results),
+        "processing_time": round((time.time() - start_time) * 1000, 2),
         "timestamp": time.time()
     })
 
 
 @app.route('/stats', methods=['GET'])
 def get_stats():
+    if not runtime.ready:
+        return _not_ready()
+
     return jsonify({
-        "episodic_memory_count": episodic.index.get_current_count(),
-        "semantic_memory_count": semantic.index.get_current_count()
+        "episodic_memory_count": runtime.episodic.count(),
+        "semantic_memory_count": runtime.semantic.count(),
+        "extraction": runtime.extractor.stats(),
+        "llm": get_llm_client().stats(),
+        "coalescing": coalescer.stats() if coalescer else None,
+        "prefetch": prefetcher.stats() if prefetcher else None,
+        "admission": admission.stats() if admission else None,
+        "index_sync": runtime.index_sync.stats() if runtime.index_sync else None
+    })
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe: 200 once every component has loaded, 503 before.
+    """
+    if runtime.ready:
+        return jsonify({"ready": True})
+    return jsonify({"ready": False, "errors": runtime.report()["errors"]}), 503
+
+
+@app.route('/startup', methods=['GET'])
+def startup_report():
+    """
+    Startup-time breakdown (ms per component, total, errors).
+    """
+    return jsonify(runtime.report())
+
+
+# --------------------------------------------------
+# Admin: per-user export / import / delete for moving
+# users between shards (rebalance.py). Bodies are
+# MongoDB extended JSON so datetimes survive the trip.
+# --------------------------------------------------
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def _admin_call(handler):
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints disabled (set ADMIN_TOKEN)'}), 403
+    # Constant-time: these endpoints export and delete whole users
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Bad admin token'}), 403
+    if not runtime.wait_ready(STARTUP_WAIT_SECONDS):
+        return _not_ready()
+
+    # Imported on first use: serving /chat needs none of the rebalance
+    # (or routing) code
+    from bson import json_util
+    from db import db
+    import rebalance
+
+    body = json_util.loads(request.get_data() or b'{}')
+    stores = {"episodic": runtime.episodic, "semantic": runtime.semantic, "cache": runtime.cache}
+    return Response(
+        json_util.dumps(handler(rebalance, db, body, stores)),
+        mimetype='application/json'
+    )
+
+
+@app.route('/admin/users', methods=['POST'])
+def admin_users():
+    return _admin_call(lambda rebalance, db, body, stores: {
+        "users": rebalance.list_users(db, body.get('user_id'))
+    })
+
+
+@app.route('/admin/export_user', methods=['POST'])
+def admin_export_user():
+    return _admin_call(lambda rebalance, db, body, stores: rebalance.export_user(
+        db, body['user_id'], body.get('after')
+    ))
+
+
+@app.route('/admin/import_user', methods=['POST'])
+def admin_import_user():
+    return _admin_call(lambda rebalance, db, body, stores: {
+        "imported": rebalance.import_user(db, stores, body)
+    })
+
+
+@app.route('/admin/delete_user', methods=['POST'])
+def admin_delete_user():
+    return _admin_call(lambda rebalance, db, body, stores: {
+        "deleted": rebalance.delete_user(db, stores, body['user_id'])
     })
 
 
 if __name__ == '__main__':
     print("🚀 Starting NeuroMind AI Flask app (Hybrid Memory Enabled)...")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # The debugger's reloader and single-request tracebacks are for local
+    # work only; threaded so admission control has requests to queue
+    app.run(
+        debug=os.getenv("FLASK_DEBUG") == "1",
+        threaded=True,
+        host='0.0.0.0',
+        port=int(os.getenv("PORT", "5000"))
+    )
@@ -0,0 +1,250 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+from prompt import build_prompt
+from llm import call_llm
+from extraction import ExtractionPipeline
+
+
+# --------------------------------------------------
+# Type-aware semantic retrieval plan (same as /chat)
+# mem_type -> (k, similarity_threshold)
+# Persona comes from the cached per-user profile instead.
+# --------------------------------------------------
+SEMANTIC_PLAN = {
+    "knowledge": (3, 0.30),
+    "process": (2, 0.30)
+}
+
+MAX_BATCH_SIZE = 256
+
+
+def _normalize_items(items, default_user_id):
+    """
+    Accepts (user_id, message) pairs or {"user_id", "message"} dicts.
+    """
+    normalized = []
+    for item in items:
+        if isinstance(item, dict):
+            user_id = item.get("user_id") or default_user_id
+            message = item.get("message", "")
+        else:
+            user_id, message = item
+        normalized.append((user_id, (message or "").strip()))
+    return normalized
+
+
+def chat_batch(
+    items,
+    embedder,
+    episodic,
+    semantic,
+    cache,
+    memory_limit=3,
+    max_concurrency=4,
+    extract_memories=True,
+    extractor=None,
+    default_user_id="test_user_1"
+):
+    """
+    In-process batch version of /chat.
+
+    - one encode() call for every message
+    - one multi-row knn_query per store (cache, episodic, semantic x type)
+    - one Mongo fetch per store to resolve metadata
+    - LLM calls fanned out with at most `max_concurrency` in flight
+    - semantic extraction through `extractor` (pre-filtered, batched)
+
+    Short-term memory is session state, so it is not used here.
+    Returns one result dict per input item, in input order.
+    """
+    start_time = time.time()
+    pairs = _normalize_items(items, default_user_id)
+
+    results = [None] * len(pairs)
+    for i, (_, message) in enumerate(pairs):
+        if not message:
+            results[i] = {"error": "Empty message"}
+
+    # --------------------------------------------------
+    # Deduplicate identical (user, message) rows
+    # --------------------------------------------------
+    unique_keys = []
+    key_rows = {}
+    for i, key in enumerate(pairs):
+        if results[i] is not None:
+            continue
+        if key not in key_rows:
+            key_rows[key] = []
+            unique_keys.append(key)
+        key_rows[key].append(i)
+
+    if not unique_keys:
+        return results
+
+    user_ids = [user_id for user_id, _ in unique_keys]
+    messages = [message for _, message in unique_keys]
+
+    # --------------------------------------------------
+    # Embedding (single batch)
+    # --------------------------------------------------
+    embeddings = embedder.encode_batch(messages)
+
+    # --------------------------------------------------
+    # Semantic Cache Lookup (FAST PATH)
+    # --------------------------------------------------
+    cached = cache.lookup_batch(embeddings, user_ids)
+
+    unique_results = [None] * len(unique_keys)
+    for u, response in enumerate(cached):
+        if response:
+            unique_results[u] = {
+                "response": response,
+                "cache_hit": True,
+                "episodic_hits": [],
+                "semantic_hits": [],
+                "memory_count": 0
+            }
+
+    misses = [u for u, r in enumerate(unique_results) if r is None]
+
+    if misses:
+        miss_embeddings = embeddings[misses]
+        miss_texts = [messages[u] for u in misses]
+        miss_users = [user_ids[u] for u in misses]
+
+        # --------------------------------------------------
+        # Retrieval (multi-row queries)
+        # --------------------------------------------------
+        episodic_hits = episodic.search_batch(
+            miss_embeddings,
+            k=min(memory_limit, 5),
+            user_ids=miss_users
+        )
+
+        semantic_hits = {
+            mem_type: semantic.search_batch(
+                miss_embeddings,
+                miss_texts,
+                k=k,
+                mem_type=mem_type,
+                user_ids=miss_users,
+                similarity_threshold=threshold
+            )
+            for mem_type, (k, threshold) in SEMANTIC_PLAN.items()
+        }
+        semantic_hits["persona"] = semantic.persona_profiles(miss_users)
+
+        prompts = []
+        for row, u in enumerate(misses):
+            blocks = {
+                mem_type: hits[row]
+                for mem_type, hits in semantic_hits.items()
+            }
+            prompt, _ = build_prompt(
+                messages[u],
+                episodic_hits[row],
+                blocks,
+                []
+            )
+            prompts.append(prompt)
+
+        # --------------------------------------------------
+        # LLM Calls (bounded concurrency, ordered results)
+        # --------------------------------------------------
+        def _safe_call(fn, arg):
+            try:
+                return fn(arg), None
+            except Exception as e:
+                return None, str(e)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            responses = list(pool.map(
+                lambda p: _safe_call(call_llm, p),
+                prompts
+            ))
+
+        # --------------------------------------------------
+        # Update Memories (one batched write per store)
+        # --------------------------------------------------
+        written = []
+
+        for row, u in enumerate(misses):
+            response, error = responses[row]
+            if error:
+                unique_results[u] = {"error": error}
+                continue
+
+            written.append((u, response))
+
+            hits = {
+                mem_type: semantic_hits[mem_type][row]
+                for mem_type in ("persona", *SEMANTIC_PLAN)
+            }
+            unique_results[u] = {
+                "response": response,
+                "cache_hit": False,
+                "episodic_hits": episodic_hits[row],
+                "semantic_hits": hits,
+                "memory_count": (
+                    len(episodic_hits[row])
+                    + sum(len(h) for h in hits.values())
+                )
+            }
+
+        # --------------------------------------------------
+        # Semantic Memory Extraction (pre-filtered, batched per user)
+        # Submitted before cache.add_batch so the pre-filter compares
+        # against earlier cached queries, not these.
+        # --------------------------------------------------
+        if extract_memories and written:
+            owns_extractor = extractor is None
+            if owns_extractor:
+                extractor = ExtractionPipeline(
+                    semantic,
+                    embedder,
+                    cache=cache,
+                    background=False
+                )
+
+            for u, response in written:
+                extractor.submit(
+                    user_ids[u],
+                    messages[u],
+                    response,
+                    query_embedding=embeddings[u]
+                )
+
+        if written:
+            written_rows = [u for u, _ in written]
+            written_responses = [response for _, response in written]
+
+            cache.add_batch(
+                embeddings[written_rows],
+                [user_ids[u] for u in written_rows],
+                [messages[u] for u in written_rows],
+                written_responses
+            )
+            episodic.add_episodes(
+                embeddings[written_rows],
+                [messages[u] for u in written_rows],
+                written_responses,
+                [user_ids[u] for u in written_rows]
+            )
+
+        # A batch-local pipeline is extracted now. The shared one keeps
+        # batching per user (full buffers, stale sweep) like /chat turns.
+        if extract_memories and written and owns_extractor:
+            extractor.flush(wait=True)
+
+    # --------------------------------------------------
+    # Fan results back out to the original rows
+    # --------------------------------------------------
+    for u, key in enumerate(unique_keys):
+        for i in key_rows[key]:
+            results[i] = dict(unique_results[u])
+
+    elapsed = round((time.time() - start_time) * 1000, 2)
+    print(f"📦 Batch of {len(pairs)} served in {elapsed} ms "
+          f"({len(unique_keys) - len(misses)} cache hits)")
+
+    return results
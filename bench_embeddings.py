@@ -0,0 +1,87 @@
+import argparse
+import statistics
+import time
+from embeddings import EmbeddingModel, OnnxEmbeddingModel, compare_embeddings
+from export_onnx import VERIFY_TEXTS
+
+
+# --------------------------------------------------
+# Embedding backend benchmark
+# --------------------------------------------------
+#   python bench_embeddings.py --threads 4
+#
+# Single-query latency is what the /chat cache-hit path pays;
+# batch throughput is what /chat/batch and rebuilds pay.
+# --------------------------------------------------
+
+QUERIES = [
+    "What is a semantic cache in AI systems?",
+    "How does caching improve system performance?",
+    "Summarize my chatbot workflow.",
+    "Do you remember my name and how I prefer explanations?",
+    "What are the limitations of fixed context windows in LLMs?"
+]
+
+
+def bench_latency(model, repeats):
+    for q in QUERIES:  # warm-up
+        model.encode(q)
+
+    samples = []
+    for _ in range(repeats):
+        for q in QUERIES:
+            t0 = time.perf_counter()
+            model.encode(q)
+            samples.append((time.perf_counter() - t0) * 1000)
+
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 2)
+    }
+
+
+def bench_throughput(model, batch_size, n_texts):
+    texts = (QUERIES * (n_texts // len(QUERIES) + 1))[:n_texts]
+    model.encode_batch(texts[:batch_size], batch_size=batch_size)
+
+    t0 = time.perf_counter()
+    model.encode_batch(texts, batch_size=batch_size)
+    elapsed = time.perf_counter() - t0
+    return {"texts_per_s": round(n_texts / elapsed, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=40)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--n-texts", type=int, default=1024)
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    reference = EmbeddingModel()
+    backends = {"torch": reference}
+
+    for name, quantized in (("onnx", False), ("onnx-int8", True)):
+        try:
+            backends[name] = OnnxEmbeddingModel(
+                quantized=quantized,
+                num_threads=args.threads
+            )
+        except (ImportError, FileNotFoundError) as e:
+            print(f"⚠️ Skipping {name}: {e}")
+
+    print(f"{'backend':<10} {'p50 ms':>8} {'p95 ms':>8} {'texts/s':>10} {'min cos':>9}")
+    for name, model in backends.items():
+        latency = bench_latency(model, args.repeats)
+        throughput = bench_throughput(model, args.batch_size, args.n_texts)
+        agreement = compare_embeddings(reference, model, VERIFY_TEXTS)
+
+        print(
+            f"{name:<10} {latency['p50_ms']:>8} {latency['p95_ms']:>8} "
+            f"{throughput['texts_per_s']:>10} {agreement['min_cosine']:>9.5f}"
+        )
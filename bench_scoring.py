@@ -0,0 +1,111 @@
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from scoring import SEMANTIC_SCORING, ScoreTable, top_k, vector_scores
+
+
+# --------------------------------------------------
+# Memory scoring micro-benchmark
+# --------------------------------------------------
+#   python bench_scoring.py --candidates 4000 --k 10 100 1000
+#
+# Compares the old per-document Python loop (datetime math, one dict
+# per candidate, full sort) with the vectorized ScoreTable path on
+# synthetic semantic-memory candidates. No Mongo / HNSW needed.
+# --------------------------------------------------
+
+
+def make_candidates(n, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    docs = [
+        {
+            "embedding_id": i,
+            "content": f"memory {i}",
+            "user_id": "u1",
+            "support_count": int(rng.integers(1, 8)),
+            "last_seen": now - timedelta(days=float(rng.uniform(0, 60)))
+        }
+        for i in range(n)
+    ]
+    labels = np.stack([rng.permutation(n) for _ in range(rows)]).astype(np.uint64)
+    distances = rng.uniform(0.0, 0.7, size=labels.shape).astype(np.float32)
+    return docs, labels, distances, now
+
+
+def loop_scoring(docs, labels, distances, now, k, threshold=0.35, max_age_days=60):
+    by_id = {d["embedding_id"]: d for d in docs}
+    w = SEMANTIC_SCORING
+    out = []
+
+    for row_labels, row_dists in zip(labels, distances):
+        results = []
+        for idx, dist in zip(row_labels, row_dists):
+            similarity = 1 - dist
+            if similarity < threshold:
+                continue
+            doc = by_id.get(int(idx))
+            age_days = (now - doc["last_seen"]).days
+            if age_days > max_age_days:
+                continue
+            score = (
+                similarity
+                - min(age_days * w["recency_per_day"], w["recency_cap"])
+                + min(doc["support_count"] * w["support_per_count"], w["support_cap"])
+            )
+            results.append({"id": doc["embedding_id"], "score": float(score)})
+        results.sort(key=lambda x: x["score"], reverse=True)
+        out.append([r["id"] for r in results[:k]])
+    return out
+
+
+def vector_scoring(docs, labels, distances, now, k, threshold=0.35, max_age_days=60):
+    similarity = 1 - distances
+    table = ScoreTable(docs, "embedding_id", "last_seen", "support_count", now=now)
+    positions, found = table.lookup(labels)
+    age_days = table.age_days[positions]
+
+    scores = vector_scores(similarity, age_days, table.support[positions], SEMANTIC_SCORING)
+    keep = found & (similarity >= threshold) & (age_days <= max_age_days)
+
+    return [
+        [table.docs[positions[row, col]]["embedding_id"] for col in top_k(scores[row], k, keep[row])]
+        for row in range(len(labels))
+    ]
+
+
+def timed(fn, repeats, *args):
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 2), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark memory scoring")
+    parser.add_argument("--candidates", type=int, default=4000)
+    parser.add_argument("--rows", type=int, default=4)
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    docs, labels, distances, now = make_candidates(args.candidates, args.rows)
+
+    print(f"{'k':>6} {'loop ms':>10} {'numpy ms':>10} {'speedup':>8} {'overlap':>8}")
+    for k in args.k:
+        loop_ms, expected = timed(loop_scoring, args.repeats, docs, labels, distances, now, k)
+        vec_ms, actual = timed(vector_scoring, args.repeats, docs, labels, distances, now, k)
+
+        # float32 vs float64 can swap exact ties; report set overlap
+        overlap = statistics.mean(
+            len(set(a) & set(e)) / max(len(e), 1)
+            for a, e in zip(actual, expected)
+        )
+        print(
+            f"{k:>6} {loop_ms:>10} {vec_ms:>10} "
+            f"{loop_ms / max(vec_ms, 1e-6):>7.1f}x {overlap:>8.3f}"
+        )
@@ -0,0 +1,123 @@
+import argparse
+import gzip
+import statistics
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+from flask import Flask, jsonify
+from prompt import build_prompt
+from serialization import GZIP_LEVEL, JSON_BACKEND, dumps, lean_result
+
+
+# --------------------------------------------------
+# /chat response serialization benchmark
+# --------------------------------------------------
+#   python bench_serialization.py --episodes 5 --answer-words 400
+#
+# Builds a realistic cache-miss /chat payload (episodic + typed semantic
+# hits, short-term turns, build_prompt's debug context) and compares:
+#   before   verbose payload through Flask's jsonify
+#   after    lean payload through serialization.dumps (+ gzip)
+# No Mongo / HNSW / LLM needed.
+# --------------------------------------------------
+
+Message = namedtuple("Message", "type content")
+
+
+def make_words(rng, n):
+    vocab = ["memory", "vector", "index", "python", "query", "latency", "cache",
+             "user", "prefers", "shard", "episode", "summary", "token", "budget"]
+    return " ".join(rng.choice(vocab, size=n))
+
+
+def make_payload(episodes, answer_words, facts, seed=0):
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+
+    episodic_hits = [
+        {
+            "user": make_words(rng, 15),
+            "assistant": make_words(rng, answer_words),
+            "summary": make_words(rng, 30),
+            "timestamp": (now - timedelta(days=i)).isoformat(),
+            "similarity": round(float(rng.uniform(0.4, 0.9)), 3),
+            "score": round(float(rng.uniform(0.3, 0.9)), 3)
+        }
+        for i in range(episodes)
+    ]
+    semantic_hits = {
+        mem_type: [
+            {
+                "type": mem_type,
+                "content": make_words(rng, 20),
+                "support_count": int(rng.integers(1, 6)),
+                "confidence": 0.7,
+                "score": round(float(rng.uniform(0.3, 0.9)), 3),
+                "vector_score": round(float(rng.uniform(0.3, 0.9)), 3),
+                "bm25_score": round(float(rng.uniform(0, 5)), 3),
+                "last_seen": now.isoformat()
+            }
+            for _ in range(facts)
+        ]
+        for mem_type in ("persona", "knowledge", "process")
+    }
+    short_term = [
+        Message("human" if i % 2 == 0 else "ai", make_words(rng, answer_words // 4))
+        for i in range(6)
+    ]
+
+    question = make_words(rng, 12)
+    _, context = build_prompt(question, episodic_hits, semantic_hits, short_term)
+
+    return {
+        "response": make_words(rng, answer_words),
+        "episodic_hits": episodic_hits,
+        "semantic_hits": semantic_hits,
+        "memory_count": episodes + 3 * facts,
+        "context": context,
+        "cache_hit": False,
+        "coalesced": False,
+        "prefetch": None,
+        "processing_time": 1234.5,
+        "timestamp": time.time()
+    }
+
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 3), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /chat response serialization")
+    parser.add_argument("--episodes", type=int, default=5)
+    parser.add_argument("--answer-words", type=int, default=400)
+    parser.add_argument("--facts", type=int, default=3, help="semantic hits per type")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    payload = make_payload(args.episodes, args.answer_words, args.facts)
+    app = Flask(__name__)
+
+    with app.app_context():
+        cases = [
+            ("before: verbose + jsonify", lambda: jsonify(payload).get_data()),
+            (f"verbose + {JSON_BACKEND}", lambda: dumps(payload)),
+            (f"after: lean + {JSON_BACKEND}", lambda: dumps(lean_result(payload))),
+            (
+                f"after: lean + {JSON_BACKEND} + gzip",
+                lambda: gzip.compress(dumps(lean_result(payload)), compresslevel=GZIP_LEVEL)
+            )
+        ]
+
+        print(f"{'case':<34} {'bytes':>9} {'ms':>8}")
+        for name, fn in cases:
+            ms, body = timed(fn, args.repeats)
+            print(f"{name:<34} {len(body):>9} {ms:>8}")
+
+    print(f"\n(answer is {len(payload['response'].encode())} bytes)")
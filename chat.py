@@ -1,10 +1,6 @@
-from embeddings import EmbeddingModel
-from episodic_memory import EpisodicMemory
-from semantic_memory import SemanticMemory
-from semantic_cache import SemanticCache
 from prompt import build_prompt
-from llm import call_llm, extract_semantic_memory
-from short_term_memory import ShortTermMemory
+from llm import call_llm
+from runtime import create_runtime
 import time
 
 
@@ -12,13 +8,18 @@ def main():
     print("\n🧠 Episodic + Semantic Memory Chatbot (CLI)\n")
 
     # --------------------------------------------------
-    # Global Components (same as app.py)
+    # Global Components (same loader as app.py)
     # --------------------------------------------------
-    embedder = EmbeddingModel()
-    episodic = EpisodicMemory()
-    semantic = SemanticMemory()
-    cache = SemanticCache()
-    short_term = ShortTermMemory(k=3)
+    runtime = create_runtime(background_extraction=False).start(background=False)
+    if not runtime.ready:
+        print("❌ Startup failed:", runtime.errors)
+        return
+
+    embedder = runtime.embedder
+    episodic = runtime.episodic
+    semantic = runtime.semantic
+    cache = runtime.cache
+    short_term = runtime.short_term
 
     user_id = "default_user"
 
@@ -52,18 +53,12 @@ def main():
         # --------------------------------------------------
         # 3️⃣ Episodic Memory Retrieval
         # --------------------------------------------------
-        episodic_hits = episodic.search(query_embedding, k=3)
+        episodic_hits = episodic.search(query_embedding, k=3, user_id=user_id)
 
         # --------------------------------------------------
         # 4️⃣ Type-Aware Semantic Retrieval
         # --------------------------------------------------
-        persona_hits = semantic.search(
-            query_embedding,
-            k=2,
-            mem_type="persona",
-            user_id=user_id,
-            similarity_threshold=0.30
-        )
+        persona_hits = semantic.persona_profile(user_id)
 
         knowledge_hits = semantic.search(
             query_embedding,
@@ -110,7 +105,23 @@ def main():
         print(f"⏱️ {latency} ms\n")
 
         # --------------------------------------------------
-        # 8️⃣ Store in Semantic Cache
+        # 8️⃣ Extract & Store Semantic Memory (batched per user)
+        # (before cache.add so the pre-filter ignores this query)
+        # --------------------------------------------------
+        status = runtime.extractor.submit(
+            user_id,
+            user_input,
+            response,
+            query_embedding=query_embedding
+        )
+
+        if status == "flushed":
+            print("🧠 Extracted semantic memories for buffered turns")
+        elif status.startswith("skipped"):
+            print("⚠️ Extraction skipped:", status.split(":", 1)[1])
+
+        # --------------------------------------------------
+        # 9️⃣ Store in Semantic Cache
         # --------------------------------------------------
         cache.add(
             query_embedding,
@@ -120,29 +131,12 @@ def main():
         )
 
         # --------------------------------------------------
-        # 9️⃣ Update Memories
+        # 🔟 Update Memories
         # --------------------------------------------------
         short_term.add(user_input, response)
-        episodic.add_episode(query_embedding, user_input, response)
-
-        # --------------------------------------------------
-        # 🔟 Extract & Store Semantic Memory
-        # --------------------------------------------------
-        extracted = extract_semantic_memory(
-            f"User: {user_input}\nAssistant: {response}"
-        )
+        episodic.add_episode(query_embedding, user_input, response, user_id=user_id)
 
-        if extracted:
-            semantic_embedding = embedder.encode(extracted["content"])
-            semantic.add_memory(
-                semantic_embedding,
-                extracted["content"],
-                mem_type=extracted["type"],
-                user_id=user_id
-            )
-            print("🧠 Stored semantic memory:", extracted["type"])
-        else:
-            print("⚠️ No semantic memory extracted")
+    runtime.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+import numpy as np
+
+
+# --------------------------------------------------
+# Single-flight request coalescing
+# --------------------------------------------------
+# A burst of identical questions all miss the semantic cache (it is only
+# filled once the LLM answers), so each would pay for its own LLM call.
+# The first request for a key becomes the leader; concurrent requests
+# with the same key wait for the leader's result instead.
+#
+# Keys are scoped per user: prompts carry that user's persona and
+# memories, so an answer is never shared across users.
+# --------------------------------------------------
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_query(text):
+    text = _PUNCT_RE.sub(" ", (text or "").lower())
+    return " ".join(text.split())
+
+
+class EmbeddingBucketer:
+    """
+    Random-hyperplane LSH: near-identical embeddings share a bucket
+    with high probability. Fixed seed so every worker agrees.
+    """
+
+    def __init__(self, dim=384, bits=12, seed=0):
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((bits, dim)).astype(np.float32)
+        self.weights = 1 << np.arange(bits, dtype=np.int64)
+
+    def bucket(self, embedding):
+        signs = self.planes @ np.asarray(embedding, dtype=np.float32) > 0
+        return int(signs @ self.weights)
+
+
+class _Call:
+    def __init__(self, embedding):
+        self.done = threading.Event()
+        self.embedding = embedding
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, bucketer=None, min_similarity=0.95, wait_timeout=None):
+        self.bucketer = bucketer
+        self.min_similarity = min_similarity
+        self.wait_timeout = wait_timeout
+
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.metrics = {
+            "leaders": 0,
+            "followers": 0,
+            "neighbour_mismatches": 0,
+            "wait_timeouts": 0
+        }
+
+    def key(self, user_id, text, embedding=None):
+        if self.bucketer is not None and embedding is not None:
+            return (user_id, "lsh", self.bucketer.bucket(embedding))
+        return (user_id, "q", normalize_query(text))
+
+    def do(self, key, fn, embedding=None):
+        """
+        Runs fn() once per key at a time.
+        Returns (result, shared); shared is True for followers.
+        Errors raised by the leader are re-raised in every follower.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call(embedding)
+                self.metrics["leaders"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self.lock:
+                    self.calls.pop(key, None)
+                call.done.set()
+            return call.result, False
+
+        # LSH buckets can collide: only share near-identical queries
+        if not self._close_enough(embedding, call.embedding):
+            self._count("neighbour_mismatches")
+            return fn(), False
+
+        if not call.done.wait(self.wait_timeout):
+            self._count("wait_timeouts")
+            return fn(), False
+
+        self._count("followers")
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def _close_enough(self, a, b):
+        if self.bucketer is None or a is None or b is None:
+            return True
+        a = np.asarray(a, dtype=np.float32)
+        b = np.asarray(b, dtype=np.float32)
+        denom = float(np.linalg.norm(a) * np.linalg.norm(b)) or 1.0
+        return float(a @ b) / denom >= self.min_similarity
+
+    def _count(self, key):
+        with self.lock:
+            self.metrics[key] += 1
+
+    def stats(self):
+        with self.lock:
+            m = dict(self.metrics)
+            m["in_flight"] = len(self.calls)
+
+        total = m["leaders"] + m["followers"]
+        m["coalesced_rate"] = round(m["followers"] / total, 3) if total else 0.0
+        return m
+
+
+def create_single_flight():
+    """
+    COALESCE_MODE: "query" (normalized text, default), "embedding"
+    (LSH bucket + similarity check) or "off".
+    """
+    mode = os.getenv("COALESCE_MODE", "query")
+    if mode == "off":
+        return None
+
+    bucketer = EmbeddingBucketer() if mode == "embedding" else None
+    return SingleFlight(
+        bucketer=bucketer,
+        min_similarity=float(os.getenv("COALESCE_MIN_SIMILARITY", "0.95"))
+    )
@@ -0,0 +1,286 @@
+import argparse
+import gzip
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from pymongo import MongoClient
+from db import DATA_DIR, MONGO_DB, MONGO_URI
+from episodic_memory import segment_range
+
+
+# --------------------------------------------------
+# Retention, archival and index compaction
+# --------------------------------------------------
+# Expired entries are appended to gzip JSONL files under data/archive/,
+# marked deleted in HNSW (searches stop seeing them at once), then
+# deleted from Mongo. Indexes with too many deleted slots are rebuilt
+# from their stored vectors. Whole episodic segments past retention are
+# archived and their files removed.
+#
+#   python compaction.py --dry-run
+#   python compaction.py --every 24                      # scheduled
+#   python compaction.py --socket /tmp/neuromind-index.sock
+#
+# In single-process mode set COMPACTION_INTERVAL_HOURS and the app runs
+# the same job on its own stores.
+# --------------------------------------------------
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(DATA_DIR, "archive"))
+
+RETENTION = {
+    # episodes older than this are archived
+    "episodic_days": int(os.getenv("EPISODIC_RETENTION_DAYS", "90")),
+    # semantic memories not seen for this long; matches the max_age_days
+    # cutoff search applies, so nothing search still returns is dropped
+    "semantic_days": int(os.getenv("SEMANTIC_RETENTION_DAYS", "60")),
+    # opt-in: also drop memories below this confidence once idle for
+    # SEMANTIC_LOW_CONFIDENCE_DAYS. Off (0) by default: new memories
+    # start at 0.6 and search does not filter on confidence.
+    "semantic_min_confidence": float(os.getenv("SEMANTIC_MIN_CONFIDENCE", "0")),
+    "semantic_low_confidence_days": int(os.getenv("SEMANTIC_LOW_CONFIDENCE_DAYS", "14")),
+    # cache entries not hit for this long
+    "cache_days": int(os.getenv("CACHE_RETENTION_DAYS", "30"))
+}
+
+# Rebuild an index once this share of its slots is deleted
+REBUILD_FRAGMENTATION = 0.2
+
+CHUNK_SIZE = 1000
+PROBE_QUERIES = 20
+
+
+def archive_docs(docs, store, archive_dir=ARCHIVE_DIR):
+    """
+    Append docs to <archive_dir>/<store>-YYYY-MM-DD.jsonl.gz
+    (one gzip member per call; readers see one JSON doc per line).
+    """
+    if not docs:
+        return None
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(
+        archive_dir,
+        f"{store}-{datetime.utcnow():%Y-%m-%d}.jsonl.gz"
+    )
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, default=str) + "\n")
+    return path
+
+
+class Compactor:
+    def __init__(
+        self,
+        episodic,
+        semantic,
+        cache,
+        db=None,
+        retention=None,
+        archive_dir=ARCHIVE_DIR,
+        dim=384
+    ):
+        # Stores may be local or index-service proxies; Mongo is
+        # read directly.
+        self.stores = {"episodic": episodic, "semantic": semantic, "cache": cache}
+        self.db = db if db is not None else MongoClient(MONGO_URI)[MONGO_DB]
+        self.retention = dict(RETENTION, **(retention or {}))
+        self.archive_dir = archive_dir
+
+        rng = np.random.default_rng(0)
+        probes = rng.standard_normal((PROBE_QUERIES, dim)).astype(np.float32)
+        self.probes = probes / np.linalg.norm(probes, axis=1, keepdims=True)
+
+    # --------------------------------------------------
+    # Run
+    # --------------------------------------------------
+    def run(self, dry_run=False):
+        started = time.perf_counter()
+        before = {name: store.index_stats() for name, store in self.stores.items()}
+        latency_before = self.probe_latency()
+
+        if not dry_run:
+            # Buffered reinforcements / hits refresh last_seen and
+            # last_used: write them first
+            self.stores["semantic"].flush_support()
+            self.stores["cache"].flush_hits()
+
+        expired = {
+            "episodic": self._expire_episodic(dry_run),
+            "semantic": self._expire_semantic(dry_run),
+            "cache": self._expire_cache(dry_run)
+        }
+
+        if not dry_run:
+            for store in self.stores.values():
+                store.compact_index(REBUILD_FRAGMENTATION)
+
+        after = {name: store.index_stats() for name, store in self.stores.items()}
+        latency_after = self.probe_latency()
+
+        return {
+            "dry_run": dry_run,
+            "expired": expired,
+            "index": {name: {"before": before[name], "after": after[name]} for name in before},
+            "reclaimed_ram_bytes": {
+                name: before[name]["ram_bytes"] - after[name]["ram_bytes"]
+                for name in before
+            },
+            "latency_p50_ms": {
+                name: {"before": latency_before[name], "after": latency_after[name]}
+                for name in latency_before
+            },
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    # --------------------------------------------------
+    # Expiry per store
+    # --------------------------------------------------
+    def _expire(self, name, collection, query, id_field, dry_run):
+        if dry_run:
+            return collection.count_documents(query)
+
+        # Re-query each round: archived docs are deleted, so the next
+        # chunk is whatever still matches.
+        expired = 0
+        while True:
+            chunk = list(collection.find(query).limit(CHUNK_SIZE))
+            if not chunk:
+                return expired
+
+            ids = [doc[id_field] for doc in chunk]
+            archive_docs(chunk, name, self.archive_dir)
+            self.stores[name].remove(ids)
+            collection.delete_many({id_field: {"$in": ids}})
+            expired += len(chunk)
+
+    def _expire_episodic(self, dry_run):
+        collection = self.db["episodic_memory"]
+        cutoff = datetime.utcnow() - timedelta(days=self.retention["episodic_days"])
+        if dry_run:
+            return collection.count_documents({"timestamp": {"$lt": cutoff}})
+
+        expired = 0
+
+        # Whole segments past retention: archive, then drop the file
+        for key in self.stores["episodic"].segment_keys():
+            start, end = segment_range(key)
+            if end > cutoff:
+                continue
+
+            in_range = {"timestamp": {"$gte": start, "$lt": end}}
+            docs = list(collection.find(in_range))
+            archive_docs(docs, "episodic", self.archive_dir)
+            self.stores["episodic"].drop_segment(key)
+            collection.delete_many(in_range)
+            expired += len(docs)
+
+        # Older episodes inside the boundary segment
+        return expired + self._expire(
+            "episodic",
+            collection,
+            {"timestamp": {"$lt": cutoff}},
+            "_id",
+            dry_run=False
+        )
+
+    def _expire_semantic(self, dry_run):
+        now = datetime.utcnow()
+        r = self.retention
+        rules = [{"last_seen": {"$lt": now - timedelta(days=r["semantic_days"])}}]
+        if r["semantic_min_confidence"] > 0:
+            rules.append({
+                "confidence": {"$lt": r["semantic_min_confidence"]},
+                "last_seen": {"$lt": now - timedelta(days=r["semantic_low_confidence_days"])}
+            })
+        return self._expire(
+            "semantic",
+            self.db["semantic_memory"],
+            {"$or": rules},
+            "embedding_id",
+            dry_run
+        )
+
+    def _expire_cache(self, dry_run):
+        cutoff = datetime.utcnow() - timedelta(days=self.retention["cache_days"])
+        return self._expire(
+            "cache",
+            self.db["semantic_cache"],
+            {"last_used": {"$lt": cutoff}},
+            "embedding_id",
+            dry_run
+        )
+
+    # --------------------------------------------------
+    # Latency probe (fixed random queries, p50 per store)
+    # --------------------------------------------------
+    def probe_latency(self):
+        calls = {
+            "episodic": lambda v: self.stores["episodic"].search(
+                v, k=5, similarity_threshold=0.0,
+                max_age_days=self.retention["episodic_days"]
+            ),
+            "semantic": lambda v: self.stores["semantic"].search(
+                v, "", k=5, similarity_threshold=0.0
+            ),
+            "cache": lambda v: self.stores["cache"].lookup(v, user_id=None)
+        }
+
+        report = {}
+        for name, call in calls.items():
+            samples = []
+            for vector in self.probes:
+                t0 = time.perf_counter()
+                call(vector)
+                samples.append((time.perf_counter() - t0) * 1000)
+            report[name] = round(statistics.median(samples), 3)
+        return report
+
+
+def format_report(report):
+    lines = [
+        f"🧹 Compaction {'(dry run) ' if report['dry_run'] else ''}"
+        f"finished in {report['duration_ms']} ms"
+    ]
+    for name, expired in report["expired"].items():
+        before = report["index"][name]["before"]
+        after = report["index"][name]["after"]
+        latency = report["latency_p50_ms"][name]
+        lines.append(
+            f"   {name:<9} expired {expired:>6}  "
+            f"elements {before['elements']:>7} -> {after['elements']:<7} "
+            f"ram {before['ram_bytes'] / 1e6:>8.2f} -> {after['ram_bytes'] / 1e6:<8.2f} MB  "
+            f"p50 {latency['before']:>7} -> {latency['after']} ms"
+        )
+    return "\n".join(lines)
+
+
+def _open_stores(socket_path):
+    if socket_path:
+        from index_service import connect_stores
+        return connect_stores(socket_path)
+
+    from episodic_memory import EpisodicMemory
+    from semantic_memory import SemanticMemory
+    from semantic_cache import SemanticCache
+    return EpisodicMemory(), SemanticMemory(), SemanticCache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive expired memories and compact indexes")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--every", type=float, default=0, help="repeat every N hours")
+    parser.add_argument("--socket", default=os.getenv("INDEX_SERVICE_SOCKET"))
+    parser.add_argument("--json", action="store_true", help="print the full report")
+    args = parser.parse_args()
+
+    compactor = Compactor(*_open_stores(args.socket))
+
+    while True:
+        report = compactor.run(dry_run=args.dry_run)
+        print(json.dumps(report, indent=2) if args.json else format_report(report))
+        if not args.every:
+            break
+        time.sleep(args.every * 3600)
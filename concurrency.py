@@ -0,0 +1,195 @@
+import os
+import threading
+from contextlib import contextmanager
+from pymongo import ReturnDocument
+
+
+# -------------------------------
+# Reader / Writer Lock
+# -------------------------------
+class RWLock:
+    """
+    Many concurrent readers OR one writer.
+
+    Writers are preferred: once a writer is waiting, new readers
+    queue behind it so a steady stream of searches cannot starve
+    inserts.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+# -------------------------------
+# Atomic Id Allocator (MongoDB)
+# -------------------------------
+class IdAllocator:
+    """
+    Hands out unique integer ids from a Mongo `counters` document.
+
+    `find_one_and_update` with `$inc` is atomic on the server, so
+    threads and separate processes sharing the same database never
+    receive the same id.
+    """
+
+    def __init__(self, db, name, collection="counters"):
+        self.collection = db[collection]
+        self.name = name
+
+    def ensure_at_least(self, value):
+        """
+        Make sure the next id handed out is >= value
+        (used after loading / rebuilding an index).
+        """
+        self.collection.update_one(
+            {"_id": self.name},
+            {"$max": {"seq": int(value)}},
+            upsert=True
+        )
+
+    def reserve(self, n=1):
+        """
+        Atomically reserve `n` consecutive ids.
+        Returns a range of the reserved ids.
+        """
+        doc = self.collection.find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"seq": int(n)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        end = int(doc["seq"])
+        return range(end - n, end)
+
+    def next(self):
+        return self.reserve(1)[0]
+
+
+# -------------------------------
+# Crash-safe index persistence
+# -------------------------------
+def save_index_atomic(index, path):
+    """
+    Save an hnswlib index to a temp file and rename it into place,
+    so readers (or a crash mid-write) never see a half-written file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    index.save_index(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def ensure_capacity(index, extra):
+    """
+    Grow an hnswlib index (doubling) so `extra` more items fit.
+    """
+    needed = index.get_current_count() + extra
+    if needed > index.get_max_elements():
+        index.resize_index(max(needed, index.get_max_elements() * 2))
+
+
+def rebuild_index(index, live_labels, min_capacity=1024):
+    """
+    New index holding only `live_labels`, copied from the stored
+    vectors (no re-embedding). Drops mark_deleted slots and shrinks
+    capacity to fit. Caller holds the write lock.
+    """
+    import hnswlib
+    import numpy as np
+
+    labels = sorted(int(label) for label in live_labels)
+
+    fresh = hnswlib.Index(space=index.space, dim=index.dim)
+    fresh.init_index(
+        max_elements=max(min_capacity, int(len(labels) * 1.25)),
+        ef_construction=index.ef_construction,
+        M=index.M
+    )
+    if labels:
+        vectors = np.asarray(index.get_items(labels), dtype=np.float32)
+        fresh.add_items(vectors, np.array(labels))
+    return fresh
+
+
+def index_stats(index, live):
+    """
+    Size report for one hnswlib index. `ram_bytes` estimates the
+    allocation: hnswlib reserves every slot up to max_elements.
+    """
+    count = index.get_current_count()
+    file_bytes = index.index_file_size()
+    per_element = file_bytes / count if count else 0
+    return {
+        "elements": count,
+        "live": live,
+        "deleted": count - live,
+        "capacity": index.get_max_elements(),
+        "file_bytes": file_bytes,
+        "ram_bytes": int(per_element * index.get_max_elements())
+    }
+
+
+# -------------------------------
+# Index / Mongo reconciliation
+# -------------------------------
+# Only id sets are compared (no vectors), so embedding and index writes
+# are proportional to the mismatch, not to the corpus.
+RECONCILE_ON_START = os.getenv("RECONCILE_ON_START", "1") == "1"
+
+
+def diff_index(index, expected):
+    """
+    (missing, extra): ids in `expected` the index has no slot for, and
+    index labels not in `expected` (deleted slots included).
+    """
+    present = set(index.get_ids_list())
+    return set(expected) - present, present - set(expected)
+
+
+def mark_deleted_many(index, labels):
+    """
+    mark_deleted every label, skipping already-deleted slots.
+    Returns how many were newly deleted.
+    """
+    deleted = 0
+    for label in labels:
+        try:
+            index.mark_deleted(int(label))
+            deleted += 1
+        except RuntimeError:
+            pass
+    return deleted
@@ -5,9 +5,14 @@ from dotenv import load_dotenv
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.getenv("MONGO_DB", "memory_chatbot")
+
+# Index files, snapshots and archives. Each shard gets its own
+# DATA_DIR and MONGO_DB (see shard_map.py).
+DATA_DIR = os.getenv("DATA_DIR", "data")
 
 client = MongoClient(MONGO_URI)
-db = client["memory_chatbot"]
+db = client[MONGO_DB]
 
 episodic_collection = db["episodic_memory"]
 semantic_collection = db["semantic_memory"]
@@ -1,8 +1,188 @@
-from sentence_transformers import SentenceTransformer
+import os
+import threading
+import numpy as np
+
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# torch | onnx | onnx-int8
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", f"data/onnx/{MODEL_NAME}")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = runtime default
+
 
 class EmbeddingModel:
-    def __init__(self):
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+    backend = "torch"
+
+    def __init__(self, model_name=MODEL_NAME):
+        # Imported here: torch + sentence-transformers take seconds to import
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+        if EMBEDDING_THREADS:
+            import torch
+            torch.set_num_threads(EMBEDDING_THREADS)
 
     def encode(self, text: str):
         return self.model.encode(text)
+
+    def encode_batch(self, texts, batch_size=64):
+        """
+        Encode many texts in one model call.
+        Returns a (len(texts), dim) float32 matrix.
+        """
+        return self.model.encode(
+            list(texts),
+            batch_size=batch_size,
+            convert_to_numpy=True
+        )
+
+
+# ===============================
+# ONNX Runtime backend (fp32 / int8)
+# ===============================
+class OnnxEmbeddingModel:
+    """
+    Runs an exported all-MiniLM-L6-v2 graph (see export_onnx.py) with
+    ONNX Runtime on CPU. Reproduces the SentenceTransformer pipeline:
+    tokenize -> transformer -> mean pooling -> L2 normalize.
+    """
+
+    MAX_SEQ_LENGTH = 256
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=False, num_threads=EMBEDDING_THREADS):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "The ONNX embedding backend needs `onnxruntime` and "
+                "`tokenizers` (pip install onnxruntime tokenizers)"
+            ) from e
+
+        self.model_name = MODEL_NAME
+        self.backend = "onnx-int8" if quantized else "onnx"
+
+        file_name = "model_int8.onnx" if quantized else "model.onnx"
+        model_path = os.path.join(model_dir, file_name)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"{model_path} not found; run `python export_onnx.py` first"
+            )
+
+        self.tokenizer = Tokenizer.from_file(
+            os.path.join(model_dir, "tokenizer.json")
+        )
+        self.tokenizer.enable_truncation(max_length=self.MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, text: str):
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts, batch_size=64):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 384), dtype=np.float32)
+
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            chunks.append(self._encode_chunk(texts[start:start + batch_size]))
+        return np.vstack(chunks)
+
+    def _encode_chunk(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array(
+            [e.attention_mask for e in encodings],
+            dtype=np.int64
+        )
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array(
+                [e.type_ids for e in encodings],
+                dtype=np.int64
+            )
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # ---- Mean pooling over real tokens ----
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled = summed / counts
+
+        # ---- L2 normalize (matches the model's Normalize layer) ----
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+# --------------------------------------------------
+# Numerical equivalence check
+# --------------------------------------------------
+def compare_embeddings(reference, candidate, texts):
+    """
+    Encodes `texts` with both models and returns cosine agreement stats.
+    """
+    a = np.asarray(reference.encode_batch(texts), dtype=np.float32)
+    b = np.asarray(candidate.encode_batch(texts), dtype=np.float32)
+
+    a /= np.linalg.norm(a, axis=1, keepdims=True)
+    b /= np.linalg.norm(b, axis=1, keepdims=True)
+    cosines = (a * b).sum(axis=1)
+
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "max_abs_diff": float(np.abs(a - b).max())
+    }
+
+
+def create_embedder(backend=EMBEDDING_BACKEND):
+    if backend == "torch":
+        return EmbeddingModel()
+    if backend == "onnx":
+        return OnnxEmbeddingModel(quantized=False)
+    if backend == "onnx-int8":
+        return OnnxEmbeddingModel(quantized=True)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}")
+
+
+# --------------------------------------------------
+# Process-wide shared model (load once)
+# --------------------------------------------------
+_shared_embedder = None
+_shared_lock = threading.Lock()
+
+
+def get_embedder():
+    """
+    Returns the process-wide embedder, loading it on first use.
+    Every store and route shares this instance.
+    """
+    global _shared_embedder
+
+    if _shared_embedder is None:
+        with _shared_lock:
+            if _shared_embedder is None:
+                _shared_embedder = create_embedder()
+
+    return _shared_embedder
@@ -0,0 +1,53 @@
+import re
+
+
+# --------------------------------------------------
+# Compact episode summaries
+# --------------------------------------------------
+# Episodes are summarized once (at write time, or on first retrieval
+# for older documents) and the summary is stored on the Mongo document.
+# The prompt then inlines the summary instead of the full assistant
+# answer. Summaries are extractive: no extra LLM call per episode.
+# --------------------------------------------------
+
+SUMMARY_MAX_CHARS = 280
+
+# Bump when the algorithm changes so stored summaries can be refreshed
+SUMMARY_VERSION = 1
+
+_CODE_BLOCK_RE = re.compile(r"```.*?```", re.DOTALL)
+_HEADING_RE = re.compile(r"^\s*#{1,6}\s+.*$", re.MULTILINE)
+_MARKDOWN_RE = re.compile(r"^\s*([-*+>]\s+|\d+[.)]\s+)", re.MULTILINE)
+_INLINE_RE = re.compile(r"(\*\*|__|`|\*)")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _clean(text):
+    text = _CODE_BLOCK_RE.sub(" [code] ", text or "")
+    text = _HEADING_RE.sub("", text)
+    text = _MARKDOWN_RE.sub("", text)
+    text = _INLINE_RE.sub("", text)
+    return " ".join(text.split())
+
+
+def summarize_episode(assistant_output, max_chars=SUMMARY_MAX_CHARS):
+    """
+    Leading sentences of the (markdown-stripped) assistant answer,
+    up to `max_chars`.
+    """
+    text = _clean(assistant_output)
+    if len(text) <= max_chars:
+        return text
+
+    summary = ""
+    for sentence in _SENTENCE_RE.split(text):
+        candidate = f"{summary} {sentence}".strip()
+        if len(candidate) > max_chars:
+            break
+        summary = candidate
+
+    if not summary:
+        # First sentence alone is too long: cut at a word boundary
+        summary = text[:max_chars].rsplit(" ", 1)[0]
+
+    return summary + " …"
@@ -1,92 +1,692 @@
+import glob
 import hnswlib
 import numpy as np
 import os
-from datetime import datetime
-from pymongo import MongoClient
-from embeddings import EmbeddingModel
+import shutil
+import time
+from datetime import datetime, timedelta
+from pymongo import MongoClient, UpdateOne
+from db import DATA_DIR, MONGO_DB, MONGO_URI
+from embeddings import get_embedder
+from concurrency import RWLock, IdAllocator, save_index_atomic
+from concurrency import ensure_capacity, index_stats, rebuild_index
+from concurrency import RECONCILE_ON_START, mark_deleted_many
+from episode_summary import summarize_episode, SUMMARY_VERSION
+from scoring import EPISODIC_SCORING, ScoreTable, top_k, vector_scores
+from snapshot import clear_snapshot_state, read_snapshot_state, write_state
+
+
+# --------------------------------------------------
+# Time-partitioned episodic index
+# --------------------------------------------------
+# Episodes go into one HNSW segment per calendar month
+# (data/episodic/YYYY-MM.index). A search only touches the segments
+# that overlap its max_age_days window and only the caller's labels
+# inside them (hnswlib filter), so its cost follows the window, not the
+# total history. Segments older than EPISODIC_RESIDENT_DAYS are
+# unloaded from memory and reloaded on demand.
+# --------------------------------------------------
+
+SEGMENT_DIR = os.path.join(DATA_DIR, "episodic")
+RESIDENT_DAYS = int(os.getenv("EPISODIC_RESIDENT_DAYS", "90"))
+SEGMENT_IDLE_SECONDS = 600
+
+
+def segment_key(timestamp):
+    return timestamp.strftime("%Y-%m")
+
+
+def segment_range(key):
+    start = datetime.strptime(key, "%Y-%m")
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def segment_keys_between(start, end):
+    keys, month = [], start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= end:
+        keys.append(segment_key(month))
+        month = (month + timedelta(days=32)).replace(day=1)
+    return keys
+
+
+class EpisodeSegment:
+    """
+    One month of episodes: an HNSW index plus, per user, the set of
+    labels it holds (used as the knn_query filter).
+    """
+
+    def __init__(self, key, dim, directory=SEGMENT_DIR):
+        self.key = key
+        self.dim = dim
+        self.path = os.path.join(directory, f"{key}.index")
+        self.index = hnswlib.Index(space="cosine", dim=dim)
+        self.users = {}  # user_id -> set(eid)
+        self.last_used = time.time()
+
+    def create(self, max_elements):
+        self.index.init_index(max_elements=max_elements, ef_construction=200, M=16)
+
+    def load(self):
+        self.index.load_index(self.path)
+
+    def add(self, embeddings, eids, user_ids):
+        ensure_capacity(self.index, len(eids))
+        self.index.add_items(embeddings, np.array(eids))
+        for eid, user_id in zip(eids, user_ids):
+            self.users.setdefault(user_id, set()).add(int(eid))
+
+    def save(self):
+        save_index_atomic(self.index, self.path)
+
+    def count(self):
+        """
+        Live episodes (hnswlib's own count includes deleted slots).
+        """
+        return sum(len(labels) for labels in self.users.values())
+
+    def live(self):
+        return set().union(*self.users.values())
+
+    def remove(self, eids):
+        removed = 0
+        for labels in self.users.values():
+            for eid in labels & eids:
+                self.index.mark_deleted(eid)
+                removed += 1
+            labels -= eids
+        return removed
+
+    def compact(self):
+        self.index = rebuild_index(self.index, self.live())
+
+    def missing(self, docs):
+        """
+        Docs whose _id is not indexed (labels sit under the doc's
+        user_id, so no union over users is needed).
+        """
+        return [doc for doc in docs if doc["_id"] not in self.users.get(doc.get("user_id"), ())]
+
+    def allowed(self, user_id):
+        """
+        Labels visible to user_id (None = every label).
+        """
+        if user_id is None:
+            return None
+        return self.users.get(user_id, set())
 
 
 class EpisodicMemory:
-    def __init__(self, dim=384, max_elements=10000):
+    def __init__(self, dim=384, max_elements=10000, embedder=None):
         self.dim = dim
-        self.index_path = "data/episodic_hnsw.index"
+        self.max_elements = max_elements
+        self.segment_dir = SEGMENT_DIR
+        os.makedirs(self.segment_dir, exist_ok=True)
 
         # ---- MongoDB ----
-        self.client = MongoClient("mongodb://localhost:27017")
-        self.db = self.client["memory_chatbot"]
+        self.client = MongoClient(MONGO_URI)
+        self.db = self.client[MONGO_DB]
         self.collection = self.db["episodic_memory"]
 
         # ---- Embedder (for rebuild) ----
-        self.embedder = EmbeddingModel()
+        # Only needed when rebuilding; the shared model is loaded lazily.
+        self.embedder = embedder
 
-        # ---- HNSW ----
-        self.index = hnswlib.Index(space="cosine", dim=dim)
+        # ---- Concurrency ----
+        # Searches share the read lock; segment load/unload, index
+        # mutation and save take the write lock. Ids come from an atomic
+        # Mongo counter.
+        self.lock = RWLock()
+        self.ids = IdAllocator(self.db, "episodic_memory")
+
+        # ---- Segments ----
+        self.segments = {}  # key -> loaded EpisodeSegment
+        self.dirty = set()  # keys with unsaved adds (bulk ingest)
 
-        if os.path.exists(self.index_path):
-            try:
-                self.index.load_index(self.index_path)
-                self.next_id = self.index.get_current_count()
-                print(f"✅ Loaded Episodic HNSW ({self.next_id} episodes)")
-            except RuntimeError:
-                print("⚠️ Corrupted Episodic index detected. Rebuilding...")
-                self._rebuild_from_mongo(max_elements)
+        # After `snapshot.py import` the per-user label sets of the
+        # exported segments come from the bundle instead of Mongo.
+        snapshot = read_snapshot_state("episodic")
+
+        if not self._segment_files() and self.collection.estimated_document_count():
+            snapshot = None
+            self._rebuild_from_mongo()
         else:
-            self._rebuild_from_mongo(max_elements)
+            cutoff = datetime.utcnow() - timedelta(days=RESIDENT_DAYS)
+            for key in self.segment_keys():
+                if segment_range(key)[1] >= cutoff:
+                    users = snapshot["segments"].get(key) if snapshot else None
+                    self._load_segment(key, None if RECONCILE_ON_START else users)
+            print(f"✅ Loaded Episodic HNSW ({len(self.segments)} segments, "
+                  f"{sum(seg.count() for seg in self.segments.values())} episodes)")
+
+        # Orphaned labels (dropped by reconcile) still hold their ids
+        last = self.collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        self.next_id = max(
+            [last["_id"] + 1 if last else 0]
+            + [max(seg.index.get_ids_list(), default=-1) + 1 for seg in self.segments.values()]
+        )
+
+        if snapshot:
+            added = self.catch_up(snapshot["high_water"])
+            print(f"✅ Episodic snapshot caught up ({added} newer episodes)")
+            clear_snapshot_state("episodic")
+
+        self.ids.ensure_at_least(self.next_id)
 
     # --------------------------------------------------
-    # REBUILD INDEX FROM MONGODB
+    # SEGMENT FILES
     # --------------------------------------------------
-    def _rebuild_from_mongo(self, max_elements):
-        print("🔁 Rebuilding Episodic HNSW index from MongoDB...")
+    def _segment_files(self):
+        return sorted(glob.glob(os.path.join(self.segment_dir, "????-??.index")))
 
-        self.index.init_index(
-            max_elements=max_elements,
-            ef_construction=200,
-            M=16
-        )
-        self.next_id = 0
+    def segment_keys(self):
+        """
+        Keys of every segment on disk (loaded or not), oldest first.
+        """
+        return [os.path.basename(p)[:-len(".index")] for p in self._segment_files()]
 
-        for doc in self.collection.find():
-            eid = doc.get("_id")
-            user_text = doc.get("user")
+    def _segment_users(self, key):
+        start, end = segment_range(key)
+        users = {}
+        for doc in self.collection.find(
+            {"timestamp": {"$gte": start, "$lt": end}},
+            {"_id": 1, "user_id": 1}
+        ):
+            users.setdefault(doc.get("user_id"), set()).add(doc["_id"])
+        return users
 
-            if user_text is None or eid is None:
-                continue
+    def _load_segment(self, key, users=None):
+        # caller holds the write lock (or runs during __init__)
+        segment = EpisodeSegment(key, self.dim, self.segment_dir)
+        try:
+            segment.load()
+        except RuntimeError:
+            print(f"⚠️ Corrupted Episodic segment {key} detected. Rebuilding...")
+            return self._rebuild_segment(key)
+
+        if users is not None:
+            segment.users = users
+        else:
+            segment.users = self._segment_users(key)
+            if RECONCILE_ON_START:
+                self._reconcile_segment(segment)
+
+        self.segments[key] = segment
+        return segment
+
+    def _reconcile_segment(self, segment):
+        """
+        Match a segment's index to its Mongo ids (segment.users): embed
+        only the episodes it lacks, mark orphaned labels deleted.
+        """
+        present = set(segment.index.get_ids_list())
+        docs, embeddings = self._fetch_missing(segment.live() - present)
+        return self._apply_reconcile(segment, segment.users, present, docs, embeddings)
+
+    def _fetch_missing(self, missing):
+        """
+        Docs (with text) and embeddings for ids an index lacks.
+        """
+        docs = [
+            doc for doc in self.collection.find(
+                {"_id": {"$in": list(missing)}},
+                {"_id": 1, "user": 1, "user_id": 1}
+            )
+            if doc.get("user") is not None
+        ] if missing else []
+
+        embeddings = (self.embedder or get_embedder()).encode_batch(
+            [doc["user"] for doc in docs]
+        ) if docs else None
+        return docs, embeddings
+
+    def _apply_reconcile(self, segment, users, present, docs, embeddings):
+        # caller holds the write lock (or runs during load)
+        expected = set().union(*users.values())
+        orphans = mark_deleted_many(segment.index, present - expected)
+
+        # Docs without text are never indexed (same as a rebuild)
+        unindexable = (expected - present) - {doc["_id"] for doc in docs}
+        for labels in users.values():
+            labels -= unindexable
+        segment.users = users
+
+        if docs:
+            ensure_capacity(segment.index, len(docs))
+            segment.index.add_items(embeddings, np.array([doc["_id"] for doc in docs]))
+
+        if docs or orphans:
+            segment.save()
+            print(f"🩹 Episodic segment {segment.key} reconciled with MongoDB: "
+                  f"{len(docs)} missing added, {orphans} orphans deleted")
+
+        return {"missing": len(docs), "orphans": orphans}
+
+    def reconcile(self):
+        """
+        Re-check every loaded segment against Mongo (segments loaded
+        later are checked as they load). The Mongo scan and embedding
+        run without the write lock, which is only taken to apply each
+        segment's diff, so searches keep running meanwhile.
+        """
+        report = {"missing": 0, "orphans": 0}
+        with self.lock.read():
+            keys = list(self.segments)
+
+        for key in keys:
+            # Index state first: episodes reach Mongo before the index,
+            # so anything indexed here is already visible to the scan
+            with self.lock.read():
+                segment = self.segments.get(key)
+                if segment is None:
+                    continue
+                present = set(segment.index.get_ids_list())
+                live = segment.live()
+            users = self._segment_users(key)
+            docs, embeddings = self._fetch_missing(set().union(*users.values()) - present)
+
+            with self.lock.write():
+                if self.segments.get(key) is not segment:
+                    continue  # unloaded meanwhile; checked again on load
+
+                # Keep what add_episodes / remove did while Mongo was read
+                current = segment.live()
+                added, removed = current - live, live - current
+                for user_id, labels in segment.users.items():
+                    users.setdefault(user_id, set()).update(labels & added)
+                for labels in users.values():
+                    labels -= removed
+                keep = [i for i, doc in enumerate(docs) if doc["_id"] not in added]
+                docs = [docs[i] for i in keep]
+                embeddings = embeddings[keep] if docs else None
 
-            embedding = self.embedder.encode(user_text)
+                for name, n in self._apply_reconcile(
+                    segment, users, present | added, docs, embeddings
+                ).items():
+                    report[name] += n
+        return report
 
-            self.index.add_items(
-                np.array([embedding]),
-                np.array([eid])
+    def _ensure_loaded(self, keys):
+        missing = [k for k in keys if k not in self.segments]
+        on_disk = set(self.segment_keys()) if missing else set()
+        missing = [k for k in missing if k in on_disk]
+        if not missing:
+            return
+
+        with self.lock.write():
+            for key in missing:
+                if key not in self.segments:
+                    self._load_segment(key)
+
+    def unload_segments(self, older_than_days=RESIDENT_DAYS, idle_seconds=0):
+        """
+        Drop segments that end before the cutoff (and were not searched
+        for `idle_seconds`) from memory; their files stay on disk.
+        Returns the unloaded keys.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        idle_since = time.time() - idle_seconds
+        with self.lock.write():
+            old = [
+                key for key, segment in self.segments.items()
+                if segment_range(key)[1] < cutoff
+                and segment.last_used <= idle_since
+                and key not in self.dirty
+            ]
+            for key in old:
+                del self.segments[key]
+        return old
+
+    # --------------------------------------------------
+    # REBUILD SEGMENTS FROM MONGODB
+    # --------------------------------------------------
+    def _rebuild_from_mongo(self):
+        print("🔁 Rebuilding Episodic segments from MongoDB...")
+
+        keys = set()
+        for doc in self.collection.find({}, {"timestamp": 1}):
+            if doc.get("timestamp"):
+                keys.add(segment_key(doc["timestamp"]))
+
+        for key in sorted(keys):
+            self._rebuild_segment(key)
+
+        self.unload_segments()
+        print(f"✅ Episodic index rebuilt into {len(keys)} segments")
+
+    def _rebuild_segment(self, key):
+        start, end = segment_range(key)
+        docs = [
+            doc for doc in self.collection.find(
+                {"timestamp": {"$gte": start, "$lt": end}},
+                {"_id": 1, "user": 1, "user_id": 1}
             )
+            if doc.get("user") is not None
+        ]
 
-            self.next_id = max(self.next_id, eid + 1)
+        segment = EpisodeSegment(key, self.dim, self.segment_dir)
+        segment.create(max(self.max_elements, len(docs)))
 
-        os.makedirs("data", exist_ok=True)
-        self.index.save_index(self.index_path)
+        if docs:
+            embeddings = (self.embedder or get_embedder()).encode_batch(
+                [doc["user"] for doc in docs]
+            )
+            segment.add(
+                embeddings,
+                [doc["_id"] for doc in docs],
+                [doc.get("user_id") for doc in docs]
+            )
 
-        print(f"✅ Episodic index rebuilt with {self.next_id} episodes")
+        segment.save()
+        self.segments[key] = segment
+        return segment
+
+    # --------------------------------------------------
+    # SNAPSHOT EXPORT + CATCH-UP (snapshot.py)
+    # --------------------------------------------------
+    def export_snapshot(self, directory):
+        """
+        Copy every segment into `directory`/segments and write the label
+        sets of the loaded ones to state.pkl; returns the manifest entry.
+        """
+        target = os.path.join(directory, "segments")
+        os.makedirs(target, exist_ok=True)
+
+        with self.lock.read():
+            for key in set(self.segment_keys()) | set(self.segments):
+                path = os.path.join(target, f"{key}.index")
+                if key in self.segments:
+                    self.segments[key].index.save_index(path)
+                else:
+                    shutil.copyfile(os.path.join(self.segment_dir, f"{key}.index"), path)
+
+            segments = {key: segment.users for key, segment in self.segments.items()}
+            high_water = max(
+                (max(labels) for users in segments.values() for labels in users.values() if labels),
+                default=-1
+            )
+            write_state(os.path.join(directory, "state.pkl"), {
+                "high_water": high_water,
+                "segments": segments
+            })
+            count = sum(len(labels) for users in segments.values() for labels in users.values())
+
+        return {"high_water": high_water, "count": count, "segments": len(self.segment_keys())}
+
+    def catch_up(self, high_water):
+        """
+        Index episodes with _id > high_water that their segment does
+        not hold yet (only these are embedded). Returns how many.
+        """
+        return self._index_from_mongo({"_id": {"$gt": int(high_water)}})
+
+    def sync_ids(self, eids):
+        """
+        Index these episodes unless already indexed (inserts made by
+        other nodes, see index_sync.py). Returns how many were added.
+        """
+        return self._index_from_mongo({"_id": {"$in": [int(eid) for eid in eids]}})
+
+    def _index_from_mongo(self, query):
+        docs = list(self.collection.find(
+            query,
+            {"_id": 1, "user": 1, "user_id": 1, "timestamp": 1}
+        ))
+        by_segment = {}
+        for doc in docs:
+            if doc.get("user") and doc.get("timestamp"):
+                by_segment.setdefault(segment_key(doc["timestamp"]), []).append(doc)
+        self._ensure_loaded(list(by_segment))
+
+        with self.lock.read():
+            pending = {}
+            for key, seg_docs in by_segment.items():
+                segment = self.segments.get(key)
+                seg_docs = segment.missing(seg_docs) if segment else seg_docs
+                if seg_docs:
+                    pending[key] = (segment, seg_docs)
+        if not pending:
+            return 0
+
+        # Embed without a lock so searches keep running
+        embeddings = np.asarray((self.embedder or get_embedder()).encode_batch(
+            [doc["user"] for _, seg_docs in pending.values() for doc in seg_docs]
+        ))
+
+        added = offset = 0
+        with self.lock.write():
+            for key, (segment, seg_docs) in pending.items():
+                rows = np.arange(offset, offset + len(seg_docs))
+                offset += len(seg_docs)
+
+                # A segment unloaded meanwhile is still updated (and saved)
+                if segment is None:
+                    segment = self.segments.get(key)
+                if segment is None:
+                    segment = self.segments[key] = EpisodeSegment(key, self.dim, self.segment_dir)
+                    segment.create(self.max_elements)
+
+                # Another writer may have indexed some meanwhile
+                still_missing = {doc["_id"] for doc in segment.missing(seg_docs)}
+                keep = [i for i, doc in enumerate(seg_docs) if doc["_id"] in still_missing]
+                if not keep:
+                    continue
+
+                segment.add(
+                    embeddings[rows[keep]],
+                    [seg_docs[i]["_id"] for i in keep],
+                    [seg_docs[i].get("user_id") for i in keep]
+                )
+                segment.save()
+                added += len(keep)
+
+        return added
 
     # --------------------------------------------------
     # ADD EPISODE
     # --------------------------------------------------
-    def add_episode(self, embedding, user_input, assistant_output):
-        eid = self.next_id
+    def add_episode(self, embedding, user_input, assistant_output, user_id=None):
+        self.add_episodes([embedding], [user_input], [assistant_output], [user_id])
 
-        self.index.add_items(
-            np.array([embedding]),
-            np.array([eid])
-        )
+    def add_episodes(
+        self,
+        embeddings,
+        user_inputs,
+        assistant_outputs,
+        user_ids=None,
+        timestamps=None,
+        persist=True
+    ):
+        """
+        Insert many episodes with one id reservation, one insert_many,
+        and one add_items + save per month segment touched (the current
+        month unless `timestamps` are given).
+
+        Bulk ingest passes persist=False and calls `persist()` at the end.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(embeddings) == 0:
+            return []
+
+        if user_ids is None:
+            user_ids = [None] * len(embeddings)
+        if timestamps is None:
+            timestamps = [datetime.utcnow()] * len(embeddings)
+
+        eids = list(self.ids.reserve(len(embeddings)))
+
+        self.collection.insert_many([
+            {
+                "_id": eid,
+                "user_id": user_id,
+                "user": user_input,
+                "assistant": assistant_output,
+                "summary": summarize_episode(assistant_output),
+                "summary_version": SUMMARY_VERSION,
+                "timestamp": timestamp
+            }
+            for eid, user_id, user_input, assistant_output, timestamp
+            in zip(eids, user_ids, user_inputs, assistant_outputs, timestamps)
+        ])
+
+        by_segment = {}
+        for row, timestamp in enumerate(timestamps):
+            by_segment.setdefault(segment_key(timestamp), []).append(row)
+        self._ensure_loaded(list(by_segment))
 
-        self.collection.insert_one({
-            "_id": eid,
-            "user": user_input,
-            "assistant": assistant_output,
-            "timestamp": datetime.utcnow()
-        })
+        with self.lock.write():
+            for key, rows in by_segment.items():
+                segment = self.segments.get(key)
+                if segment is None:
+                    segment = self.segments[key] = EpisodeSegment(key, self.dim, self.segment_dir)
+                    segment.create(self.max_elements)
 
-        self.next_id += 1
-        self.index.save_index(self.index_path)
+                segment.add(
+                    embeddings[rows],
+                    [eids[row] for row in rows],
+                    [user_ids[row] for row in rows]
+                )
+                if persist:
+                    segment.save()
+                else:
+                    self.dirty.add(key)
+            self.next_id = max(self.next_id, max(eids) + 1)
+
+        if persist:
+            # Old segments loaded on demand by a long-window search
+            self.unload_segments(idle_seconds=SEGMENT_IDLE_SECONDS)
+
+        return eids
+
+    def persist(self):
+        """
+        Save segments left unsaved by persist=False adds, then unload
+        the ones outside the resident window.
+        """
+        with self.lock.write():
+            for key in self.dirty:
+                if key in self.segments:
+                    self.segments[key].save()
+            self.dirty.clear()
+
+        self.unload_segments()
+
+    # --------------------------------------------------
+    # COUNT
+    # --------------------------------------------------
+    def count(self):
+        return self.collection.estimated_document_count()
+
+    # --------------------------------------------------
+    # LEGACY OWNER (migrate_episodes.py)
+    # --------------------------------------------------
+    def assign_owner(self, user_id, chunk_size=10000):
+        """
+        Give episodes stored without a user_id to `user_id`: sets it on
+        their Mongo docs and moves their labels in the loaded segments
+        (unloaded segments read owners from Mongo when they load).
+        Returns how many episodes were assigned.
+        """
+        ids = [doc["_id"] for doc in self.collection.find({"user_id": None}, {"_id": 1})]
+        for start in range(0, len(ids), chunk_size):
+            self.collection.update_many(
+                {"_id": {"$in": ids[start:start + chunk_size]}, "user_id": None},
+                {"$set": {"user_id": user_id}}
+            )
+
+        assigned = set(ids)
+        with self.lock.write():
+            for segment in self.segments.values():
+                legacy = segment.users.get(None)
+                if not legacy:
+                    continue
+                moved = legacy & assigned
+                legacy -= moved
+                if not legacy:
+                    del segment.users[None]
+                segment.users.setdefault(user_id, set()).update(moved)
+        return len(ids)
+
+    # --------------------------------------------------
+    # REMOVE + COMPACT (used by compaction.py)
+    # --------------------------------------------------
+    def remove(self, eids):
+        """
+        Mark episodes deleted in their segments. Mongo docs are deleted
+        by the caller afterwards. Returns how many labels were removed.
+        """
+        eids = {int(eid) for eid in eids}
+        keys = {
+            segment_key(doc["timestamp"])
+            for doc in self.collection.find({"_id": {"$in": list(eids)}}, {"timestamp": 1})
+        }
+        self._ensure_loaded(keys)
+
+        removed = 0
+        with self.lock.write():
+            # Docs already deleted in Mongo (sync from another node) can
+            # only be found in the loaded segments
+            for key in keys | set(self.segments):
+                segment = self.segments.get(key)
+                if segment is None:
+                    continue
+                n = segment.remove(eids)
+                if n:
+                    segment.save()
+                    removed += n
+        return removed
+
+    def drop_segment(self, key):
+        """
+        Unload a segment and delete its file (after its episodes
+        have been archived).
+        """
+        with self.lock.write():
+            segment = self.segments.pop(key, None)
+            path = segment.path if segment else os.path.join(self.segment_dir, f"{key}.index")
+            if os.path.exists(path):
+                os.remove(path)
+
+    def fragmentation(self):
+        with self.lock.read():
+            total = sum(seg.index.get_current_count() for seg in self.segments.values())
+            live = sum(seg.count() for seg in self.segments.values())
+        return 1 - live / total if total else 0.0
+
+    def compact_index(self, min_fragmentation=0.0):
+        """
+        Rebuild loaded segments that hold deleted slots; past segments
+        left empty are dropped.
+        """
+        current = segment_key(datetime.utcnow())
+        with self.lock.write():
+            for key, segment in list(self.segments.items()):
+                total = segment.index.get_current_count()
+                if not segment.count() and key != current:
+                    del self.segments[key]
+                    if os.path.exists(segment.path):
+                        os.remove(segment.path)
+                elif total and 1 - segment.count() / total > min_fragmentation:
+                    segment.compact()
+                    segment.save()
+
+    def index_stats(self):
+        """
+        Loaded segments, summed; `unloaded_file_bytes` covers the rest.
+        """
+        with self.lock.read():
+            stats = [index_stats(seg.index, seg.count()) for seg in self.segments.values()]
+            loaded = {seg.path for seg in self.segments.values()}
+
+        total = {
+            key: sum(s[key] for s in stats)
+            for key in ("elements", "live", "deleted", "capacity", "file_bytes", "ram_bytes")
+        }
+        total["segments_loaded"] = len(stats)
+        total["unloaded_file_bytes"] = sum(
+            os.path.getsize(p) for p in self._segment_files() if p not in loaded
+        )
+        return total
 
     # --------------------------------------------------
     # SEARCH (RELEVANCE + RECENCY AWARE)
@@ -96,54 +696,151 @@ class EpisodicMemory:
         embedding,
         k=2,
         similarity_threshold=0.35,
-        max_age_days=30
+        max_age_days=30,
+        user_id=None
     ):
         """
-        Returns high-quality episodic memories.
+        Returns high-quality episodic memories of `user_id`
+        (None = any user).
         Filters by:
         - semantic similarity
         - recency
         - hard cap (k)
         """
+        return self.search_batch(
+            [embedding],
+            k=k,
+            similarity_threshold=similarity_threshold,
+            max_age_days=max_age_days,
+            user_ids=[user_id]
+        )[0]
 
-        if self.index.get_current_count() == 0:
-            return []
+    # --------------------------------------------------
+    # BATCH SEARCH (SEGMENTS IN WINDOW + ONE MONGO FETCH)
+    # --------------------------------------------------
+    def search_batch(
+        self,
+        embeddings,
+        k=2,
+        similarity_threshold=0.35,
+        max_age_days=30,
+        user_ids=None,
+        scoring=None
+    ):
+        """
+        Same contract as search(), for many query rows at once.
+        `user_ids` holds one user per row (None = any user).
+        Returns one result list per input row, in order.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
 
-        labels, distances = self.index.knn_query(
-            np.array([embedding]),
-            k=min(k * 3, self.index.get_current_count())
-        )
+        n_rows = len(embeddings)
+        if user_ids is None:
+            user_ids = [None] * n_rows
 
-        results = []
         now = datetime.utcnow()
+        keys = segment_keys_between(now - timedelta(days=max_age_days), now)
+        self._ensure_loaded(keys)
 
-        for idx, dist in zip(labels[0], distances[0]):
-            similarity = 1 - dist
+        # ---- Per-row candidates from the segments in the window ----
+        rows = []
+        with self.lock.read():
+            segments = [self.segments[key] for key in keys if key in self.segments]
 
-            if similarity < similarity_threshold:
-                continue
+            for row in range(n_rows):
+                candidates = {}
+                for segment in segments:
+                    segment.last_used = time.time()
+                    allowed = segment.allowed(user_ids[row])
+                    available = segment.count() if allowed is None else len(allowed)
+                    if not available:
+                        continue
 
-            doc = self.collection.find_one({"_id": int(idx)})
-            if not doc:
-                continue
+                    labels, distances = segment.index.knn_query(
+                        embeddings[row:row + 1],
+                        k=min(k * 2, available),
+                        filter=None if allowed is None else allowed.__contains__
+                    )
+                    for label, dist in zip(labels[0], distances[0]):
+                        if 1.0 - dist >= similarity_threshold:
+                            candidates[int(label)] = 1.0 - float(dist)
+                rows.append(candidates)
 
-            age_days = (now - doc["timestamp"]).days
-            if age_days > max_age_days:
+        # ---- Resolve metadata for every candidate in one round trip ----
+        candidate_ids = sorted({eid for candidates in rows for eid in candidates})
+        docs = list(self.collection.find(
+            {"_id": {"$in": candidate_ids}}
+        )) if candidate_ids else []
+
+        # ---- Vectorized scoring ----
+        table = ScoreTable(docs, id_field="_id", time_field="timestamp", now=now)
+        scoring = scoring or EPISODIC_SCORING
+
+        picks = []
+        for candidates in rows:
+            if not candidates or not len(table):
+                picks.append([])
                 continue
 
-            recency_penalty = min(age_days * 0.02, 0.3)
-            final_score = similarity - recency_penalty
+            similarity = np.array(list(candidates.values()), dtype=np.float32)
+            positions, found = table.lookup(np.array(list(candidates), dtype=np.int64))
+            age_days = table.age_days[positions]
+
+            scores = vector_scores(similarity, age_days, 0.0, scoring)
+            keep = found & (age_days <= max_age_days) & (scores >= similarity_threshold)
+            picks.append([
+                (table.docs[positions[col]], similarity[col], scores[col])
+                for col in top_k(scores, k, keep)
+            ])
+
+        # Summaries only for the episodes actually returned
+        self._ensure_summaries({
+            doc["_id"]: doc for row in picks for doc, _, _ in row
+        }.values())
+
+        return [
+            [
+                {
+                    "user": doc["user"],
+                    "assistant": doc["assistant"],
+                    "summary": doc["summary"],
+                    "timestamp": doc["timestamp"].isoformat(),
+                    "similarity": round(float(similarity), 3),
+                    "score": round(float(score), 3)
+                }
+                for doc, similarity, score in row
+            ]
+            for row in picks
+        ]
 
-            if final_score < similarity_threshold:
+    # --------------------------------------------------
+    # LAZY SUMMARIES (episodes written before summaries existed)
+    # --------------------------------------------------
+    def _ensure_summaries(self, docs):
+        """
+        Fills in `summary` for retrieved docs that lack a current one
+        and persists it with one bulk write. The filter only matches
+        docs still missing it, so an episode is summarized once.
+        """
+        updates = []
+        for doc in docs:
+            if doc.get("summary_version") == SUMMARY_VERSION and "summary" in doc:
                 continue
 
-            results.append({
-                "user": doc["user"],
-                "assistant": doc["assistant"],
-                "timestamp": doc["timestamp"].isoformat(),
-                "similarity": float(round(similarity, 3)),
-                "score": float(round(final_score, 3))
-            })
+            doc["summary"] = summarize_episode(doc.get("assistant", ""))
+            doc["summary_version"] = SUMMARY_VERSION
+            updates.append(UpdateOne(
+                {
+                    "_id": doc["_id"],
+                    "summary_version": {"$ne": SUMMARY_VERSION}
+                },
+                {"$set": {
+                    "summary": doc["summary"],
+                    "summary_version": SUMMARY_VERSION
+                }}
+            ))
 
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:k]
+        if updates:
+            self.collection.bulk_write(updates, ordered=False)
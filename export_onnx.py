@@ -0,0 +1,142 @@
+import argparse
+import inspect
+import os
+from embeddings import (
+    MODEL_NAME,
+    ONNX_MODEL_DIR,
+    EmbeddingModel,
+    OnnxEmbeddingModel,
+    compare_embeddings
+)
+
+
+# --------------------------------------------------
+# Export all-MiniLM-L6-v2 to ONNX (+ int8) and verify it
+# --------------------------------------------------
+#   python export_onnx.py
+#   EMBEDDING_BACKEND=onnx-int8 EMBEDDING_THREADS=4 python app.py
+# --------------------------------------------------
+
+VERIFY_TEXTS = [
+    "What is democracy?",
+    "My name is Janani. I prefer concise, technical explanations.",
+    "Vector databases store embeddings and perform similarity search.",
+    "How does hybrid search combine multiple methods?",
+    "def add_episode(self, embedding, user_input, assistant_output):",
+    "ok",
+    "Summarize my chatbot workflow in three bullet points, and explain "
+    "why semantic memory and episodic memory are stored separately."
+]
+
+# Minimum cosine between reference and exported embeddings
+MIN_COSINE = {
+    "onnx": 0.9999,
+    "onnx-int8": 0.98
+}
+
+
+def export(output_dir=ONNX_MODEL_DIR, opset=14):
+    import torch
+
+    class TokenEmbeddings(torch.nn.Module):
+        # Pass inputs by name: positional order of forward() differs
+        # between transformers releases.
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    reference = EmbeddingModel()
+    transformer = reference.model[0]
+    hf_model = TokenEmbeddings(transformer.auto_model).eval()
+    tokenizer = transformer.tokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(
+        ["export sample"],
+        return_tensors="pt",
+        padding=True
+    )
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {
+        name: {0: "batch", 1: "sequence"} for name in input_names
+    }
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    # Newer torch defaults to the dynamo exporter; the TorchScript one
+    # handles `dynamic_axes` without extra dependencies.
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+
+    model_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            **export_kwargs
+        )
+    print(f"✅ Exported {MODEL_NAME} to {model_path}")
+
+    return reference
+
+
+def quantize(output_dir=ONNX_MODEL_DIR):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    src = os.path.join(output_dir, "model.onnx")
+    dst = os.path.join(output_dir, "model_int8.onnx")
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    print(f"✅ Wrote int8 model to {dst}")
+
+
+def verify(reference, output_dir=ONNX_MODEL_DIR, include_int8=True):
+    """
+    Fails loudly if an exported backend drifts from the PyTorch model.
+    """
+    backends = [("onnx", False)]
+    if include_int8:
+        backends.append(("onnx-int8", True))
+
+    ok = True
+    for backend, quantized in backends:
+        candidate = OnnxEmbeddingModel(output_dir, quantized=quantized)
+        stats = compare_embeddings(reference, candidate, VERIFY_TEXTS)
+        passed = stats["min_cosine"] >= MIN_COSINE[backend]
+        ok = ok and passed
+
+        print(
+            f"{'✅' if passed else '❌'} {backend:<10} "
+            f"min_cos={stats['min_cosine']:.6f} "
+            f"mean_cos={stats['mean_cosine']:.6f} "
+            f"max_abs_diff={stats['max_abs_diff']:.2e} "
+            f"(required >= {MIN_COSINE[backend]})"
+        )
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export embeddings to ONNX")
+    parser.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--skip-int8", action="store_true")
+    args = parser.parse_args()
+
+    reference = export(args.output_dir)
+    if not args.skip_int8:
+        quantize(args.output_dir)
+
+    if not verify(reference, args.output_dir, include_int8=not args.skip_int8):
+        raise SystemExit("Exported embeddings are not equivalent")
@@ -0,0 +1,259 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from llm import extract_semantic_memories
+
+
+# --------------------------------------------------
+# Semantic-memory extraction pipeline
+# --------------------------------------------------
+# Instead of one extraction LLM call after every turn:
+#   1. a cheap local pre-filter drops turns unlikely to hold a reusable
+#      fact (small talk, near-repeats of cached queries, facts already
+#      stored for this user)
+#   2. surviving turns are buffered per user
+#   3. a full buffer (or a stale one) is extracted with ONE LLM call
+#      that returns a JSON list of memories. A background sweep picks up
+#      stale buffers of users who stopped chatting.
+# --------------------------------------------------
+
+SMALL_TALK_RE = re.compile(
+    r"^(hi|hello|hey|yo|thanks|thank you|thx|ok|okay|cool|great|nice|"
+    r"bye|goodbye|good (morning|afternoon|evening|night)|lol|yes|no|sure|"
+    r"got it|sounds good|awesome)\b[\s!.?]*$",
+    re.IGNORECASE
+)
+
+# "my name is", "I prefer", "I am building" ... always worth extracting
+SELF_DISCLOSURE_RE = re.compile(
+    r"\b(my|i am|i'm|i prefer|i like|i use|i work|i want|we use|our)\b",
+    re.IGNORECASE
+)
+
+MIN_WORDS = 3
+
+
+class ExtractionPipeline:
+    def __init__(
+        self,
+        semantic,
+        embedder,
+        cache=None,
+        batch_size=4,
+        max_wait_seconds=120,
+        known_threshold=0.92,
+        cache_adjacent_threshold=0.85,
+        background=True
+    ):
+        self.semantic = semantic
+        self.embedder = embedder
+        self.cache = cache
+
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.known_threshold = known_threshold
+        self.cache_adjacent_threshold = cache_adjacent_threshold
+
+        self.buffers = {}  # user_id -> [(timestamp, turn_text)]
+        self.lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+
+        # One worker keeps extraction off the request path and in order
+        self.executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="extraction")
+            if background else None
+        )
+
+        self.metrics = {
+            "turns_seen": 0,
+            "turns_skipped": 0,
+            "skip_reasons": {},
+            "turns_extracted": 0,
+            "llm_calls": 0,
+            "stale_flushes": 0,
+            "memories_extracted": 0,
+            "extraction_errors": 0
+        }
+
+    # --------------------------------------------------
+    # Pre-filter
+    # --------------------------------------------------
+    def skip_reason(self, user_id, user_input, query_embedding=None):
+        """
+        Returns why a turn should not be extracted, or None.
+        Lexical checks first; ANN checks only when those pass.
+        """
+        text = user_input.strip()
+
+        if SMALL_TALK_RE.match(text):
+            return "small_talk"
+
+        discloses = bool(SELF_DISCLOSURE_RE.search(text))
+        if len(text.split()) < MIN_WORDS and not discloses:
+            return "too_short"
+
+        if query_embedding is None:
+            return None
+
+        if self.cache is not None and not discloses:
+            if self.cache.nearest_similarity(query_embedding, user_id) >= self.cache_adjacent_threshold:
+                return "cache_adjacent"
+
+        if self.semantic.nearest_similarity(query_embedding, user_id) >= self.known_threshold:
+            return "already_known"
+
+        return None
+
+    # --------------------------------------------------
+    # Submit a finished turn
+    # --------------------------------------------------
+    def submit(self, user_id, user_input, response, query_embedding=None):
+        """
+        Returns "skipped:<reason>", "buffered" or "flushed".
+        """
+        reason = self.skip_reason(user_id, user_input, query_embedding)
+
+        with self.lock:
+            self.metrics["turns_seen"] += 1
+            if reason:
+                self.metrics["turns_skipped"] += 1
+                reasons = self.metrics["skip_reasons"]
+                reasons[reason] = reasons.get(reason, 0) + 1
+                return f"skipped:{reason}"
+
+            buffer = self.buffers.setdefault(user_id, [])
+            buffer.append((time.time(), f"User: {user_input}\nAssistant: {response}"))
+            self._ensure_sweeper()
+
+            ready = {}
+            if len(buffer) >= self.batch_size:
+                ready[user_id] = self.buffers.pop(user_id)
+            ready.update(self._pop_stale())
+
+        for ready_user, turns in ready.items():
+            self._dispatch(ready_user, turns)
+
+        return "flushed" if user_id in ready else "buffered"
+
+    def _pop_stale(self):
+        # caller holds self.lock
+        cutoff = time.time() - self.max_wait_seconds
+        stale = [u for u, turns in self.buffers.items() if turns and turns[0][0] < cutoff]
+        self.metrics["stale_flushes"] += len(stale)
+        return {u: self.buffers.pop(u) for u in stale}
+
+    # --------------------------------------------------
+    # Stale sweep (background mode)
+    # --------------------------------------------------
+    def _ensure_sweeper(self):
+        # caller holds self.lock
+        if self.executor is None or self._sweeper is not None:
+            return
+        self._sweeper = threading.Thread(
+            target=self._sweep_loop,
+            name="extraction-sweep",
+            daemon=True
+        )
+        self._sweeper.start()
+
+    def _sweep_loop(self):
+        interval = max(min(self.max_wait_seconds / 4, 30.0), 0.01)
+        while not self._stop.wait(interval):
+            self.sweep()
+
+    def sweep(self):
+        """
+        Extract buffers older than max_wait_seconds. Returns how many
+        users were flushed.
+        """
+        with self.lock:
+            ready = self._pop_stale()
+        for user_id, turns in ready.items():
+            self._dispatch(user_id, turns)
+        return len(ready)
+
+    # --------------------------------------------------
+    # Flush
+    # --------------------------------------------------
+    def flush(self, user_id=None, wait=True):
+        """
+        Extract buffered turns now (one user, or everyone).
+        """
+        with self.lock:
+            if user_id is None:
+                ready, self.buffers = self.buffers, {}
+            else:
+                ready = {user_id: self.buffers.pop(user_id, [])}
+
+        futures = [
+            self._dispatch(u, turns)
+            for u, turns in ready.items()
+            if turns
+        ]
+        if wait:
+            for future in futures:
+                if future is not None:
+                    future.result()
+
+    def close(self):
+        # Stop the sweep, drain the worker, then extract what is left
+        # inline: at interpreter exit the executor no longer accepts work.
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.flush(wait=True)
+
+    def _dispatch(self, user_id, turns):
+        texts = [text for _, text in turns]
+        if self.executor:
+            return self.executor.submit(self._extract, user_id, texts)
+        self._extract(user_id, texts)
+        return None
+
+    def _extract(self, user_id, texts):
+        for start in range(0, len(texts), self.batch_size):
+            chunk = texts[start:start + self.batch_size]
+            try:
+                memories = extract_semantic_memories(chunk)
+            except Exception as e:
+                print(f"⚠️ Semantic extraction failed: {e}")
+                with self.lock:
+                    self.metrics["llm_calls"] += 1
+                    self.metrics["extraction_errors"] += 1
+                continue
+
+            if memories:
+                embeddings = self.embedder.encode_batch(
+                    [m["content"] for m in memories]
+                )
+                self.semantic.add_memories(
+                    embeddings,
+                    [m["content"] for m in memories],
+                    [m["type"] for m in memories],
+                    [user_id] * len(memories)
+                )
+
+            with self.lock:
+                self.metrics["llm_calls"] += 1
+                self.metrics["turns_extracted"] += len(chunk)
+                self.metrics["memories_extracted"] += len(memories)
+
+    # --------------------------------------------------
+    # Metrics
+    # --------------------------------------------------
+    def stats(self):
+        with self.lock:
+            m = dict(self.metrics, skip_reasons=dict(self.metrics["skip_reasons"]))
+            m["turns_buffered"] = sum(len(t) for t in self.buffers.values())
+
+        seen = m["turns_seen"]
+        processed = m["turns_skipped"] + m["turns_extracted"]
+        m["skip_rate"] = round(m["turns_skipped"] / seen, 3) if seen else 0.0
+        # Baseline: one extraction call per processed turn
+        m["llm_calls_saved"] = max(processed - m["llm_calls"], 0)
+        return m
@@ -0,0 +1,266 @@
+import argparse
+import os
+import queue
+import secrets
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+
+# --------------------------------------------------
+# Shared memory-index service
+# --------------------------------------------------
+# One process owns the episodic, semantic and cache HNSW indexes
+# (and their files under data/). Web workers talk to it over a Unix
+# socket, so any number of gunicorn workers share one copy of each
+# index and nobody races on save_index.
+#
+#   python index_service.py --socket /tmp/neuromind-index.sock
+#   INDEX_SERVICE_SOCKET=/tmp/neuromind-index.sock gunicorn -w 4 app:app
+#
+# Connections unpickle whatever they receive, so both sides need the
+# same secret: INDEX_SERVICE_AUTHKEY, or else a random key the service
+# writes to INDEX_SERVICE_AUTHKEY_FILE (mode 0600) on first start and
+# workers running as the same user read. The socket itself is 0600.
+# --------------------------------------------------
+
+DEFAULT_SOCKET = "/tmp/neuromind-index.sock"
+
+# Only these methods are callable over the socket
+EXPOSED_METHODS = {
+    "episodic": {
+        "search", "search_batch",
+        "add_episode", "add_episodes", "persist",
+        "count",
+        "remove", "compact_index", "index_stats",
+        "segment_keys", "drop_segment", "assign_owner",
+        "export_snapshot", "sync_ids"
+    },
+    "semantic": {
+        "search", "search_batch",
+        "add_memory", "add_memories", "flush_support", "persist",
+        "persona_profile", "persona_profiles",
+        "nearest_similarity", "count",
+        "remove", "compact_index", "index_stats",
+        "export_snapshot", "sync_ids"
+    },
+    "cache": {
+        "lookup", "lookup_batch", "flush_hits",
+        "add", "add_batch",
+        "nearest_similarity", "count",
+        "remove", "compact_index", "index_stats",
+        "export_snapshot", "sync_ids"
+    }
+}
+
+
+class IndexServiceError(RuntimeError):
+    pass
+
+
+def _authkey_file():
+    from db import DATA_DIR
+
+    return os.getenv("INDEX_SERVICE_AUTHKEY_FILE", os.path.join(DATA_DIR, "index_service.key"))
+
+
+def _authkey(create=False):
+    """
+    INDEX_SERVICE_AUTHKEY, else the key file (generated when `create`,
+    i.e. by the service). There is no default key.
+    """
+    key = os.getenv("INDEX_SERVICE_AUTHKEY")
+    if key:
+        return key.encode()
+
+    path = _authkey_file()
+    if create:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise IndexServiceError(
+            f"No index service key: set INDEX_SERVICE_AUTHKEY or start "
+            f"index_service.py first (it writes {path})"
+        ) from None
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise IndexServiceError(f"{path} must belong to this user with mode 0600")
+
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+# ===============================
+# Server
+# ===============================
+class IndexService:
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        from episodic_memory import EpisodicMemory
+        from index_sync import create_index_sync
+        from semantic_memory import SemanticMemory
+        from semantic_cache import SemanticCache
+
+        self.socket_path = socket_path
+        self.stores = {
+            "episodic": EpisodicMemory(),
+            "semantic": SemanticMemory(),
+            "cache": SemanticCache()
+        }
+        self.sync = create_index_sync(**self.stores)
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        # Created 0600 (umask) rather than chmod-ed after bind, so there
+        # is no window where other users can connect
+        authkey = _authkey(create=True)
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(
+                self.socket_path,
+                family="AF_UNIX",
+                authkey=authkey
+            )
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+        print(f"🗂️  Index service listening on {self.socket_path}")
+        if self.sync is not None:
+            self.sync.start()
+
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, ConnectionError) as e:
+                    # A client with the wrong key must not stop the service
+                    print(f"⚠️ Index service rejected a connection: {type(e).__name__}: {e}")
+                    continue
+                threading.Thread(
+                    target=self._handle,
+                    args=(conn,),
+                    daemon=True
+                ).start()
+        finally:
+            listener.close()
+            self.stores["semantic"].support.close()
+            self.stores["cache"].hits.close()
+
+    def _handle(self, conn):
+        # Stores are thread-safe (RWLock), so one thread per connection
+        # lets searches from different workers run in parallel.
+        with conn:
+            while True:
+                try:
+                    store, method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    if method not in EXPOSED_METHODS.get(store, ()):
+                        raise IndexServiceError(
+                            f"Unknown method {store}.{method}"
+                        )
+                    result = getattr(self.stores[store], method)(
+                        *args, **kwargs
+                    )
+                    conn.send(("ok", result))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+# ===============================
+# Client
+# ===============================
+class IndexServiceClient:
+    """
+    Thread-safe client. Connections are not shareable between threads,
+    so each call borrows one from a small pool.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, pool_size=8):
+        self.socket_path = socket_path
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        return Client(
+            self.socket_path,
+            family="AF_UNIX",
+            authkey=_authkey()
+        )
+
+    def call(self, store, method, *args, **kwargs):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            conn.send((store, method, args, kwargs))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            conn.close()
+            raise
+
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+        if status == "error":
+            raise IndexServiceError(result)
+        return result
+
+
+class RemoteStore:
+    """
+    Drop-in stand-in for EpisodicMemory / SemanticMemory /
+    SemanticCache that forwards calls to the index service.
+    """
+
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, method):
+        if method not in EXPOSED_METHODS[self._name]:
+            raise AttributeError(
+                f"{self._name} store has no remote method {method!r}"
+            )
+
+        def remote_call(*args, **kwargs):
+            return self._client.call(self._name, method, *args, **kwargs)
+
+        return remote_call
+
+
+def connect_stores(socket_path=DEFAULT_SOCKET):
+    """
+    Returns (episodic, semantic, cache) proxies backed by the service.
+    """
+    client = IndexServiceClient(socket_path)
+    return (
+        RemoteStore(client, "episodic"),
+        RemoteStore(client, "semantic"),
+        RemoteStore(client, "cache")
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NeuroMind index service")
+    parser.add_argument(
+        "--socket",
+        default=os.getenv("INDEX_SERVICE_SOCKET", DEFAULT_SOCKET)
+    )
+    args = parser.parse_args()
+
+    IndexService(args.socket).serve_forever()
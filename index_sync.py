@@ -0,0 +1,361 @@
+import json
+import os
+import threading
+import time
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+from db import DATA_DIR, MONGO_DB, MONGO_URI
+
+
+# --------------------------------------------------
+# Multi-node index sync (follower mode)
+# --------------------------------------------------
+# Every node writes to the shared MongoDB but only indexes its own
+# writes. The follower applies the other nodes' changes to the local
+# indexes:
+#
+#   stream  tail a change stream (needs a replica set; a single-node
+#           replica set is enough). The resume token is saved after each
+#           batch, so a restart continues where it stopped.
+#   poll    without change streams: every `poll_interval` seconds index
+#           docs above each store's id high-water mark, plus ids below it
+#           that were reserved but had not landed yet (pending), and
+#           pick up deletes with a full reconcile every
+#           `poll_reconcile_interval` (it scans every id, so rarely).
+#   auto    stream, falling back to poll.
+#
+# Inserts a node made itself are already indexed and are skipped.
+# Enable with INDEX_SYNC=auto|stream|poll (app, or index_service.py).
+# --------------------------------------------------
+
+SYNC_STATE_PATH = os.path.join(DATA_DIR, "index_sync.json")
+
+# collection -> (store name, id field used as HNSW label)
+COLLECTIONS = {
+    "episodic_memory": ("episodic", "_id"),
+    "semantic_memory": ("semantic", "embedding_id"),
+    "semantic_cache": ("cache", "embedding_id")
+}
+
+# Fields whose change alters what is indexed (updates to counters skip)
+INDEXED_FIELDS = {"user", "user_id", "content", "type", "query"}
+
+# Resume token too old for the oplog (ChangeStreamHistoryLost,
+# ChangeStreamFatalError): restart from now and reconcile.
+HISTORY_LOST_CODES = {280, 286}
+
+# Ids are reserved before the insert lands, so ids skipped below the
+# high-water mark stay pending until they show up. Pending ids that
+# never land (failed or deleted inserts) are dropped after
+# `poll_reconcile_interval`; the reconcile covers them. A gap wider than
+# this is left to the reconcile as well.
+POLL_MAX_PENDING = 100000
+
+
+class IndexSync:
+    def __init__(
+        self,
+        episodic,
+        semantic,
+        cache,
+        db=None,
+        mode="auto",
+        poll_interval=2.0,
+        reconcile_interval=60.0,
+        poll_reconcile_interval=900.0,
+        batch_size=500,
+        state_path=SYNC_STATE_PATH
+    ):
+        self.stores = {"episodic": episodic, "semantic": semantic, "cache": cache}
+        self.db = db if db is not None else MongoClient(MONGO_URI)[MONGO_DB]
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.reconcile_interval = reconcile_interval
+        self.poll_reconcile_interval = poll_reconcile_interval
+        self.batch_size = batch_size
+        self.state_path = state_path
+        self.state = self._load_state()
+
+        # Polling and label lookups by embedding_id need an index
+        for collection, (_, field) in COLLECTIONS.items():
+            if field != "_id":
+                self.db[collection].create_index(field)
+
+        self.needs_reconcile = set()
+        self.last_reconcile = time.time()
+
+        self._stop = threading.Event()
+        self._thread = None
+        self.lock = threading.Lock()
+        self.metrics = {
+            "mode": None,
+            "batches": 0,
+            "indexed": 0,
+            "removed": 0,
+            "reconciles": 0,
+            "errors": 0,
+            "last_applied_at": None
+        }
+
+    # --------------------------------------------------
+    # Lifecycle
+    # --------------------------------------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="index-sync", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        if metrics["last_applied_at"]:
+            metrics["seconds_since_apply"] = round(time.time() - metrics["last_applied_at"], 1)
+        return metrics
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.mode in ("auto", "stream"):
+                    try:
+                        self._follow_stream()
+                        return
+                    except OperationFailure as e:
+                        if e.code in HISTORY_LOST_CODES:
+                            print("⚠️ Change stream history lost; reconciling and resuming from now")
+                            self.state.pop("resume_token", None)
+                            self.needs_reconcile.update(self.stores)
+                            self.last_reconcile = 0
+                            continue
+                        if self.mode == "stream":
+                            raise
+                        print(f"⚠️ Change streams unavailable ({e}); index sync polls instead")
+                        self.mode = "poll"
+                self._poll_loop()
+                return
+            except PyMongoError as e:
+                self._count("errors")
+                print(f"⚠️ Index sync error: {e}; retrying")
+                self._stop.wait(self.poll_interval)
+
+    # --------------------------------------------------
+    # Change stream
+    # --------------------------------------------------
+    def _follow_stream(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(COLLECTIONS)},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+        }}]
+
+        with self.db.watch(
+            pipeline,
+            resume_after=self.state.get("resume_token"),
+            max_await_time_ms=int(self.poll_interval * 1000)
+        ) as stream:
+            self._set_mode("stream")
+            while not self._stop.is_set():
+                events = []
+                while len(events) < self.batch_size:
+                    change = stream.try_next()
+                    if change is None:
+                        break
+                    events.append(change)
+
+                if events:
+                    self.apply_events(events)
+                    self.state["resume_token"] = stream.resume_token
+                    self._save_state()
+
+                self._maybe_reconcile()
+
+    def apply_events(self, events):
+        """
+        Apply one batch of change events: one sync_ids / remove call per
+        store. Semantic and cache deletes only carry the Mongo _id, not
+        the label, so they schedule a reconcile instead.
+        """
+        inserts = {name: set() for name in self.stores}
+        deletes = {name: set() for name in self.stores}
+        changed = []
+
+        for change in events:
+            name, field = COLLECTIONS[change["ns"]["coll"]]
+            op = change["operationType"]
+
+            if op == "delete":
+                if field == "_id":
+                    deletes[name].add(change["documentKey"]["_id"])
+                else:
+                    self.needs_reconcile.add(name)
+            elif op == "insert":
+                label = change["fullDocument"].get(field)
+                if label is not None:
+                    inserts[name].add(label)
+            else:
+                updated = set(change.get("updateDescription", {}).get("updatedFields", {}))
+                if op == "replace" or updated & INDEXED_FIELDS:
+                    changed.append((name, field, change["documentKey"]["_id"]))
+
+        # Re-index changed docs: drop the old entry, then add it again
+        for name, field, doc_id in changed:
+            doc = self.db[self._collection(name)].find_one({"_id": doc_id}, {field: 1})
+            if doc and doc.get(field) is not None:
+                deletes[name].add(doc[field])
+                inserts[name].add(doc[field])
+
+        indexed = removed = 0
+        for name, store in self.stores.items():
+            if deletes[name]:
+                removed += store.remove(list(deletes[name])) or 0
+            if inserts[name]:
+                indexed += store.sync_ids(list(inserts[name]))
+
+        with self.lock:
+            self.metrics["batches"] += 1
+            self.metrics["indexed"] += indexed
+            self.metrics["removed"] += removed
+            self.metrics["last_applied_at"] = time.time()
+
+    # --------------------------------------------------
+    # Polling fallback
+    # --------------------------------------------------
+    def _poll_loop(self):
+        self._set_mode("poll")
+
+        while not self._stop.is_set():
+            indexed = sum(
+                self._poll_store(collection, name, field)
+                for collection, (name, field) in COLLECTIONS.items()
+            )
+
+            self._save_state()
+            with self.lock:
+                self.metrics["batches"] += 1
+                self.metrics["indexed"] += indexed
+                self.metrics["last_applied_at"] = time.time()
+
+            # Deletes leave no trace to poll for
+            if time.time() - self.last_reconcile >= self.poll_reconcile_interval:
+                self.needs_reconcile.update(self.stores)
+            self._maybe_reconcile()
+            self._stop.wait(self.poll_interval)
+
+    def _poll_store(self, collection, name, field):
+        """
+        Index one store's new ids: those above its high-water mark and
+        pending ones that have landed since. Returns how many were
+        indexed; the store is not called when nothing is new.
+        """
+        high_water = self.state.setdefault("high_water", {})
+        # JSON state: id (as str) -> when it was first found missing
+        pending = self.state.setdefault("pending", {}).setdefault(name, {})
+        last = high_water.get(name)
+
+        if last is None:
+            # First poll: the local index is current up to here
+            top = self.db[collection].find_one({}, {field: 1}, sort=[(field, -1)])
+            high_water[name] = int(top[field]) if top and top.get(field) is not None else -1
+            return 0
+
+        query = {field: {"$gt": last}}
+        if pending:
+            query = {"$or": [query, {field: {"$in": [int(i) for i in pending]}}]}
+        found = {
+            int(doc[field])
+            for doc in self.db[collection].find(query, {field: 1})
+            if doc.get(field) is not None
+        }
+
+        now = time.time()
+        top = max(found, default=last)
+        if top - last > POLL_MAX_PENDING:
+            self.needs_reconcile.add(name)
+        else:
+            for eid in range(last + 1, top):
+                if eid not in found:
+                    pending[str(eid)] = now
+        for eid in found:
+            pending.pop(str(eid), None)
+        for eid in [i for i, since in pending.items() if now - since > self.poll_reconcile_interval]:
+            del pending[eid]
+        high_water[name] = top
+
+        return self.stores[name].sync_ids(sorted(found)) if found else 0
+
+    # --------------------------------------------------
+    # Helpers
+    # --------------------------------------------------
+    def _maybe_reconcile(self):
+        if not self.needs_reconcile or time.time() - self.last_reconcile < self.reconcile_interval:
+            return
+
+        pending, self.needs_reconcile = self.needs_reconcile, set()
+        for name in pending:
+            self.stores[name].reconcile()
+        self.last_reconcile = time.time()
+        self._count("reconciles")
+
+    def _collection(self, name):
+        return next(c for c, (store, _) in COLLECTIONS.items() if store == name)
+
+    def _set_mode(self, mode):
+        with self.lock:
+            self.metrics["mode"] = mode
+        print(f"🔄 Index sync following MongoDB ({mode})")
+
+    def _count(self, key):
+        with self.lock:
+            self.metrics[key] += 1
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f, object_hook=_decode_token)
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, default=_encode_token)
+        os.replace(tmp_path, self.state_path)
+
+
+# Resume tokens are dicts of BSON values (`_data` is a hex string on
+# current servers); bytes from older servers are stored as hex.
+def _encode_token(value):
+    if isinstance(value, bytes):
+        return {"$hex": value.hex()}
+    raise TypeError(f"Cannot store {type(value).__name__} in sync state")
+
+
+def _decode_token(obj):
+    if set(obj) == {"$hex"}:
+        return bytes.fromhex(obj["$hex"])
+    return obj
+
+
+def create_index_sync(episodic, semantic, cache):
+    """
+    IndexSync configured from INDEX_SYNC (off|auto|stream|poll),
+    INDEX_SYNC_POLL_SECONDS and INDEX_SYNC_POLL_RECONCILE_SECONDS, or
+    None when off.
+    """
+    mode = os.getenv("INDEX_SYNC", "off")
+    if mode == "off":
+        return None
+    if mode not in ("auto", "stream", "poll"):
+        raise ValueError(f"Unknown INDEX_SYNC {mode!r}")
+
+    return IndexSync(
+        episodic,
+        semantic,
+        cache,
+        mode=mode,
+        poll_interval=float(os.getenv("INDEX_SYNC_POLL_SECONDS", "2")),
+        poll_reconcile_interval=float(os.getenv("INDEX_SYNC_POLL_RECONCILE_SECONDS", "900"))
+    )
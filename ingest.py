@@ -0,0 +1,199 @@
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+
+# --------------------------------------------------
+# Bulk ingest (no HTTP, no LLM)
+# --------------------------------------------------
+# Loads episodes and pre-typed semantic memories straight into the
+# stores: texts are embedded in large batches, Mongo gets insert_many,
+# HNSW gets one add_items per batch (per month segment for episodes),
+# and BM25 / index files are built and saved once at the end.
+#
+#   python ingest.py corpus.jsonl facts.csv --user-id test_user_1
+#   python ingest.py corpus.jsonl --socket /tmp/neuromind-index.sock
+#
+# Records (JSONL objects or CSV rows with a header):
+#   episode:  user, assistant, [user_id], [timestamp ISO-8601]
+#   semantic: content, type (knowledge|persona|process), [user_id]
+# An optional `kind` field (episode|semantic) overrides detection.
+#
+# Without --socket the stores are opened in this process: stop the app
+# and index service first, they would overwrite the index files.
+# --------------------------------------------------
+
+SEMANTIC_TYPES = {"knowledge", "persona", "process"}
+
+
+def read_records(path):
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def classify(record):
+    kind = record.get("kind")
+    if kind in ("episode", "semantic"):
+        return kind
+    if record.get("user") and record.get("assistant"):
+        return "episode"
+    if record.get("content") and record.get("type") in SEMANTIC_TYPES:
+        return "semantic"
+    return None
+
+
+class Ingestor:
+    def __init__(
+        self,
+        episodic,
+        semantic,
+        embedder,
+        batch_size=2048,
+        embed_batch_size=256,
+        dedup=True,
+        default_user_id=None
+    ):
+        self.episodic = episodic
+        self.semantic = semantic
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.embed_batch_size = embed_batch_size
+        self.dedup = dedup
+        self.default_user_id = default_user_id
+
+        self.episodes = []
+        self.memories = []
+        self.counts = {"episodes": 0, "semantic": 0, "skipped": 0}
+
+    def add(self, record):
+        kind = classify(record)
+        user_id = record.get("user_id") or self.default_user_id
+
+        if kind == "episode" and record.get("user") and record.get("assistant"):
+            try:
+                timestamp = parse_timestamp(record.get("timestamp"))
+            except ValueError:
+                self.counts["skipped"] += 1
+                return
+            self.episodes.append((record["user"], record["assistant"], user_id, timestamp))
+            if len(self.episodes) >= self.batch_size:
+                self.flush_episodes()
+
+        elif kind == "semantic" and record.get("content") and record.get("type") in SEMANTIC_TYPES:
+            self.memories.append((record["content"], record["type"], user_id))
+            if len(self.memories) >= self.batch_size:
+                self.flush_memories()
+
+        else:
+            self.counts["skipped"] += 1
+
+    def flush_episodes(self):
+        if not self.episodes:
+            return
+        batch, self.episodes = self.episodes, []
+        now = datetime.utcnow()
+
+        self.episodic.add_episodes(
+            self.embedder.encode_batch([b[0] for b in batch], batch_size=self.embed_batch_size),
+            [b[0] for b in batch],
+            [b[1] for b in batch],
+            user_ids=[b[2] for b in batch],
+            timestamps=[b[3] or now for b in batch],
+            persist=False
+        )
+        self.counts["episodes"] += len(batch)
+
+    def flush_memories(self):
+        if not self.memories:
+            return
+        batch, self.memories = self.memories, []
+
+        self.semantic.add_memories(
+            self.embedder.encode_batch([b[0] for b in batch], batch_size=self.embed_batch_size),
+            [b[0] for b in batch],
+            [b[1] for b in batch],
+            [b[2] for b in batch],
+            dedup=self.dedup,
+            persist=False
+        )
+        self.counts["semantic"] += len(batch)
+
+    def finish(self):
+        self.flush_episodes()
+        self.flush_memories()
+        self.episodic.persist()
+        self.semantic.persist()
+        return self.counts
+
+
+def _open_stores(socket_path):
+    if socket_path:
+        from index_service import connect_stores
+        episodic, semantic, _ = connect_stores(socket_path)
+        return episodic, semantic
+
+    from episodic_memory import EpisodicMemory
+    from semantic_memory import SemanticMemory
+    return EpisodicMemory(), SemanticMemory()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load episodes and semantic memories")
+    parser.add_argument("paths", nargs="+", help=".jsonl or .csv files")
+    parser.add_argument("--batch-size", type=int, default=2048, help="records per insert/index batch")
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--user-id", default=None, help="for records without user_id")
+    parser.add_argument("--no-dedup", action="store_true", help="skip semantic near-duplicate checks")
+    parser.add_argument("--socket", default=os.getenv("INDEX_SERVICE_SOCKET"))
+    args = parser.parse_args()
+
+    from embeddings import get_embedder
+
+    episodic, semantic = _open_stores(args.socket)
+    ingestor = Ingestor(
+        episodic,
+        semantic,
+        get_embedder(),
+        batch_size=args.batch_size,
+        embed_batch_size=args.embed_batch_size,
+        dedup=not args.no_dedup,
+        default_user_id=args.user_id
+    )
+
+    started = time.perf_counter()
+    seen = 0
+    for path in args.paths:
+        for record in read_records(path):
+            ingestor.add(record)
+            seen += 1
+            if seen % 100000 == 0:
+                rate = seen / (time.perf_counter() - started)
+                print(f"⏳ {seen} records read ({rate:.0f}/s)")
+
+    counts = ingestor.finish()
+    elapsed = time.perf_counter() - started
+    print(
+        f"✅ Ingested {counts['episodes']} episodes and {counts['semantic']} "
+        f"semantic memories in {elapsed:.1f}s "
+        f"({seen / max(elapsed, 1e-9):.0f} records/s, {counts['skipped']} skipped)"
+    )
@@ -1,20 +1,30 @@
-import os
-from groq import Groq
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """
+    Process-wide LLMClient (provider picked by LLM_PROVIDER), created on
+    first use so importing this module stays cheap.
+    """
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from llm_client import create_llm_client
+                _client = create_llm_client()
+
+    return _client
 
 
 def call_llm(prompt: str) -> str:
-    response = client.chat.completions.create(
-        model="openai/gpt-oss-safeguard-20b",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content
+    return get_llm_client().complete(prompt)
 
 import json
 
@@ -49,3 +59,64 @@ TEXT:
         pass
 
     return None
+
+
+def _parse_json_list(raw: str):
+    """
+    Pulls the first JSON list out of a model reply
+    (tolerates ```json fences and leading prose).
+    """
+    start, end = raw.find("["), raw.rfind("]")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(raw[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, list) else None
+
+
+def extract_semantic_memories(turns):
+    """
+    Batched variant of extract_semantic_memory: one LLM call for
+    several turns. `turns` is a list of "User: ...\\nAssistant: ..."
+    strings. Returns a list of {"turn", "type", "content"} dicts.
+    """
+    if not turns:
+        return []
+
+    numbered = "\n\n".join(
+        f"[{i}]\n{text}" for i, text in enumerate(turns, 1)
+    )
+    prompt = f"""
+Below are {len(turns)} numbered conversation turns.
+For EACH turn, extract at most ONE reusable memory.
+
+Classify it as:
+- knowledge
+- persona
+- process
+
+Return a JSON list of objects with keys "turn" (the number), "type" and "content".
+Leave out turns with nothing reusable. No other text.
+
+TURNS:
+{numbered}
+"""
+    data = _parse_json_list(call_llm(prompt).strip()) or []
+
+    memories = []
+    for item in data:
+        if (
+            isinstance(item, dict)
+            and item.get("type") in {"knowledge", "persona", "process"}
+            and isinstance(item.get("content"), str)
+            and item["content"].strip()
+        ):
+            memories.append({
+                "turn": item.get("turn"),
+                "type": item["type"],
+                "content": item["content"].strip()
+            })
+
+    return memories
@@ -0,0 +1,359 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+# --------------------------------------------------
+# Resilient LLM client
+# --------------------------------------------------
+# - one provider client, reused for every call (connection pooling)
+# - per-attempt timeout
+# - retries with exponential backoff + full jitter
+# - bounded concurrency (semaphore)
+# - optional hedged request once an attempt runs past the observed p95
+# - circuit breaker so a degraded provider fails fast
+# --------------------------------------------------
+
+DEFAULT_MODEL = "openai/gpt-oss-safeguard-20b"
+DEFAULT_SYSTEM = "You are a helpful assistant."
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+class LLMUnavailable(LLMError):
+    """
+    Raised when the breaker is open or the client is saturated:
+    callers should fall back instead of waiting.
+    """
+    pass
+
+
+# ===============================
+# Providers
+# ===============================
+class GroqProvider:
+    def __init__(self, model=DEFAULT_MODEL, api_key=None, timeout=30.0):
+        from groq import Groq
+
+        self.model = model
+        # Retries are handled by LLMClient, not the SDK
+        self.client = Groq(
+            api_key=api_key or os.getenv("GROQ_API_KEY"),
+            timeout=timeout,
+            max_retries=0
+        )
+
+    def complete(self, messages, timeout):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            timeout=timeout
+        )
+        return response.choices[0].message.content
+
+
+class FakeProvider:
+    """
+    Offline provider for tests and local runs (LLM_PROVIDER=fake).
+    Latency and failure rate are configurable; `responder` maps the
+    message list to a reply.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, failure_rate=0.0, responder=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.responder = responder or (
+            lambda messages: f"[fake] {messages[-1]['content'][-200:]}"
+        )
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def complete(self, messages, timeout):
+        self.calls += 1
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        time.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise LLMTimeout(f"fake provider exceeded {timeout}s")
+        if self.random.random() < self.failure_rate:
+            raise LLMError("fake provider failure")
+        return self.responder(messages)
+
+
+# ===============================
+# Circuit Breaker
+# ===============================
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half-open after `reset_seconds`; one trial call decides
+    whether it closes again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+            self.trial_in_flight = False
+
+
+# ===============================
+# Client
+# ===============================
+class LLMClient:
+    def __init__(
+        self,
+        provider,
+        timeout=30.0,
+        max_retries=2,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        max_concurrency=8,
+        queue_timeout=None,
+        hedge=False,
+        hedge_min_samples=20,
+        breaker_threshold=5,
+        breaker_reset_seconds=30.0
+    ):
+        self.provider = provider
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = timeout if queue_timeout is None else queue_timeout
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_seconds)
+
+        # Attempts (and hedges) run here so a stuck call can be abandoned
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrency * 2,
+            thread_name_prefix="llm"
+        )
+
+        self.latencies = deque(maxlen=500)
+        self.lock = threading.Lock()
+        self.metrics = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "hedges_fired": 0,
+            "hedge_wins": 0
+        }
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    def complete(self, prompt, system=DEFAULT_SYSTEM):
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ]
+        self._count("calls")
+
+        # Fail fast while open, without queueing for a slot
+        if self.breaker.state == "open":
+            self._count("rejected")
+            raise LLMUnavailable("LLM circuit breaker is open")
+
+        # Slot before breaker.allow(): a half-open breaker hands out a
+        # single trial, and a trial taken by a call that then gave up
+        # waiting would never be recorded, keeping the breaker shut
+        if not self.semaphore.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            raise LLMUnavailable("LLM client saturated")
+
+        try:
+            if not self.breaker.allow():
+                self._count("rejected")
+                raise LLMUnavailable("LLM circuit breaker is open")
+
+            last_error = None
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    self._count("retries")
+                    time.sleep(self._backoff(attempt))
+                try:
+                    text = self._attempt(messages)
+                except LLMError as e:
+                    last_error = e
+                    continue
+                except Exception as e:
+                    last_error = LLMError(f"{type(e).__name__}: {e}")
+                    continue
+
+                self.breaker.record_success()
+                self._count("successes")
+                return text
+
+            self.breaker.record_failure()
+            self._count("failures")
+            raise last_error
+        finally:
+            self.semaphore.release()
+
+    def p95(self):
+        with self.lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[max(int(len(samples) * 0.95) - 1, 0)]
+
+    def stats(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+            samples = sorted(self.latencies)
+
+        p95 = samples[max(int(len(samples) * 0.95) - 1, 0)] if samples else None
+        metrics.update({
+            "breaker_state": self.breaker.state,
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 1) if samples else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None
+        })
+        return metrics
+
+    # --------------------------------------------------
+    # Internals
+    # --------------------------------------------------
+    def _count(self, key, n=1):
+        with self.lock:
+            self.metrics[key] += n
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform(0, min(cap, base * 2^attempt))
+        return random.uniform(
+            0,
+            min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        )
+
+    def _call_provider(self, messages):
+        start = time.perf_counter()
+        text = self.provider.complete(messages, self.timeout)
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start)
+        return text
+
+    def _hedge_delay(self):
+        with self.lock:
+            enough = len(self.latencies) >= self.hedge_min_samples
+        if not (self.hedge and enough):
+            return None
+        return self.p95()
+
+    def _attempt(self, messages):
+        deadline = time.time() + self.timeout
+        try:
+            primary = self.executor.submit(self._call_provider, messages)
+        except RuntimeError:
+            # Interpreter is exiting (atexit extraction flush): call inline
+            return self._call_provider(messages)
+        pending = {primary}
+
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None and hedge_delay < self.timeout:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                self._count("hedges_fired")
+                pending.add(self.executor.submit(self._call_provider, messages))
+
+        last_error = None
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    text = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if future is not primary:
+                    self._count("hedge_wins")
+                return text
+
+        if pending:
+            self._count("timeouts")
+            raise LLMTimeout(f"LLM call exceeded {self.timeout}s")
+        if isinstance(last_error, LLMError):
+            raise last_error
+        raise LLMError(f"{type(last_error).__name__}: {last_error}")
+
+
+# --------------------------------------------------
+# Factory (environment-driven)
+# --------------------------------------------------
+def create_llm_client():
+    provider_name = os.getenv("LLM_PROVIDER", "groq")
+    timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+
+    if provider_name == "fake":
+        provider = FakeProvider(
+            latency=float(os.getenv("LLM_FAKE_LATENCY", "0.05")),
+            failure_rate=float(os.getenv("LLM_FAKE_FAILURE_RATE", "0"))
+        )
+    elif provider_name == "groq":
+        provider = GroqProvider(
+            model=os.getenv("LLM_MODEL", DEFAULT_MODEL),
+            timeout=timeout
+        )
+    else:
+        raise ValueError(f"Unknown LLM_PROVIDER {provider_name!r}")
+
+    return LLMClient(
+        provider,
+        timeout=timeout,
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        hedge=os.getenv("LLM_HEDGE", "0") == "1",
+        breaker_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+        breaker_reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+    )
@@ -0,0 +1,43 @@
+import argparse
+import os
+
+
+# --------------------------------------------------
+# Owner for legacy episodes
+# --------------------------------------------------
+# Episodes stored before user_id existed have no owner, so they only
+# show up in searches that pass no user (never in /chat). This assigns
+# them to one user, in Mongo and in the running index:
+#
+#   python migrate_episodes.py --owner test_user_1 --dry-run
+#   python migrate_episodes.py --owner test_user_1 --socket /tmp/neuromind-index.sock
+#
+# Without --socket only this process's copy of the index is relabeled
+# (nothing is saved): app workers that hold their own stores pick the
+# new owner up at their next reconcile (INDEX_SYNC) or restart.
+# --------------------------------------------------
+
+
+def _open_episodic(socket_path):
+    if socket_path:
+        from index_service import connect_stores
+        return connect_stores(socket_path)[0]
+
+    from episodic_memory import EpisodicMemory
+    return EpisodicMemory()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign episodes without a user_id to a user")
+    parser.add_argument("--owner", required=True, help="user_id to give legacy episodes")
+    parser.add_argument("--dry-run", action="store_true", help="only count them")
+    parser.add_argument("--socket", default=os.getenv("INDEX_SERVICE_SOCKET"))
+    args = parser.parse_args()
+
+    if args.dry_run:
+        from db import db
+        legacy = db["episodic_memory"].count_documents({"user_id": None})
+        print(f"🔎 {legacy} episodes without a user_id")
+    else:
+        assigned = _open_episodic(args.socket).assign_owner(args.owner)
+        print(f"✅ Assigned {assigned} episodes to {args.owner}")
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+# --------------------------------------------------
+# Materialized persona profiles
+# --------------------------------------------------
+# Persona memories change rarely, and the persona search used a 0.10
+# threshold, i.e. it returned the profile whatever the question. Each
+# user's profile is now loaded from Mongo once (top PERSONA_PROFILE_SIZE
+# by support, seen within PERSONA_MAX_AGE_DAYS like search results) and
+# kept here until SemanticMemory indexes or removes a persona entry for
+# that user, or PERSONA_CACHE_TTL_SECONDS pass, so memories that age
+# out drop from a cached profile too. Between those the persona section,
+# which sits right after the prompt header, is byte-identical across
+# turns, so provider-side prompt caching can reuse the prefix.
+# --------------------------------------------------
+
+PERSONA_PROFILE_SIZE = int(os.getenv("PERSONA_PROFILE_SIZE", "5"))
+PERSONA_CACHE_USERS = int(os.getenv("PERSONA_CACHE_USERS", "10000"))
+# Same default as search()'s max_age_days
+PERSONA_MAX_AGE_DAYS = int(os.getenv("PERSONA_MAX_AGE_DAYS", "60"))
+PERSONA_CACHE_TTL_SECONDS = float(os.getenv("PERSONA_CACHE_TTL_SECONDS", "3600"))
+
+
+class PersonaCache:
+    """
+    user_id -> profile (list of persona hits), LRU-bounded, each
+    reloaded after `ttl` seconds.
+
+    `loader(user_id)` builds a profile. A load that an invalidation
+    for the same user overtook is returned but not cached.
+    """
+
+    def __init__(self, loader, max_users=PERSONA_CACHE_USERS, ttl=PERSONA_CACHE_TTL_SECONDS):
+        self.loader = loader
+        self.max_users = max_users
+        self.ttl = ttl
+
+        self.profiles = OrderedDict()  # user_id -> (profile, expires_at)
+        self.loading = {}  # user_id -> token of the load in flight
+        self.lock = threading.Lock()
+        self.metrics = {"hits": 0, "loads": 0, "invalidations": 0, "expired": 0}
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.profiles.get(user_id)
+            if entry is not None:
+                profile, expires_at = entry
+                if time.monotonic() < expires_at:
+                    self.profiles.move_to_end(user_id)
+                    self.metrics["hits"] += 1
+                    return profile
+                del self.profiles[user_id]
+                self.metrics["expired"] += 1
+            token = self.loading[user_id] = object()
+
+        try:
+            profile = self.loader(user_id)
+        except Exception:
+            with self.lock:
+                if self.loading.get(user_id) is token:
+                    del self.loading[user_id]
+            raise
+
+        with self.lock:
+            self.metrics["loads"] += 1
+            if self.loading.get(user_id) is token:
+                del self.loading[user_id]
+                self.profiles[user_id] = (profile, time.monotonic() + self.ttl)
+                while len(self.profiles) > self.max_users:
+                    self.profiles.popitem(last=False)
+        return profile
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.loading.pop(user_id, None)
+            if self.profiles.pop(user_id, None) is not None:
+                self.metrics["invalidations"] += 1
+
+    def stats(self):
+        with self.lock:
+            m = dict(self.metrics, users=len(self.profiles))
+        total = m["hits"] + m["loads"]
+        m["hit_rate"] = round(m["hits"] / total, 3) if total else 0.0
+        return m
@@ -0,0 +1,130 @@
+import difflib
+import os
+import threading
+import time
+from collections import OrderedDict
+from coalesce import normalize_query
+
+
+# --------------------------------------------------
+# Speculative retrieval while the user types
+# --------------------------------------------------
+# The UI posts the draft to /prefetch on a debounced input event. The
+# app embeds it and runs episodic + semantic retrieval, and keeps the
+# result for a few seconds under (session_id, user_id). When /chat
+# arrives for the same session it reuses:
+#
+#   exact    same normalized text: the embedding and the retrieval
+#   similar  difflib ratio >= min_ratio: the retrieval (the final text
+#            is embedded again, cache lookup uses that embedding)
+#
+# A /chat consumes the entry, so a reply never sees memories retrieved
+# before the previous turn was stored.
+# --------------------------------------------------
+
+
+class _Draft:
+    __slots__ = ("text", "normalized", "embedding", "retrieved", "memory_limit", "created")
+
+    def __init__(self, text, embedding, retrieved, memory_limit):
+        self.text = text
+        self.normalized = normalize_query(text)
+        self.embedding = embedding
+        self.retrieved = retrieved
+        self.memory_limit = memory_limit
+        self.created = time.time()
+
+
+class PrefetchCache:
+    def __init__(self, ttl_seconds=30.0, min_ratio=0.9, max_sessions=10000):
+        self.ttl_seconds = ttl_seconds
+        self.min_ratio = min_ratio
+        self.max_sessions = max_sessions
+
+        self.drafts = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics = {
+            "prefetches": 0,
+            "exact": 0,
+            "similar": 0,
+            "misses": 0,
+            "expired": 0
+        }
+
+    def current(self, session_id, user_id, text, memory_limit):
+        """
+        True when this exact draft is already prefetched (the input
+        event fired without a real change).
+        """
+        with self.lock:
+            draft = self.drafts.get((session_id, user_id))
+            return (
+                draft is not None
+                and draft.memory_limit == memory_limit
+                and draft.normalized == normalize_query(text)
+                and time.time() - draft.created < self.ttl_seconds
+            )
+
+    def put(self, session_id, user_id, text, embedding, retrieved, memory_limit):
+        key = (session_id, user_id)
+        with self.lock:
+            self.drafts[key] = _Draft(text, embedding, retrieved, memory_limit)
+            self.drafts.move_to_end(key)
+            while len(self.drafts) > self.max_sessions:
+                self.drafts.popitem(last=False)
+            self.metrics["prefetches"] += 1
+
+    def take(self, session_id, user_id, text, memory_limit):
+        """
+        (match, draft) for the final text, match being "exact",
+        "similar" or None. Removes the session's draft either way.
+        """
+        if not session_id:
+            return None, None
+
+        with self.lock:
+            draft = self.drafts.pop((session_id, user_id), None)
+            if draft is None:
+                self.metrics["misses"] += 1
+                return None, None
+            if time.time() - draft.created >= self.ttl_seconds:
+                self.metrics["expired"] += 1
+                return None, None
+
+        match = None
+        if draft.memory_limit == memory_limit:
+            normalized = normalize_query(text)
+            if normalized == draft.normalized:
+                match = "exact"
+            else:
+                matcher = difflib.SequenceMatcher(None, draft.normalized, normalized)
+                if matcher.quick_ratio() >= self.min_ratio and matcher.ratio() >= self.min_ratio:
+                    match = "similar"
+
+        with self.lock:
+            self.metrics[match or "misses"] += 1
+        return match, draft
+
+    def stats(self):
+        with self.lock:
+            m = dict(self.metrics)
+            m["sessions"] = len(self.drafts)
+
+        used = m["exact"] + m["similar"]
+        total = used + m["misses"] + m["expired"]
+        m["reuse_rate"] = round(used / total, 3) if total else 0.0
+        return m
+
+
+def create_prefetch_cache():
+    """
+    PREFETCH=1 (default) enables /prefetch; PREFETCH_TTL_SECONDS and
+    PREFETCH_MIN_RATIO tune reuse. None when disabled.
+    """
+    if os.getenv("PREFETCH", "1") != "1":
+        return None
+
+    return PrefetchCache(
+        ttl_seconds=float(os.getenv("PREFETCH_TTL_SECONDS", "30")),
+        min_ratio=float(os.getenv("PREFETCH_MIN_RATIO", "0.9"))
+    )
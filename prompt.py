@@ -1,4 +1,126 @@
-def build_prompt(user_input, episodic, semantic_blocks, short_term):
+import os
+import re
+
+
+# --------------------------------------------------
+# Token budget
+# --------------------------------------------------
+# Every memory section gets a share of the budget. Items are admitted
+# best-score-first; the first item that does not fit is truncated and
+# everything scored below it is dropped. Budget a section leaves unused
+# is offered to the others in SECTION_ORDER.
+# --------------------------------------------------
+DEFAULT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+
+SECTION_SHARES = {
+    "short_term": 0.20,
+    "persona": 0.10,
+    "knowledge": 0.25,
+    "process": 0.15,
+    "episodic": 0.30
+}
+
+# Earlier sections win when the same text shows up twice
+SECTION_ORDER = ["short_term", "persona", "knowledge", "process", "episodic"]
+
+MIN_TRUNCATED_TOKENS = 12
+
+PROMPT_HEADER = """You are an assistant with structured memory.
+Only use the memories below if they are directly relevant to the current question.
+Ignore unrelated memories completely."""
+
+
+# --------------------------------------------------
+# Local tokenizer
+# --------------------------------------------------
+_encoding = None
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _get_encoding():
+    """
+    tiktoken's cl100k_base when installed (close to what the provider
+    bills), otherwise None and a word/punctuation count is used.
+    """
+    global _encoding
+
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+
+    return _encoding or None
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return len(_WORD_RE.findall(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Longest whole-word prefix of `text` within `max_tokens`, plus "…".
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]) + " …") <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return " ".join(words[:lo]) + " …" if lo else ""
+
+
+def _normalize(text):
+    return " ".join(_WORD_RE.findall((text or "").lower()))
+
+
+# --------------------------------------------------
+# Section packing
+# --------------------------------------------------
+def _pack(items, budget):
+    """
+    items: [{"text", "score", ...}] in priority order.
+    Returns (kept_items, tokens_used, truncated_count).
+    """
+    kept = []
+    used = 0
+    truncated = 0
+
+    for item in items:
+        tokens = count_tokens(item["text"])
+        remaining = budget - used
+
+        if tokens <= remaining:
+            kept.append(item)
+            used += tokens
+            continue
+
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            short = truncate_to_tokens(item["text"], remaining)
+            if short:
+                kept.append(dict(item, text=short, truncated=True))
+                used += count_tokens(short)
+                truncated += 1
+        break
+
+    return kept, used, truncated
+
+
+def build_prompt(user_input, episodic, semantic_blocks, short_term, token_budget=None):
+    budget = DEFAULT_TOKEN_BUDGET if token_budget is None else token_budget
+
     # --------------------------------------------------
     # Short-term memory (working memory)
     # --------------------------------------------------
@@ -11,31 +133,118 @@ def build_prompt(user_input, episodic, semantic_blocks, short_term):
     ]
 
     # --------------------------------------------------
-    # Episodic memory
+    # Candidate items per section (priority order)
+    # --------------------------------------------------
+    candidates = {
+        # newest first, so the oldest turns are the ones dropped
+        "short_term": [
+            {"text": f'{m["role"]}: {m["content"]}', "position": i, "source": m}
+            for i, m in reversed(list(enumerate(short_term_block)))
+        ],
+        "episodic": sorted(
+            (
+                {
+                    # stored summary instead of the full answer (see episode_summary.py)
+                    "text": f'- User: {e["user"]} | Assistant: {e.get("summary") or e["assistant"]}',
+                    "score": e.get("score", 0.0),
+                    "source": e
+                }
+                for e in episodic
+            ),
+            key=lambda x: x["score"],
+            reverse=True
+        )
+    }
+
+    # ---- 🔑 TYPE-AWARE SEMANTIC MEMORY (DO NOT MIX) ----
+    for mem_type in ("persona", "knowledge", "process"):
+        candidates[mem_type] = sorted(
+            (
+                {"text": "- " + m["content"], "score": m.get("score", 0.0), "source": m}
+                for m in semantic_blocks.get(mem_type, [])
+            ),
+            key=lambda x: x["score"],
+            reverse=True
+        )
+
+    # --------------------------------------------------
+    # Cross-section dedup
     # --------------------------------------------------
+    seen = set()
+    dropped_duplicates = {name: 0 for name in SECTION_ORDER}
+
+    for name in SECTION_ORDER:
+        unique = []
+        for item in candidates[name]:
+            source = item["source"]
+            if name == "short_term":
+                keys = [_normalize(source["content"])]
+            elif name == "episodic":
+                keys = [_normalize(source["user"]), _normalize(source["assistant"])]
+            else:
+                keys = [_normalize(source["content"])]
+
+            if any(k and k in seen for k in keys):
+                dropped_duplicates[name] += 1
+                continue
+
+            seen.update(k for k in keys if k)
+            unique.append(item)
+        candidates[name] = unique
+
+    # --------------------------------------------------
+    # Budget allocation
+    # --------------------------------------------------
+    fixed_tokens = count_tokens(PROMPT_HEADER) + count_tokens(user_input) + 40
+    memory_budget = max(budget - fixed_tokens, 0)
+
+    packed = {}
+    section_budgets = {
+        name: int(memory_budget * SECTION_SHARES[name])
+        for name in SECTION_ORDER
+    }
+    for name in SECTION_ORDER:
+        packed[name] = _pack(candidates[name], section_budgets[name])
+
+    # Second pass: hand unused budget to sections that were cut short
+    spare = memory_budget - sum(used for _, used, _ in packed.values())
+    for name in SECTION_ORDER:
+        kept, used, _ = packed[name]
+        if spare <= 0:
+            break
+        if len(kept) == len(candidates[name]) and not any(
+            i.get("truncated") for i in kept
+        ):
+            continue
+        grown = _pack(candidates[name], section_budgets[name] + spare)
+        spare -= grown[1] - used
+        packed[name] = grown
+
+    # --------------------------------------------------
+    # Assemble sections
+    # --------------------------------------------------
+    persona = [i["text"][2:] for i in packed["persona"][0]]
+    knowledge = [i["text"][2:] for i in packed["knowledge"][0]]
+    process = [i["text"][2:] for i in packed["process"][0]]
+
     episodic_block = [
         {
-            "user": ep["user"],
-            "assistant": ep["assistant"],
-            "timestamp": ep["timestamp"]
+            "user": i["source"]["user"],
+            "assistant": i["source"].get("summary") or i["source"]["assistant"],
+            "timestamp": i["source"]["timestamp"]
         }
-        for ep in episodic
+        for i in packed["episodic"][0]
     ]
+    episodic_lines = [i["text"] for i in packed["episodic"][0]]
 
-    # --------------------------------------------------
-    # 🔑 FIX 3: TYPE-AWARE SEMANTIC MEMORY (DO NOT MIX)
-    # --------------------------------------------------
-    persona = [m["content"] for m in semantic_blocks.get("persona", [])]
-    knowledge = [m["content"] for m in semantic_blocks.get("knowledge", [])]
-    process = [m["content"] for m in semantic_blocks.get("process", [])]
+    recent = sorted(packed["short_term"][0], key=lambda i: i["position"])
+    short_term_lines = [i["text"] for i in recent]
 
     # --------------------------------------------------
     # Prompt assembly
     # --------------------------------------------------
     prompt = f"""
-You are an assistant with structured memory.
-Only use the memories below if they are directly relevant to the current question.
-Ignore unrelated memories completely.
+{PROMPT_HEADER}
 
 USER PERSONA:
 {chr(10).join('- ' + p for p in persona)}
@@ -47,23 +256,39 @@ KNOWN PROCESSES:
 {chr(10).join('- ' + p for p in process)}
 
 EPISODIC CONTEXT:
-{chr(10).join(
-    f'- User: {e["user"]} | Assistant: {e["assistant"]}'
-    for e in episodic_block
-)}
+{chr(10).join(episodic_lines)}
 
 RECENT CONVERSATION:
-{chr(10).join(f'{m["role"]}: {m["content"]}' for m in short_term_block)}
+{chr(10).join(short_term_lines)}
 
 CURRENT QUESTION:
 {user_input}
 """
 
-    return prompt.strip(), {
+    token_usage = {
+        name: {
+            "tokens": packed[name][1],
+            "budget": section_budgets[name],
+            "kept": len(packed[name][0]),
+            "truncated": packed[name][2],
+            "dropped": len(candidates[name]) - len(packed[name][0]),
+            "duplicates": dropped_duplicates[name]
+        }
+        for name in SECTION_ORDER
+    }
+
+    final_prompt = prompt.strip()
+
+    return final_prompt, {
         "persona": persona,
         "knowledge": knowledge,
         "process": process,
         "episodic": episodic_block,
-        "short_term": short_term_block,
-        "final_prompt": prompt.strip()
+        "short_term": [i["source"] for i in recent],
+        "token_usage": {
+            "budget": budget,
+            "total": count_tokens(final_prompt),
+            "sections": token_usage
+        },
+        "final_prompt": final_prompt
     }
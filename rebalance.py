@@ -0,0 +1,325 @@
+import argparse
+import os
+import time
+import requests
+from bson import json_util
+from concurrency import IdAllocator
+from index_sync import COLLECTIONS
+from shard_map import HashRing, ShardMap
+
+
+# --------------------------------------------------
+# Moving users between shards
+# --------------------------------------------------
+# A move copies one user's episodic, semantic and cache documents from
+# the source shard's MongoDB to the target's (new ids there), indexes
+# them on the target (sync_ids embeds only the imported texts), points
+# the routing table at the target and deletes the user on the source:
+#
+#   1. export + import          source keeps serving the user
+#   2. pin user -> target       router switches over
+#   3. export + import delta    writes that landed on the source meanwhile
+#   4. delete on source
+#
+# Shards do the Mongo / index work through admin endpoints in app.py
+# (enabled by ADMIN_TOKEN, sent as X-Admin-Token).
+#
+#   python rebalance.py users
+#   python rebalance.py move alice shard1
+#   python rebalance.py add-shard shard2 http://127.0.0.1:5003
+#   python rebalance.py drain shard2
+#
+# Short-term memory is per process and is not moved. A write still in
+# flight on the source after step 3 is lost with the delete.
+# --------------------------------------------------
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+ADMIN_TIMEOUT_SECONDS = float(os.getenv("ADMIN_TIMEOUT_SECONDS", "300"))
+
+STORES = [name for name, _ in COLLECTIONS.values()]
+
+
+# ===============================
+# Shard side (called by app.py)
+# ===============================
+def list_users(db, user_id=None):
+    """
+    {user_id: {store: document count}}
+    """
+    users = {}
+    match = [{"$match": {"user_id": user_id}}] if user_id is not None else []
+    for collection, (name, _) in COLLECTIONS.items():
+        rows = db[collection].aggregate(
+            match + [{"$group": {"_id": "$user_id", "n": {"$sum": 1}}}]
+        )
+        for row in rows:
+            if row["_id"] is not None:
+                users.setdefault(row["_id"], dict.fromkeys(STORES, 0))[name] = row["n"]
+    return users
+
+
+def export_user(db, user_id, after=None):
+    """
+    All of a user's documents, without ids. `after` ({store: id})
+    limits each store to ids above a previous export's high_water.
+    """
+    after = after or {}
+    exported = {"user_id": user_id, "stores": {}, "high_water": {}}
+
+    for collection, (name, field) in COLLECTIONS.items():
+        query = {"user_id": user_id}
+        if after.get(name) is not None:
+            query[field] = {"$gt": after[name]}
+        docs = list(db[collection].find(query).sort(field, 1))
+
+        exported["high_water"][name] = docs[-1][field] if docs else after.get(name)
+        for doc in docs:
+            doc.pop("_id", None)
+            doc.pop(field, None)
+        exported["stores"][name] = docs
+
+    return exported
+
+
+def import_user(db, stores, exported):
+    """
+    Insert exported documents under fresh ids and index them.
+    Returns {store: count}.
+    """
+    counts = {}
+    for collection, (name, field) in COLLECTIONS.items():
+        docs = exported["stores"].get(name) or []
+        if not docs:
+            counts[name] = 0
+            continue
+
+        ids = list(IdAllocator(db, collection).reserve(len(docs)))
+        for doc, new_id in zip(docs, ids):
+            doc[field] = new_id
+        db[collection].insert_many(docs)
+
+        stores[name].sync_ids(ids)
+        counts[name] = len(docs)
+    return counts
+
+
+def delete_user(db, stores, user_id):
+    """
+    Remove a user's labels from the indexes, then their documents.
+    Returns {store: deleted count}.
+    """
+    counts = {}
+    for collection, (name, field) in COLLECTIONS.items():
+        labels = [
+            doc[field]
+            for doc in db[collection].find({"user_id": user_id}, {field: 1})
+            if doc.get(field) is not None
+        ]
+        if labels:
+            stores[name].remove(labels)
+        counts[name] = db[collection].delete_many({"user_id": user_id}).deleted_count
+    return counts
+
+
+# ===============================
+# Admin client
+# ===============================
+class ShardClient:
+    def __init__(self, name, url, token=ADMIN_TOKEN, timeout=ADMIN_TIMEOUT_SECONDS):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", "X-Admin-Token": token or ""}
+
+    def _call(self, path, body):
+        r = requests.post(
+            f"{self.url}/admin/{path}",
+            data=json_util.dumps(body),
+            headers=self.headers,
+            timeout=self.timeout
+        )
+        if r.status_code != 200:
+            raise RuntimeError(f"{self.name} /admin/{path}: HTTP {r.status_code} {r.text[:200]}")
+        return json_util.loads(r.text)
+
+    def users(self, user_id=None):
+        return self._call("users", {"user_id": user_id})["users"]
+
+    def export_user(self, user_id, after=None):
+        return self._call("export_user", {"user_id": user_id, "after": after})
+
+    def import_user(self, exported):
+        return self._call("import_user", exported)["imported"]
+
+    def delete_user(self, user_id):
+        return self._call("delete_user", {"user_id": user_id})["deleted"]
+
+
+# ===============================
+# Moves
+# ===============================
+class Rebalancer:
+    def __init__(self, shard_map=None):
+        self.shard_map = shard_map or ShardMap()
+
+    def client(self, shard):
+        return ShardClient(shard, self.shard_map.url(shard))
+
+    def locate(self):
+        """
+        {user_id: shard} from what each shard actually holds.
+        """
+        located = {}
+        for shard in self.shard_map.shards:
+            for user_id in self.client(shard).users():
+                located[user_id] = shard
+        return located
+
+    def _set_override(self, user_id, shard):
+        table = self.shard_map.snapshot()
+        if shard is None:
+            table["overrides"].pop(user_id, None)
+        else:
+            table["overrides"][user_id] = shard
+        self.shard_map.save(table)
+
+    def move(self, user_id, target, pin=True, merge=False):
+        """
+        Move `user_id` from the shard routing currently points at to
+        `target`. With pin=False the override is dropped at the end
+        (target is where the ring puts the user).
+        """
+        source = self.shard_map.shard_for(user_id)
+        if source == target:
+            print(f"   {user_id}: already on {target}")
+            return None
+
+        src, dst = self.client(source), self.client(target)
+        if dst.users(user_id) and not merge:
+            raise RuntimeError(
+                f"{target} already has data for {user_id!r} "
+                f"(purge it or pass --merge)"
+            )
+
+        exported = src.export_user(user_id)
+        imported = dst.import_user(exported)
+
+        # Switch traffic (routers re-read the table within
+        # check_interval), then copy what the source took in meanwhile
+        self._set_override(user_id, target)
+        time.sleep(self.shard_map.check_interval * 2)
+        delta = src.export_user(user_id, after=exported["high_water"])
+        for name, count in dst.import_user(delta).items():
+            imported[name] += count
+
+        deleted = src.delete_user(user_id)
+        if not pin and self.shard_map.ring_shard(user_id) == target:
+            self._set_override(user_id, None)
+
+        print(f"🚚 {user_id}: {source} -> {target} {imported}")
+        return {"source": source, "target": target, "imported": imported, "deleted": deleted}
+
+    def add_shard(self, name, url, dry_run=False):
+        """
+        Add a shard to the ring and move the users it now owns. They
+        stay pinned to their old shard until their move completes.
+        """
+        located = self.locate()
+        table = self.shard_map.snapshot()
+        table["shards"][name] = url
+
+        ring = HashRing(
+            [s for s in table["shards"] if s not in table["draining"]],
+            self.shard_map.vnodes
+        )
+        moves = {
+            user_id: ring.get(user_id)
+            for user_id, shard in located.items()
+            if user_id not in table["overrides"] and ring.get(user_id) != shard
+        }
+        print(f"➕ {name}: {len(moves)} of {len(located)} users move")
+        if dry_run:
+            return moves
+
+        for user_id in moves:
+            table["overrides"][user_id] = located[user_id]
+        self.shard_map.save(table)
+
+        for user_id, target in moves.items():
+            self.move(user_id, target, pin=False)
+        return moves
+
+    def drain(self, name, dry_run=False):
+        """
+        Take a shard out of the ring, move its users to their new ring
+        shards, then drop it from the table.
+        """
+        located = self.locate()
+        table = self.shard_map.snapshot()
+        if name not in table["draining"]:
+            table["draining"].append(name)
+
+        users = [user_id for user_id, shard in located.items() if shard == name]
+        print(f"➖ {name}: {len(users)} users to move")
+        if dry_run:
+            return users
+
+        for user_id in users:
+            table["overrides"][user_id] = name
+        self.shard_map.save(table)
+
+        for user_id in users:
+            self.move(user_id, self.shard_map.ring_shard(user_id), pin=False)
+
+        table = self.shard_map.snapshot()
+        table["shards"].pop(name, None)
+        table["draining"].remove(name)
+        table["overrides"] = {u: s for u, s in table["overrides"].items() if s != name}
+        self.shard_map.save(table)
+        return users
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move users between shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("users", help="users per shard, flagging misplaced ones")
+
+    move_cmd = sub.add_parser("move")
+    move_cmd.add_argument("user_id")
+    move_cmd.add_argument("shard")
+    move_cmd.add_argument("--merge", action="store_true", help="target may already hold data for the user")
+
+    add_cmd = sub.add_parser("add-shard")
+    add_cmd.add_argument("name")
+    add_cmd.add_argument("url")
+    add_cmd.add_argument("--dry-run", action="store_true")
+
+    drain_cmd = sub.add_parser("drain")
+    drain_cmd.add_argument("name")
+    drain_cmd.add_argument("--dry-run", action="store_true")
+
+    purge_cmd = sub.add_parser("purge", help="delete a user's data on one shard")
+    purge_cmd.add_argument("user_id")
+    purge_cmd.add_argument("shard")
+
+    args = parser.parse_args()
+    rebalancer = Rebalancer()
+
+    if args.command == "users":
+        for shard in rebalancer.shard_map.shards:
+            users = rebalancer.client(shard).users()
+            print(f"{shard}: {len(users)} users")
+            for user_id, counts in sorted(users.items()):
+                routed = rebalancer.shard_map.shard_for(user_id)
+                flag = "" if routed == shard else f"  ⚠️ routed to {routed}"
+                print(f"   {user_id:<24} {counts}{flag}")
+    elif args.command == "move":
+        rebalancer.move(args.user_id, args.shard, merge=args.merge)
+    elif args.command == "add-shard":
+        rebalancer.add_shard(args.name, args.url, dry_run=args.dry_run)
+    elif args.command == "drain":
+        rebalancer.drain(args.name, dry_run=args.dry_run)
+    else:
+        deleted = rebalancer.client(args.shard).delete_user(args.user_id)
+        print(f"🗑️ {args.user_id} on {args.shard}: {deleted}")
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# --------------------------------------------------
+# Background startup
+# --------------------------------------------------
+# Heavy modules (torch, hnswlib, pymongo, langchain) are imported here,
+# inside loader threads, not at app import time. The embedding model is
+# loaded once and the three indexes load in parallel, so Flask can bind
+# and answer /ready immediately while the components warm up.
+# --------------------------------------------------
+
+
+class Runtime:
+    def __init__(
+        self,
+        index_service_socket=None,
+        short_term_k=3,
+        background_extraction=True,
+        compaction_interval_hours=0
+    ):
+        self.index_service_socket = index_service_socket
+        self.short_term_k = short_term_k
+        self.background_extraction = background_extraction
+        self.compaction_interval_hours = compaction_interval_hours
+
+        self.embedder = None
+        self.episodic = None
+        self.semantic = None
+        self.cache = None
+        self.short_term = None
+        self.extractor = None
+        self.index_sync = None
+
+        self.timings = {}
+        self.errors = {}
+        self.started_at = None
+        self.ready_at = None
+
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --------------------------------------------------
+    # Lifecycle
+    # --------------------------------------------------
+    def start(self, background=True):
+        with self._lock:
+            if self._thread is not None or self._ready.is_set():
+                return self
+            self.started_at = time.time()
+
+            if background:
+                self._thread = threading.Thread(
+                    target=self._load_all,
+                    name="runtime-startup",
+                    daemon=True
+                )
+                self._thread.start()
+                return self
+
+        self._load_all()
+        return self
+
+    @property
+    def ready(self):
+        return self._ready.is_set() and not self.errors
+
+    def wait_ready(self, timeout=None):
+        self._ready.wait(timeout)
+        return self.ready
+
+    def shutdown(self):
+        """
+        Flush work that is buffered in memory (pending extractions,
+        semantic support increments, cache hit counts).
+        """
+        if self.index_sync is not None:
+            self.index_sync.stop(timeout=5)
+        if self.extractor is not None:
+            self.extractor.close()
+        if self.semantic is not None and not self.index_service_socket:
+            self.semantic.support.close()
+        if self.cache is not None and not self.index_service_socket:
+            self.cache.hits.close()
+
+    # --------------------------------------------------
+    # Loaders
+    # --------------------------------------------------
+    def _timed(self, name, fn):
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        except Exception as e:
+            self.errors[name] = f"{type(e).__name__}: {e}"
+            print(f"❌ Startup step '{name}' failed: {e}")
+            return None
+        finally:
+            self.timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+    def _load_embedder(self):
+        from embeddings import get_embedder
+        return get_embedder()
+
+    def _load_episodic(self):
+        from episodic_memory import EpisodicMemory
+        return EpisodicMemory()
+
+    def _load_semantic(self):
+        from semantic_memory import SemanticMemory
+        return SemanticMemory()
+
+    def _load_cache(self):
+        from semantic_cache import SemanticCache
+        return SemanticCache()
+
+    def _load_short_term(self):
+        from short_term_memory import ShortTermMemory
+        return ShortTermMemory(k=self.short_term_k)
+
+    def _load_all(self):
+        try:
+            steps = {
+                "embedder": self._load_embedder,
+                "short_term": self._load_short_term
+            }
+
+            if self.index_service_socket:
+                from index_service import connect_stores
+                self.episodic, self.semantic, self.cache = self._timed(
+                    "index_service",
+                    lambda: connect_stores(self.index_service_socket)
+                ) or (None, None, None)
+            else:
+                steps.update({
+                    "episodic": self._load_episodic,
+                    "semantic": self._load_semantic,
+                    "cache": self._load_cache
+                })
+
+            with ThreadPoolExecutor(max_workers=len(steps)) as pool:
+                futures = {
+                    name: pool.submit(self._timed, name, fn)
+                    for name, fn in steps.items()
+                }
+                for name, future in futures.items():
+                    setattr(self, name, future.result())
+
+            if self.semantic is not None and self.embedder is not None:
+                from extraction import ExtractionPipeline
+                self.extractor = ExtractionPipeline(
+                    self.semantic,
+                    self.embedder,
+                    cache=self.cache,
+                    background=self.background_extraction
+                )
+
+            # With an index service, the service runs sync itself
+            if not self.index_service_socket and not self.errors:
+                from index_sync import create_index_sync
+                self.index_sync = create_index_sync(self.episodic, self.semantic, self.cache)
+                if self.index_sync is not None:
+                    self.index_sync.start()
+
+            # With an index service, run compaction.py against it instead
+            if self.compaction_interval_hours and not self.index_service_socket and not self.errors:
+                threading.Thread(
+                    target=self._compaction_loop,
+                    name="compaction",
+                    daemon=True
+                ).start()
+
+        finally:
+            self.ready_at = time.time()
+            self._ready.set()
+            print(self.format_report())
+
+    def _compaction_loop(self):
+        from compaction import Compactor, format_report
+
+        compactor = Compactor(self.episodic, self.semantic, self.cache)
+        while True:
+            time.sleep(self.compaction_interval_hours * 3600)
+            try:
+                print(format_report(compactor.run()))
+            except Exception as e:
+                print(f"⚠️ Compaction failed: {e}")
+
+    # --------------------------------------------------
+    # Reporting
+    # --------------------------------------------------
+    def report(self):
+        total = None
+        if self.started_at and self.ready_at:
+            total = round((self.ready_at - self.started_at) * 1000, 1)
+
+        return {
+            "ready": self.ready,
+            "loading": self._thread is not None and not self._ready.is_set(),
+            "total_ms": total,
+            "steps_ms": dict(self.timings),
+            "errors": dict(self.errors)
+        }
+
+    def format_report(self):
+        report = self.report()
+        lines = [f"⏱️ Startup finished in {report['total_ms']} ms"]
+        for name, ms in sorted(
+            report["steps_ms"].items(),
+            key=lambda x: x[1],
+            reverse=True
+        ):
+            lines.append(f"   {name:<14} {ms:>10} ms")
+        for name, error in report["errors"].items():
+            lines.append(f"   ❌ {name}: {error}")
+        return "\n".join(lines)
+
+
+def create_runtime(background_extraction=True):
+    return Runtime(
+        index_service_socket=os.getenv("INDEX_SERVICE_SOCKET"),
+        background_extraction=background_extraction,
+        compaction_interval_hours=float(os.getenv("COMPACTION_INTERVAL_HOURS", "0"))
+    )
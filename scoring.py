@@ -0,0 +1,120 @@
+import json
+import os
+from datetime import datetime
+import numpy as np
+
+
+# --------------------------------------------------
+# Vectorized memory scoring
+# --------------------------------------------------
+# Candidate docs are turned into NumPy columns once (id, age in days,
+# support count); every query row is then scored with one array formula
+# and only the top-k survivors are turned back into result dicts.
+#
+#   vector_score = similarity
+#                  - min(age_days * recency_per_day, recency_cap)
+#                  + min(support * support_per_count, support_cap)
+#
+# Weights live in the dicts below (override with SCORING_EPISODIC /
+# SCORING_SEMANTIC as JSON), not in the search loops.
+# --------------------------------------------------
+
+
+def load_scoring(name, defaults):
+    """
+    Defaults updated with the JSON object in SCORING_<NAME>, if set.
+    """
+    weights = dict(defaults)
+    override = os.getenv(f"SCORING_{name.upper()}")
+    if override:
+        weights.update(json.loads(override))
+    return weights
+
+
+EPISODIC_SCORING = {
+    "recency_per_day": 0.02,
+    "recency_cap": 0.3,
+    "support_per_count": 0.0,
+    "support_cap": 0.0
+}
+
+SEMANTIC_SCORING = {
+    "recency_per_day": 0.015,
+    "recency_cap": 0.3,
+    "support_per_count": 0.05,
+    "support_cap": 0.25,
+    "alpha": 0.7,  # vector vs BM25 weight in "linear" fusion
+    "fusion": "linear",  # or "rrf"
+    "rrf_k": 60
+}
+
+EPISODIC_SCORING = load_scoring("episodic", EPISODIC_SCORING)
+SEMANTIC_SCORING = load_scoring("semantic", SEMANTIC_SCORING)
+
+
+class ScoreTable:
+    """
+    Column view of a set of Mongo docs. `lookup` maps an HNSW label
+    matrix to row positions in one vectorized step.
+    """
+
+    def __init__(self, docs, id_field, time_field, support_field=None, now=None):
+        docs = sorted(docs, key=lambda d: d[id_field])
+        now = np.datetime64(now or datetime.utcnow(), "us")
+
+        self.docs = docs
+        self.ids = np.array([d[id_field] for d in docs], dtype=np.int64)
+
+        timestamps = np.array([d[time_field] for d in docs], dtype="datetime64[us]")
+        self.age_days = np.floor((now - timestamps) / np.timedelta64(1, "D"))
+
+        if support_field:
+            self.support = np.array(
+                [d.get(support_field, 1) for d in docs],
+                dtype=np.float32
+            )
+        else:
+            self.support = np.zeros(len(docs), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def lookup(self, labels):
+        """
+        Returns (positions, found) with the shape of `labels`.
+        positions are only meaningful where found is True.
+        """
+        labels = np.asarray(labels, dtype=np.int64)
+        if not len(self.ids):
+            return np.zeros(labels.shape, dtype=np.int64), np.zeros(labels.shape, dtype=bool)
+
+        pos = np.searchsorted(self.ids, labels)
+        pos = np.minimum(pos, len(self.ids) - 1)
+        return pos, self.ids[pos] == labels
+
+    def column(self, field, positions):
+        return np.array([self.docs[p].get(field) for p in positions.ravel()],
+                        dtype=object).reshape(positions.shape)
+
+
+def vector_scores(similarity, age_days, support, weights):
+    recency = np.minimum(age_days * weights["recency_per_day"], weights["recency_cap"])
+    boost = np.minimum(support * weights["support_per_count"], weights["support_cap"])
+    return similarity - recency + boost
+
+
+def top_k(scores, k, mask=None):
+    """
+    Indices of the k highest scores (where mask is True), best first.
+    argpartition keeps this O(n) + O(k log k) instead of a full sort.
+    """
+    candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(scores))
+    if k <= 0 or not len(candidates):
+        return candidates[:0]
+
+    values = scores[candidates]
+    if len(candidates) > k:
+        part = np.argpartition(-values, k - 1)[:k]
+        candidates, values = candidates[part], values[part]
+
+    return candidates[np.argsort(-values, kind="stable")]
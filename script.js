@@ -36,6 +36,16 @@ document.addEventListener("DOMContentLoaded", function () {
   let sessionStartTime = Date.now();
   let currentTheme = localStorage.getItem("theme") || "light";
 
+  // One id per tab: /chat reuses retrieval that /prefetch ran for
+  // this session's draft
+  const sessionId = sessionStorage.getItem("session_id") || newSessionId();
+  sessionStorage.setItem("session_id", sessionId);
+
+  const PREFETCH_DELAY_MS = 300;
+  const PREFETCH_MIN_CHARS = 8;
+  let prefetchTimer = null;
+  let lastPrefetched = "";
+
   let settings = {
     autoScroll: true,
     showTimestamps: true,
@@ -82,6 +92,8 @@ document.addEventListener("DOMContentLoaded", function () {
     totalMessages++;
     updateMessageCount();
 
+    clearTimeout(prefetchTimer);
+    lastPrefetched = "";
     messageInput.value = "";
     handleInputChange();
     showTypingIndicator();
@@ -93,7 +105,9 @@ document.addEventListener("DOMContentLoaded", function () {
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({
         message: message,
-        memory_limit: settings.memoryLimit
+        memory_limit: settings.memoryLimit,
+        session_id: sessionId,
+        verbose: true
       }),
     })
       .then(res => res.json())
@@ -223,6 +237,34 @@ ${context.final_prompt || ""}
 
   function handleInputChange() {
     charCount.textContent = messageInput.value.length;
+    schedulePrefetch();
+  }
+
+  // ================= PREFETCH =================
+  // Debounced: retrieval for the draft runs while the user is still
+  // typing. Best effort, errors are ignored.
+  function schedulePrefetch() {
+    clearTimeout(prefetchTimer);
+    prefetchTimer = setTimeout(function () {
+      const draft = messageInput.value.trim();
+      if (draft.length < PREFETCH_MIN_CHARS || draft === lastPrefetched || isTyping) return;
+      lastPrefetched = draft;
+
+      fetch("/prefetch", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          message: draft,
+          memory_limit: settings.memoryLimit,
+          session_id: sessionId
+        }),
+      }).catch(function () {});
+    }, PREFETCH_DELAY_MS);
+  }
+
+  function newSessionId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
   }
 
   function toggleTheme() {
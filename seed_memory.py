@@ -1,7 +1,10 @@
 import requests
+import sys
 import time
 
 BASE_URL = "http://localhost:5000/chat"
+BATCH_URL = "http://localhost:5000/chat/batch"
+BATCH_SIZE = 32
 
 PAYLOAD_BASE = {
     "user_id": "test_user_1",
@@ -186,9 +189,38 @@ def send_query(text):
     return response.json()
 
 
+def send_batch(texts):
+    payload = {
+        "memory_limit": PAYLOAD_BASE["memory_limit"],
+        "items": [
+            {"user_id": PAYLOAD_BASE["user_id"], "message": text}
+            for text in texts
+        ]
+    }
+    response = requests.post(BATCH_URL, json=payload, timeout=600)
+    response.raise_for_status()
+    return response.json()["results"]
+
+
+def seed_batched(queries):
+    for start in range(0, len(queries), BATCH_SIZE):
+        chunk = queries[start:start + BATCH_SIZE]
+        print(f"📦 Sending items {start + 1}-{start + len(chunk)}")
+
+        for query, result in zip(chunk, send_batch(chunk)):
+            print(f"   {query}")
+            print(f"   cache_hit: {result.get('cache_hit')} | "
+                  f"memory_count: {result.get('memory_count')}")
+
+
 if __name__ == "__main__":
     print("🚀 Seeding memory system...\n")
 
+    if "--batch" in sys.argv:
+        seed_batched(SEED_QUERIES)
+        print("✅ Memory seeding complete.")
+        sys.exit(0)
+
     for i, query in enumerate(SEED_QUERIES, 1):
         print(f"➡️  [{i}] {query}")
         result = send_query(query)
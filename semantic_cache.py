@@ -1,37 +1,95 @@
 import hnswlib
 import numpy as np
 import os
+from collections import Counter
 from datetime import datetime
-from pymongo import MongoClient
-from embeddings import EmbeddingModel
+from pymongo import MongoClient, UpdateOne
+from db import DATA_DIR, MONGO_DB, MONGO_URI
+from embeddings import get_embedder
+from concurrency import RWLock, IdAllocator, save_index_atomic
+from concurrency import ensure_capacity, index_stats, rebuild_index
+from concurrency import RECONCILE_ON_START, diff_index, mark_deleted_many
+from snapshot import clear_snapshot_state, read_snapshot_state, write_state
+from stats_buffer import StatsBuffer
+
+INDEX_PATH = os.path.join(DATA_DIR, "cache_hnsw.index")
 
 
 class SemanticCache:
-    def __init__(self, dim=384, max_elements=5000):
-        self.index_path = "data/cache_hnsw.index"
+    def __init__(self, dim=384, max_elements=5000, embedder=None):
+        self.index_path = INDEX_PATH
 
         # ---- MongoDB ----
-        self.client = MongoClient("mongodb://localhost:27017")
-        self.db = self.client["memory_chatbot"]
+        self.client = MongoClient(MONGO_URI)
+        self.db = self.client[MONGO_DB]
         self.collection = self.db["semantic_cache"]
+        # Lookups and buffered counter writes go by embedding_id
+        self.collection.create_index("embedding_id")
 
         # ---- Embedder (needed for rebuild) ----
-        self.embedder = EmbeddingModel()
+        # Only needed when rebuilding; the shared model is loaded lazily.
+        self.embedder = embedder
+
+        # ---- Concurrency ----
+        self.lock = RWLock()
+        self.ids = IdAllocator(self.db, "semantic_cache")
+
+        # ---- Buffered hit_count / last_used: embedding_id -> hits ----
+        self.hits = StatsBuffer(self._write_hits, name="cache-hits")
 
         # ---- HNSW ----
         self.index = hnswlib.Index(space="cosine", dim=dim)
 
+        # Live labels, embedding_id -> user_id (Mongo is the source of
+        # truth). hnswlib has no deleted count, and knn_query fails when
+        # k exceeds live items. `users` is the inverse, user_id -> set
+        # of labels, used as the knn_query filter so other users' entries
+        # never crowd out the caller's. After `snapshot.py import` they
+        # come from the bundle.
+        snapshot = read_snapshot_state("cache")
+        if snapshot and isinstance(snapshot["labels"], dict):
+            self.labels = snapshot["labels"]
+        else:
+            self.labels = {
+                doc["embedding_id"]: doc.get("user_id")
+                for doc in self.collection.find({}, {"embedding_id": 1, "user_id": 1})
+                if doc.get("embedding_id") is not None
+            }
+        self._rebuild_users()
+
+        loaded = False
         if os.path.exists(self.index_path):
             try:
                 self.index.load_index(self.index_path)
                 self.next_id = self.index.get_current_count()
+                loaded = True
+                if not snapshot:
+                    # Entries a stale file lacks are left to reconcile /
+                    # catch-up (a filtered knn_query must not count them)
+                    indexed = set(self.index.get_ids_list())
+                    self.labels = {l: u for l, u in self.labels.items() if l in indexed}
+                    self._rebuild_users()
                 print(f"✅ Loaded Semantic Cache ({self.next_id} items)")
             except RuntimeError:
                 print("⚠️ Corrupted Cache index detected. Rebuilding...")
+                snapshot, loaded = None, False
                 self._rebuild_from_mongo(max_elements)
         else:
+            snapshot = None
             self._rebuild_from_mongo(max_elements)
 
+        if snapshot:
+            added = self.catch_up(snapshot["high_water"])
+            print(f"✅ Cache snapshot caught up ({added} newer entries)")
+            clear_snapshot_state("cache")
+
+        if loaded and RECONCILE_ON_START:
+            report = self.reconcile()
+            if any(report.values()):
+                print(f"🩹 Cache index reconciled with MongoDB: {report}")
+
+        self.ids.ensure_at_least(self.next_id)
+
     # --------------------------------------------------
     # REBUILD CACHE INDEX FROM MONGODB
     # --------------------------------------------------
@@ -45,80 +103,345 @@ class SemanticCache:
         )
         self.next_id = 0
 
-        for doc in self.collection.find():
+        cids, queries, user_ids = [], [], []
+        for doc in self.collection.find({}, {"embedding_id": 1, "query": 1, "user_id": 1}):
             cid = doc.get("embedding_id")
             query = doc.get("query")
 
             if cid is None or not query:
                 continue
 
-            embedding = self.embedder.encode(query)
+            cids.append(cid)
+            queries.append(query)
+            user_ids.append(doc.get("user_id"))
 
-            self.index.add_items(
-                np.array([embedding]),
-                np.array([cid])
-            )
+        if cids:
+            embeddings = (self.embedder or get_embedder()).encode_batch(queries)
+            ensure_capacity(self.index, len(cids))
+            self.index.add_items(embeddings, np.array(cids))
+            self.next_id = max(cids) + 1
 
-            self.next_id = max(self.next_id, cid + 1)
+        self.labels = dict(zip(cids, user_ids))
+        self._rebuild_users()
 
-        os.makedirs("data", exist_ok=True)
-        self.index.save_index(self.index_path)
+        save_index_atomic(self.index, self.index_path)
 
         print(f"✅ Semantic Cache rebuilt with {self.next_id} items")
 
     # --------------------------------------------------
-    # LOOKUP
+    # SNAPSHOT EXPORT + CATCH-UP (snapshot.py)
     # --------------------------------------------------
-    def lookup(self, embedding, user_id, similarity_threshold=0.90):
-        if self.index.get_current_count() == 0:
-            return None
+    def export_snapshot(self, directory):
+        with self.lock.read():
+            self.index.save_index(os.path.join(directory, "index.bin"))
+            high_water = max(self.labels, default=-1)
+            write_state(os.path.join(directory, "state.pkl"), {
+                "high_water": high_water,
+                "labels": self.labels
+            })
+            return {"high_water": high_water, "count": len(self.labels)}
 
-        labels, distances = self.index.knn_query(
-            np.array([embedding]),
-            k=min(3, self.index.get_current_count())
+    def catch_up(self, high_water):
+        """
+        Index cache entries newer than `high_water` (embeds only those).
+        """
+        return self._index_from_mongo({"embedding_id": {"$gt": int(high_water)}})
+
+    def sync_ids(self, embedding_ids):
+        """
+        Index these entries unless already indexed (index_sync.py).
+        """
+        return self._index_from_mongo(
+            {"embedding_id": {"$in": [int(i) for i in embedding_ids]}}
         )
 
-        for idx, dist in zip(labels[0], distances[0]):
-            similarity = 1 - dist
-            if similarity < similarity_threshold:
-                continue
+    def _index_from_mongo(self, query):
+        docs = [
+            doc for doc in self.collection.find(query, {"embedding_id": 1, "query": 1, "user_id": 1})
+            if doc.get("query") and doc["embedding_id"] not in self.labels
+        ]
+        if not docs:
+            return 0
 
-            doc = self.collection.find_one({
-                "embedding_id": int(idx),
-                "user_id": user_id
-            })
+        embeddings = (self.embedder or get_embedder()).encode_batch(
+            [doc["query"] for doc in docs]
+        )
+        cids = [doc["embedding_id"] for doc in docs]
+
+        with self.lock.write():
+            ensure_capacity(self.index, len(cids))
+            self.index.add_items(embeddings, np.array(cids))
+            for doc in docs:
+                self._set_label(doc["embedding_id"], doc.get("user_id"))
+            self.next_id = max(self.next_id, max(cids) + 1)
+            save_index_atomic(self.index, self.index_path)
+
+        return len(docs)
 
-            if doc:
-                self.collection.update_one(
-                    {"_id": doc["_id"]},
-                    {
-                        "$inc": {"hit_count": 1},
-                        "$set": {"last_used": datetime.utcnow()}
-                    }
+    # --------------------------------------------------
+    # RECONCILE WITH MONGODB (startup consistency check)
+    # --------------------------------------------------
+    def reconcile(self):
+        """
+        Embed only the cached queries the index lacks, mark orphaned
+        labels deleted and fix next_id (see SemanticMemory.reconcile).
+        """
+        expected = {
+            doc["embedding_id"]: doc.get("user_id")
+            for doc in self.collection.find(
+                {"embedding_id": {"$ne": None}, "query": {"$nin": [None, ""]}},
+                {"embedding_id": 1, "user_id": 1}
+            )
+        }
+
+        with self.lock.read():
+            missing, extra = diff_index(self.index, set(expected))
+            before = set(self.labels)
+
+        docs = list(self.collection.find(
+            {"embedding_id": {"$in": list(missing)}},
+            {"embedding_id": 1, "query": 1}
+        )) if missing else []
+        embeddings = (self.embedder or get_embedder()).encode_batch(
+            [doc["query"] for doc in docs]
+        ) if docs else None
+
+        with self.lock.write():
+            orphans = mark_deleted_many(self.index, extra)
+            if docs:
+                ensure_capacity(self.index, len(docs))
+                self.index.add_items(embeddings, np.array([doc["embedding_id"] for doc in docs]))
+            # keep entries added while Mongo was being read
+            labels = dict(expected)
+            labels.update((l, u) for l, u in self.labels.items() if l not in before)
+            relabeled = len(self.labels.keys() ^ labels.keys())
+            self.labels = labels
+            self._rebuild_users()
+            self.next_id = max(self.next_id, max(set(expected) | extra, default=-1) + 1)
+            if docs or orphans:
+                save_index_atomic(self.index, self.index_path)
+
+        self.ids.ensure_at_least(self.next_id)
+        return {"missing": len(missing), "orphans": orphans, "relabeled": relabeled}
+
+    # --------------------------------------------------
+    # LOOKUP
+    # --------------------------------------------------
+    def lookup(self, embedding, user_id, similarity_threshold=0.90, count_hits=True):
+        return self.lookup_batch(
+            [embedding],
+            [user_id],
+            similarity_threshold=similarity_threshold,
+            count_hits=count_hits
+        )[0]
+
+    # --------------------------------------------------
+    # BATCH LOOKUP (ONE knn_query PER USER + ONE MONGO FETCH)
+    # --------------------------------------------------
+    def lookup_batch(self, embeddings, user_ids, similarity_threshold=0.90, count_hits=True):
+        """
+        Returns one cached response (or None) per input row, in order.
+        count_hits=False leaves hit_count alone (speculative lookups).
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+
+        by_user = {}
+        for row, user_id in enumerate(user_ids):
+            by_user.setdefault(user_id, []).append(row)
+
+        # row -> [(label, similarity)], the user's own entries only
+        candidates = [[] for _ in range(len(embeddings))]
+        with self.lock.read():
+            for user_id, rows in by_user.items():
+                scope = self.users.get(user_id)
+                if not scope:
+                    continue
+                labels, distances = self.index.knn_query(
+                    embeddings[rows],
+                    k=min(3, len(scope)),
+                    filter=scope.__contains__
                 )
-                return doc["response"]
+                for row, row_labels, row_dists in zip(rows, labels, distances):
+                    candidates[row] = [
+                        (int(idx), 1 - float(dist))
+                        for idx, dist in zip(row_labels, row_dists)
+                        if 1 - dist >= similarity_threshold
+                    ]
 
-        return None
+        candidate_ids = {idx for row in candidates for idx, _ in row}
+        docs = {
+            doc["embedding_id"]: doc
+            for doc in self.collection.find(
+                {"embedding_id": {"$in": list(candidate_ids)}},
+                {"embedding_id": 1, "user_id": 1, "response": 1}
+            )
+        } if candidate_ids else {}
+
+        responses = []
+        hit_ids = []
+
+        for row, row_candidates in enumerate(candidates):
+            response = None
+
+            for idx, _ in row_candidates:
+                doc = docs.get(idx)
+                if doc and doc["user_id"] == user_ids[row]:
+                    hit_ids.append(doc["embedding_id"])
+                    response = doc["response"]
+                    break
+
+            responses.append(response)
+
+        # Counters are written in the background (stats_buffer.py)
+        if count_hits:
+            self.hits.add_many(Counter(hit_ids))
+
+        return responses
+
+    def flush_hits(self):
+        """
+        Write buffered hit counts now (shutdown, compaction).
+        """
+        return self.hits.flush()
+
+    def _write_hits(self, pending):
+        result = self.collection.bulk_write([
+            UpdateOne(
+                {"embedding_id": cid},
+                {
+                    "$inc": {"hit_count": n},
+                    "$max": {"last_used": when}
+                }
+            )
+            for cid, (n, when) in pending.items()
+        ], ordered=False)
+        return result.modified_count
+
+    # --------------------------------------------------
+    # NEAREST CACHED QUERY (novelty check)
+    # --------------------------------------------------
+    def nearest_similarity(self, embedding, user_id):
+        """
+        Highest cosine similarity between `embedding` and a cached query
+        of `user_id`, without touching hit counters. Other users'
+        entries are filtered out inside HNSW, not after the top k.
+        """
+        with self.lock.read():
+            scope = self.users.get(user_id)
+            if not scope:
+                return 0.0
+            _, distances = self.index.knn_query(
+                np.array([embedding]),
+                k=1,
+                filter=scope.__contains__
+            )
+
+        return 1 - float(distances[0][0])
 
     # --------------------------------------------------
     # ADD TO CACHE
     # --------------------------------------------------
     def add(self, embedding, user_id, query, response):
-        cid = self.next_id
+        self.add_batch([embedding], [user_id], [query], [response])
 
-        self.index.add_items(
-            np.array([embedding]),
-            np.array([cid])
-        )
+    def add_batch(self, embeddings, user_ids, queries, responses):
+        """
+        Cache many (query, response) pairs with one id reservation,
+        one insert_many, one add_items and one index save.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(embeddings) == 0:
+            return []
+
+        cids = list(self.ids.reserve(len(embeddings)))
+        now = datetime.utcnow()
+
+        self.collection.insert_many([
+            {
+                "embedding_id": cid,
+                "user_id": user_id,
+                "query": query,
+                "response": response,
+                "hit_count": 1,
+                "last_used": now
+            }
+            for cid, user_id, query, response
+            in zip(cids, user_ids, queries, responses)
+        ])
+
+        with self.lock.write():
+            ensure_capacity(self.index, len(cids))
+            self.index.add_items(embeddings, np.array(cids))
+            for cid, user_id in zip(cids, user_ids):
+                self._set_label(cid, user_id)
+            self.next_id = max(self.next_id, cids[-1] + 1)
+            save_index_atomic(self.index, self.index_path)
+
+        return cids
+
+    # --------------------------------------------------
+    # LABEL OWNERS (caller holds the write lock)
+    # --------------------------------------------------
+    def _set_label(self, label, user_id):
+        self.labels[label] = user_id
+        self.users.setdefault(user_id, set()).add(label)
+
+    def _drop_label(self, label):
+        user_id = self.labels.pop(label)
+        scope = self.users.get(user_id)
+        if scope is not None:
+            scope.discard(label)
+            if not scope:
+                del self.users[user_id]
+
+    def _rebuild_users(self):
+        self.users = {}
+        for label, user_id in self.labels.items():
+            self.users.setdefault(user_id, set()).add(label)
+
+    # --------------------------------------------------
+    # COUNT
+    # --------------------------------------------------
+    def count(self):
+        with self.lock.read():
+            return len(self.labels)
+
+    # --------------------------------------------------
+    # REMOVE + COMPACT (used by compaction.py)
+    # --------------------------------------------------
+    def remove(self, embedding_ids):
+        """
+        Mark cache entries deleted in HNSW. Mongo docs are deleted by
+        the caller afterwards. Returns how many labels were removed.
+        """
+        with self.lock.write():
+            removed = {int(i) for i in embedding_ids} & self.labels.keys()
+            for label in removed:
+                self.index.mark_deleted(label)
+                self._drop_label(label)
+            self.hits.discard(removed)
+
+            if removed:
+                save_index_atomic(self.index, self.index_path)
+        return len(removed)
+
+    def fragmentation(self):
+        total = self.index.get_current_count()
+        return 1 - len(self.labels) / total if total else 0.0
+
+    def compact_index(self, min_fragmentation=0.0):
+        """
+        Rebuild HNSW without deleted slots (from stored vectors) when
+        more than `min_fragmentation` of it is deleted.
+        """
+        with self.lock.write():
+            total = self.index.get_current_count()
+            if total and 1 - len(self.labels) / total > min_fragmentation:
+                self.index = rebuild_index(self.index, self.labels)
+                save_index_atomic(self.index, self.index_path)
 
-        self.collection.insert_one({
-            "embedding_id": cid,
-            "user_id": user_id,
-            "query": query,
-            "response": response,
-            "hit_count": 1,
-            "last_used": datetime.utcnow()
-        })
-
-        self.next_id += 1
-        self.index.save_index(self.index_path)
+    def index_stats(self):
+        with self.lock.read():
+            return index_stats(self.index, len(self.labels))
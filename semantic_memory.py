@@ -1,11 +1,31 @@
 import hnswlib
+import math
 import numpy as np
 import os
 import re
-from datetime import datetime
-from pymongo import MongoClient
+import threading
+from datetime import datetime, timedelta
+from pymongo import MongoClient, UpdateOne
+from db import DATA_DIR, MONGO_DB, MONGO_URI
 from rank_bm25 import BM25Okapi
-from embeddings import EmbeddingModel
+from embeddings import get_embedder
+from concurrency import RWLock, IdAllocator, save_index_atomic
+from concurrency import ensure_capacity, index_stats, rebuild_index
+from concurrency import RECONCILE_ON_START, diff_index, mark_deleted_many
+from scoring import SEMANTIC_SCORING, ScoreTable, vector_scores
+from snapshot import clear_snapshot_state, read_snapshot_state, write_state
+from scoring import top_k as select_top_k
+from stats_buffer import StatsBuffer
+from persona_cache import PERSONA_MAX_AGE_DAYS, PERSONA_PROFILE_SIZE, PersonaCache
+
+
+INDEX_PATH = os.path.join(DATA_DIR, "semantic_hnsw.index")
+
+# Reinforcements of existing memories are buffered (stats_buffer.py)
+# and written in one bulk_write once this many are pending, or every
+# SUPPORT_FLUSH_SECONDS.
+SUPPORT_FLUSH_MAX = 100
+SUPPORT_FLUSH_SECONDS = float(os.getenv("SEMANTIC_SUPPORT_FLUSH_SECONDS", "5"))
 
 
 # -------------------------------
@@ -15,54 +35,150 @@ def tokenize(text: str):
     return re.findall(r"\w+", text.lower())
 
 
+class LuceneBM25(BM25Okapi):
+    """
+    Okapi BM25 with Lucene's idf, log(1 + (N - n + 0.5) / (n + 0.5)).
+    rank_bm25's default idf goes negative for terms in more than half
+    the documents, which is common in small per-type corpora and
+    breaks per-query normalization.
+    """
+
+    def _calc_idf(self, nd):
+        for word, freq in nd.items():
+            self.idf[word] = math.log(1 + (self.corpus_size - freq + 0.5) / (freq + 0.5))
+
+
 class BM25Index:
+    """
+    BM25 over one memory type. Every document keeps its embedding_id
+    (the HNSW label) and owner, so lexical hits can be fused with
+    vector hits by id.
+    """
+
     def __init__(self):
         self.docs = []
         self.raw_docs = []
+        self.ids = []
+        self.users = []
+        self.position = {}  # embedding_id -> row in the lists above
         self.bm25 = None
-
-    def add(self, text: str):
-        tokens = tokenize(text)
-        if not tokens:
+        self._users = np.array([], dtype=object)
+        self.staged = []  # (doc_id, text, user_id) waiting for rebuild()
+
+    def add(self, doc_id, text: str, user_id=None):
+        self.add_many([doc_id], [text], [user_id])
+
+    def add_many(self, doc_ids, texts, user_ids=None, rebuild=True):
+        # Rebuild BM25 once for the whole batch instead of per document.
+        # rebuild=False (bulk ingest) stages the docs until rebuild(),
+        # so scores stay aligned with the visible ids meanwhile.
+        user_ids = user_ids or [None] * len(texts)
+        self.staged.extend(zip(doc_ids, texts, user_ids))
+        if rebuild:
+            self.rebuild()
+
+    def rebuild(self):
+        staged, self.staged = self.staged, []
+        for doc_id, text, user_id in staged:
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            self.position[int(doc_id)] = len(self.docs)
+            self.docs.append(tokens)
+            self.raw_docs.append(text)
+            self.ids.append(int(doc_id))
+            self.users.append(user_id)
+        if self.docs:
+            self.bm25 = LuceneBM25(self.docs)
+            self._users = np.array(self.users, dtype=object)
+
+    def remove(self, doc_ids):
+        doc_ids = set(doc_ids)
+        self.staged = [s for s in self.staged if int(s[0]) not in doc_ids]
+        keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in doc_ids]
+        if len(keep) == len(self.ids):
             return
-        self.docs.append(tokens)
-        self.raw_docs.append(text)
-        self.bm25 = BM25Okapi(self.docs)
 
-    def search(self, query: str, top_k=5):
+        self.docs = [self.docs[i] for i in keep]
+        self.raw_docs = [self.raw_docs[i] for i in keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.users = [self.users[i] for i in keep]
+        self.position = {doc_id: p for p, doc_id in enumerate(self.ids)}
+        self.bm25 = LuceneBM25(self.docs) if self.docs else None
+        self._users = np.array(self.users, dtype=object)
+
+    def scores(self, query: str, user_id=None):
+        """
+        Raw BM25 score of every document (aligned with self.ids);
+        other users' documents score 0.
+        """
         if not self.bm25:
-            return []
-
-        tokens = tokenize(query)
-        scores = self.bm25.get_scores(tokens)
+            return np.zeros(0)
 
-        ranked = sorted(
-            enumerate(scores),
-            key=lambda x: x[1],
-            reverse=True
-        )
+        scores = np.asarray(self.bm25.get_scores(tokenize(query)), dtype=np.float64)
+        if user_id:
+            scores = np.where(self._users == user_id, scores, 0.0)
+        return scores
 
+    def search(self, query: str, top_k=5, user_id=None):
+        scores = self.scores(query, user_id)
         return [
-            {"content": self.raw_docs[idx], "bm25_score": float(round(score, 3))}
-            for idx, score in ranked[:top_k]
-            if score > 0
+            {
+                "id": self.ids[idx],
+                "content": self.raw_docs[idx],
+                "bm25_score": round(float(scores[idx]), 3)
+            }
+            for idx in select_top_k(scores, top_k, scores > 0)
         ]
 
 
+def _rrf(scores, mask, rrf_k):
+    """
+    Reciprocal-rank contribution of one ranking: 1 / (rrf_k + rank)
+    for masked entries (rank 1 = best score), 0 elsewhere.
+    """
+    contribution = np.zeros(len(scores))
+    ranked = select_top_k(scores, len(scores), mask)
+    contribution[ranked] = 1.0 / (rrf_k + np.arange(1, len(ranked) + 1))
+    return contribution
+
+
 # ===============================
 # Semantic Memory (Hybrid + Rebuild)
 # ===============================
 class SemanticMemory:
-    def __init__(self, dim=384, max_elements=10000):
-        self.index_path = "data/semantic_hnsw.index"
+    def __init__(self, dim=384, max_elements=10000, embedder=None):
+        self.index_path = INDEX_PATH
 
         # ---- MongoDB ----
-        self.client = MongoClient("mongodb://localhost:27017")
-        self.db = self.client["memory_chatbot"]
+        self.client = MongoClient(MONGO_URI)
+        self.db = self.client[MONGO_DB]
         self.collection = self.db["semantic_memory"]
+        # Lookups and buffered counter writes go by embedding_id
+        self.collection.create_index("embedding_id")
 
         # ---- Embedder (needed for rebuild) ----
-        self.embedder = EmbeddingModel()
+        # Only needed when rebuilding; the shared model is loaded lazily.
+        self.embedder = embedder
+
+        # ---- Concurrency ----
+        # `lock` guards the HNSW + BM25 structures (searches share it).
+        # `write_mutex` serializes add_memory end-to-end so two threads
+        # cannot both miss the dedup check and insert the same fact.
+        self.lock = RWLock()
+        self.write_mutex = threading.Lock()
+        self.ids = IdAllocator(self.db, "semantic_memory")
+
+        # ---- Buffered support increments: embedding_id -> count ----
+        self.support = StatsBuffer(
+            self._write_support,
+            name="semantic-support",
+            flush_seconds=SUPPORT_FLUSH_SECONDS,
+            max_pending=SUPPORT_FLUSH_MAX
+        )
+
+        # ---- Per-user persona profiles, dropped on persona writes ----
+        self.personas = PersonaCache(self._load_persona)
 
         # ---- HNSW ----
         self.index = hnswlib.Index(space="cosine", dim=dim)
@@ -74,18 +190,49 @@ class SemanticMemory:
             "process": BM25Index()
         }
 
+        # ---- Label metadata: embedding_id -> (type, user_id) ----
+        # Lets knn_query skip other types / users instead of over-fetching.
+        # `scopes` is the inverse, (type, user_id) -> set of labels, kept
+        # up to date on every add/remove so a per-user filter costs O(1).
+        self.labels = {}
+        self.scopes = {}
+
         # ---- Load or rebuild index ----
+        # After `snapshot.py import` the label/BM25 state comes from the
+        # bundle instead of a Mongo scan.
+        snapshot = read_snapshot_state("semantic")
+
+        loaded = False
         if os.path.exists(self.index_path):
             try:
                 self.index.load_index(self.index_path)
                 self.next_id = self.index.get_current_count()
+                loaded = True
+                if snapshot:
+                    self._load_lexical_from_snapshot(snapshot)
+                else:
+                    self._load_lexical_from_mongo(set(self.index.get_ids_list()))
                 print(f"✅ Loaded Semantic HNSW ({self.next_id} items)")
             except RuntimeError:
                 print("⚠️ Corrupted Semantic index detected. Rebuilding...")
+                snapshot, loaded = None, False
                 self._rebuild_from_mongo(max_elements)
         else:
+            snapshot = None
             self._rebuild_from_mongo(max_elements)
 
+        if snapshot:
+            added = self.catch_up(snapshot["high_water"])
+            print(f"✅ Semantic snapshot caught up ({added} newer memories)")
+            clear_snapshot_state("semantic")
+
+        if loaded and RECONCILE_ON_START:
+            report = self.reconcile()
+            if any(report.values()):
+                print(f"🩹 Semantic index reconciled with MongoDB: {report}")
+
+        self.ids.ensure_at_least(self.next_id)
+
     # --------------------------------------------------
     # REBUILD VECTOR + BM25 FROM MONGODB
     # --------------------------------------------------
@@ -99,35 +246,265 @@ class SemanticMemory:
         )
         self.next_id = 0
 
-        # Reset BM25
+        docs = self._load_lexical_from_mongo()
+
+        if docs:
+            ids = [doc["embedding_id"] for doc in docs]
+            embeddings = (self.embedder or get_embedder()).encode_batch(
+                [doc["content"] for doc in docs]
+            )
+            self.index.add_items(embeddings, np.array(ids))
+            self.next_id = max(ids) + 1
+
+        save_index_atomic(self.index, self.index_path)
+
+        print(f"✅ Semantic Memory rebuilt with {self.next_id} items")
+
+    def _load_lexical_from_mongo(self, indexed=None):
+        """
+        BM25 indexes and label metadata are not persisted with the HNSW
+        file; rebuild them from Mongo (no embedding needed), for the
+        `indexed` labels only when given (docs a stale file lacks are
+        left to reconcile / catch-up). Returns the valid docs.
+        """
         self.bm25_indices = {
             "knowledge": BM25Index(),
             "persona": BM25Index(),
             "process": BM25Index()
         }
+        self.labels = {}
 
-        for doc in self.collection.find():
-            content = doc.get("content")
-            mem_type = doc.get("type")
-            embedding_id = doc.get("embedding_id")
+        docs = [
+            doc for doc in self.collection.find(
+                {},
+                {"embedding_id": 1, "type": 1, "content": 1, "user_id": 1}
+            )
+            if doc.get("content") and doc.get("type") in self.bm25_indices
+            and (indexed is None or doc["embedding_id"] in indexed)
+        ]
 
-            if not content or mem_type not in self.bm25_indices:
-                continue
+        for mem_type, index in self.bm25_indices.items():
+            typed = [doc for doc in docs if doc["type"] == mem_type]
+            index.add_many(
+                [doc["embedding_id"] for doc in typed],
+                [doc["content"] for doc in typed],
+                [doc.get("user_id") for doc in typed]
+            )
 
-            embedding = self.embedder.encode(content)
+        for doc in docs:
+            self.labels[doc["embedding_id"]] = (doc["type"], doc.get("user_id"))
+        self._rebuild_scopes()
 
-            self.index.add_items(
-                np.array([embedding]),
-                np.array([embedding_id])
+        return docs
+
+    def _load_lexical_from_snapshot(self, state):
+        self.bm25_indices = state["bm25"]
+        self.labels = state["labels"]
+        self._rebuild_scopes()
+
+    # --------------------------------------------------
+    # SNAPSHOT EXPORT + CATCH-UP (snapshot.py)
+    # --------------------------------------------------
+    def export_snapshot(self, directory):
+        """
+        Write index.bin + state.pkl into `directory`; returns the
+        manifest entry. The high-water mark is the largest indexed id.
+        """
+        with self.lock.read():
+            self.index.save_index(os.path.join(directory, "index.bin"))
+            high_water = max(self.labels, default=-1)
+            write_state(os.path.join(directory, "state.pkl"), {
+                "high_water": high_water,
+                "labels": self.labels,
+                "bm25": self.bm25_indices
+            })
+            return {"high_water": high_water, "count": len(self.labels)}
+
+    def catch_up(self, high_water):
+        """
+        Index Mongo docs with embedding_id > high_water that are not
+        indexed yet (only these are embedded). Returns how many.
+        """
+        return self._index_from_mongo({"embedding_id": {"$gt": int(high_water)}})
+
+    def sync_ids(self, embedding_ids):
+        """
+        Index these docs unless already indexed (inserts made by other
+        nodes, see index_sync.py). Returns how many were added.
+        """
+        return self._index_from_mongo(
+            {"embedding_id": {"$in": [int(i) for i in embedding_ids]}}
+        )
+
+    def _index_from_mongo(self, query):
+        # write_mutex: a local add_memories in flight finishes first,
+        # so its docs are seen as labeled and not indexed twice
+        with self.write_mutex:
+            docs = [
+                doc for doc in self.collection.find(
+                    query,
+                    {"embedding_id": 1, "type": 1, "content": 1, "user_id": 1}
+                )
+                if doc.get("content")
+                and doc.get("type") in self.bm25_indices
+                and doc["embedding_id"] not in self.labels
+            ]
+            if not docs:
+                return 0
+
+            embeddings = (self.embedder or get_embedder()).encode_batch(
+                [doc["content"] for doc in docs]
+            )
+            with self.lock.write():
+                self._index_docs(docs, embeddings)
+                save_index_atomic(self.index, self.index_path)
+
+        return len(docs)
+
+    # --------------------------------------------------
+    # RECONCILE WITH MONGODB (startup consistency check)
+    # --------------------------------------------------
+    def reconcile(self):
+        """
+        Make the index and label metadata match Mongo after a crash
+        between insert and save (or a stale snapshot): embed only the
+        docs the index lacks, mark orphaned labels deleted, fix next_id.
+        """
+        expected = {
+            doc["embedding_id"]
+            for doc in self.collection.find(
+                {"content": {"$nin": [None, ""]}, "type": {"$in": list(self.bm25_indices)}},
+                {"embedding_id": 1}
             )
+        }
 
-            self.bm25_indices[mem_type].add(content)
-            self.next_id = max(self.next_id, embedding_id + 1)
+        with self.write_mutex:
+            with self.lock.read():
+                missing, extra = diff_index(self.index, expected)
+                stale = set(self.labels) - expected
+                unlabeled = expected - set(self.labels)
+
+            fetch = missing | unlabeled
+            docs = list(self.collection.find(
+                {"embedding_id": {"$in": list(fetch)}},
+                {"embedding_id": 1, "type": 1, "content": 1, "user_id": 1}
+            )) if fetch else []
+            to_embed = [doc for doc in docs if doc["embedding_id"] in missing]
+            embeddings = (self.embedder or get_embedder()).encode_batch(
+                [doc["content"] for doc in to_embed]
+            ) if to_embed else None
+
+            with self.lock.write():
+                orphans = mark_deleted_many(self.index, extra)
+                for label in stale:
+                    self._drop_label(label)
+                if stale:
+                    self.support.discard(stale)
+                    for index in self.bm25_indices.values():
+                        index.remove(stale)
+
+                if to_embed:
+                    self._index_docs(to_embed, embeddings)
+                self._index_docs(
+                    [doc for doc in docs if doc["embedding_id"] not in missing]
+                )
+
+                self.next_id = max(self.next_id, max(expected | extra, default=-1) + 1)
+                if missing or orphans:
+                    save_index_atomic(self.index, self.index_path)
+
+        self.ids.ensure_at_least(self.next_id)
+        return {
+            "missing": len(missing),
+            "orphans": orphans,
+            "relabeled": len(stale) + len(unlabeled)
+        }
 
-        os.makedirs("data", exist_ok=True)
-        self.index.save_index(self.index_path)
+    def _index_docs(self, docs, embeddings=None):
+        """
+        Add vectors to HNSW when `embeddings` is given, and docs not
+        labeled yet to label metadata and BM25. Caller holds
+        write_mutex + write lock.
+        """
+        if not docs:
+            return
 
-        print(f"✅ Semantic Memory rebuilt with {self.next_id} items")
+        ids = [doc["embedding_id"] for doc in docs]
+        if embeddings is not None:
+            ensure_capacity(self.index, len(ids))
+            self.index.add_items(embeddings, np.array(ids))
+
+        docs = [doc for doc in docs if doc["embedding_id"] not in self.labels]
+        for mem_type, index in self.bm25_indices.items():
+            typed = [doc for doc in docs if doc["type"] == mem_type]
+            if typed:
+                index.add_many(
+                    [doc["embedding_id"] for doc in typed],
+                    [doc["content"] for doc in typed],
+                    [doc.get("user_id") for doc in typed]
+                )
+        for doc in docs:
+            self._set_label(doc["embedding_id"], (doc["type"], doc.get("user_id")))
+        self.next_id = max(self.next_id, max(ids) + 1)
+
+    # --------------------------------------------------
+    # LABEL SCOPES (caller holds the write lock)
+    # --------------------------------------------------
+    def _set_label(self, label, key):
+        self.labels[label] = key
+        self.scopes.setdefault(key, set()).add(label)
+        if key[0] == "persona":
+            self.personas.invalidate(key[1])
+
+    def _drop_label(self, label):
+        key = self.labels.pop(label)
+        scope = self.scopes.get(key)
+        if scope is not None:
+            scope.discard(label)
+            if not scope:
+                del self.scopes[key]
+        if key[0] == "persona":
+            self.personas.invalidate(key[1])
+
+    def _rebuild_scopes(self):
+        self.scopes = {}
+        for label, key in self.labels.items():
+            self.scopes.setdefault(key, set()).add(label)
+
+    def _scope_filter(self, mem_type=None, user_id=None):
+        """
+        (size, filter) for a knn_query over the labels of `mem_type`
+        owned by `user_id` (None = any). Caller holds the lock.
+        """
+        if user_id:
+            types = [mem_type] if mem_type else list(self.bm25_indices)
+            scopes = [self.scopes[(t, user_id)] for t in types if (t, user_id) in self.scopes]
+            if len(scopes) == 1:
+                return len(scopes[0]), scopes[0].__contains__
+            return sum(map(len, scopes)), lambda label: any(label in scope for scope in scopes)
+
+        if mem_type:
+            size = sum(len(scope) for (t, _), scope in self.scopes.items() if t == mem_type)
+            return size, lambda label: self.labels.get(label, (None,))[0] == mem_type
+        return len(self.labels), None
+
+    def _stored_vectors(self, labels):
+        """
+        (labels, vectors) for the labels HNSW holds. BM25 and the labels
+        come from Mongo, so with RECONCILE_ON_START=0 they can list
+        memories a stale index file lacks; those are skipped.
+        """
+        try:
+            return labels, np.asarray(self.index.get_items(labels), dtype=np.float32)
+        except RuntimeError:
+            found, vectors = [], []
+            for label in labels:
+                try:
+                    vectors.append(self.index.get_items([label])[0])
+                except RuntimeError:
+                    continue
+                found.append(label)
+            return found, np.asarray(vectors, dtype=np.float32).reshape(len(found), self.index.dim)
 
     # --------------------------------------------------
     # ADD MEMORY (knowledge | persona | process)
@@ -140,57 +517,299 @@ class SemanticMemory:
         user_id=None,
         similarity_threshold=0.65
     ):
-        if self.index.get_current_count() > 0:
+        self.add_memories(
+            [embedding],
+            [content],
+            [mem_type],
+            [user_id],
+            similarity_threshold=similarity_threshold
+        )
+
+    def add_memories(
+        self,
+        embeddings,
+        contents,
+        mem_types,
+        user_ids,
+        similarity_threshold=0.65,
+        dedup=True,
+        persist=True
+    ):
+        """
+        Add several memories in one call (one RPC in service mode).
+
+        Dedup is scoped per (user, type): each scope gets one filtered
+        knn_query, so one user's fact never reinforces another user's
+        memory. Near-duplicates of stored memories only bump a pending
+        support counter (written by `flush_support`); near-duplicates
+        within the batch fold into one new doc. New memories go in with
+        one insert_many and one index save.
+
+        Bulk ingest passes persist=False and calls `persist()` at the
+        end (dedup=False skips the checks for pre-deduplicated data).
+        """
+        if not len(contents):
+            return
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        unit = embeddings / np.maximum(
+            np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
+        )
+
+        scopes = {}
+        for row, key in enumerate(zip(mem_types, user_ids)):
+            scopes.setdefault(key, []).append(row)
+
+        with self.write_mutex:
+            reinforced = {}
+            new_rows = []  # (row, support_count)
+
+            for key, rows in scopes.items():
+                if not dedup:
+                    new_rows.extend([row, 1] for row in rows)
+                    continue
+
+                nearest = self._nearest_in_scope(embeddings[rows], key)
+
+                fresh = []
+                for row, match in zip(rows, nearest):
+                    if match is not None and match[1] >= similarity_threshold:
+                        reinforced[match[0]] = reinforced.get(match[0], 0) + 1
+                        continue
+
+                    # Burst within this batch: fold into the first copy
+                    if fresh:
+                        sims = unit[[r for r, _ in fresh]] @ unit[row]
+                        best = int(np.argmax(sims))
+                        if sims[best] >= similarity_threshold:
+                            fresh[best][1] += 1
+                            continue
+                    fresh.append([row, 1])
+
+                new_rows.extend(fresh)
+
+            self.support.add_many(reinforced)
+            if new_rows:
+                self._insert_new(
+                    embeddings, contents, mem_types, user_ids, new_rows, persist
+                )
+
+    def _nearest_in_scope(self, embeddings, key):
+        """
+        [(embedding_id, similarity) | None] per row: the closest
+        stored memory with the same (type, user_id).
+        """
+        with self.lock.read():
+            scope = self.scopes.get(key)
+            if not scope:
+                return [None] * len(embeddings)
+
             labels, distances = self.index.knn_query(
-                np.array([embedding]),
-                k=min(5, self.index.get_current_count())
+                embeddings,
+                k=1,
+                filter=scope.__contains__
             )
 
-            for idx, dist in zip(labels[0], distances[0]):
-                similarity = 1 - dist
-                if similarity >= similarity_threshold:
-                    doc = self.collection.find_one(
-                        {"embedding_id": int(idx)}
-                    )
-                    if not doc:
-                        continue
+        return [
+            (int(label), 1 - float(dist))
+            for label, dist in zip(labels[:, 0], distances[:, 0])
+        ]
 
-                    self.collection.update_one(
-                        {"embedding_id": int(idx)},
-                        {
-                            "$inc": {"support_count": 1},
-                            "$set": {
-                                "last_seen": datetime.utcnow(),
-                                "confidence": min(
-                                    1.0,
-                                    float(doc.get("confidence", 0.6)) + 0.05
-                                )
-                            }
-                        }
+    def _insert_new(self, embeddings, contents, mem_types, user_ids, new_rows, persist=True):
+        # caller holds write_mutex
+        now = datetime.utcnow()
+        ids = list(self.ids.reserve(len(new_rows)))
+        rows = [row for row, _ in new_rows]
+
+        self.collection.insert_many([
+            {
+                "embedding_id": mid,
+                "type": mem_types[row],
+                "content": contents[row],
+                "user_id": user_ids[row],
+                "support_count": support,
+                "confidence": min(1.0, 0.6 + 0.05 * (support - 1)),
+                "last_seen": now
+            }
+            for mid, (row, support) in zip(ids, new_rows)
+        ])
+
+        with self.lock.write():
+            ensure_capacity(self.index, len(ids))
+            self.index.add_items(embeddings[rows], np.array(ids))
+            for mem_type, index in self.bm25_indices.items():
+                typed = [(mid, row) for mid, row in zip(ids, rows) if mem_types[row] == mem_type]
+                if typed:
+                    index.add_many(
+                        [mid for mid, _ in typed],
+                        [contents[row] for _, row in typed],
+                        [user_ids[row] for _, row in typed],
+                        rebuild=persist
                     )
-                    return
+            for mid, row in zip(ids, rows):
+                self._set_label(mid, (mem_types[row], user_ids[row]))
+            self.next_id = max(self.next_id, ids[-1] + 1)
+            if persist:
+                save_index_atomic(self.index, self.index_path)
+
+    def persist(self):
+        """
+        Build staged BM25 docs, save the index and write buffered
+        support (end of a bulk ingest).
+        """
+        with self.write_mutex:
+            with self.lock.write():
+                for index in self.bm25_indices.values():
+                    index.rebuild()
+                save_index_atomic(self.index, self.index_path)
+        self.support.flush()
 
-        mid = self.next_id
+    # --------------------------------------------------
+    # BUFFERED REINFORCEMENT
+    # --------------------------------------------------
+    def flush_support(self):
+        """
+        Write buffered support increments now (shutdown, tests).
+        """
+        return self.support.flush()
+
+    def _write_support(self, pending):
+        confidence = {
+            doc["embedding_id"]: float(doc.get("confidence", 0.6))
+            for doc in self.collection.find(
+                {"embedding_id": {"$in": list(pending)}},
+                {"embedding_id": 1, "confidence": 1}
+            )
+        }
 
-        self.index.add_items(
-            np.array([embedding]),
-            np.array([mid])
-        )
+        if not confidence:
+            return 0
+
+        self.collection.bulk_write([
+            UpdateOne(
+                {"embedding_id": mid},
+                {
+                    "$inc": {"support_count": n},
+                    "$max": {"last_seen": when},
+                    "$set": {"confidence": min(1.0, confidence[mid] + 0.05 * n)}
+                }
+            )
+            for mid, (n, when) in pending.items()
+            if mid in confidence
+        ], ordered=False)
+        return len(confidence)
 
-        self.collection.insert_one({
-            "embedding_id": mid,
-            "type": mem_type,
-            "content": content,
-            "user_id": user_id,
-            "support_count": 1,
-            "confidence": 0.6,
-            "last_seen": datetime.utcnow()
-        })
+    # --------------------------------------------------
+    # PERSONA PROFILE (persona_cache.py)
+    # --------------------------------------------------
+    def persona_profile(self, user_id=None):
+        """
+        The user's persona memories, most supported first, in the same
+        shape as search() hits. Cached until a persona write.
+        """
+        return self.personas.get(user_id)
+
+    def persona_profiles(self, user_ids):
+        return [self.personas.get(user_id) for user_id in user_ids]
+
+    def _load_persona(self, user_id):
+        # Same age window as search(): stale persona facts stay out
+        docs = self.collection.find(
+            {
+                "type": "persona",
+                "user_id": user_id,
+                "last_seen": {"$gte": datetime.utcnow() - timedelta(days=PERSONA_MAX_AGE_DAYS)}
+            },
+            {"embedding_id": 1, "content": 1, "support_count": 1, "confidence": 1, "last_seen": 1}
+        ).sort([("support_count", -1), ("embedding_id", 1)])
+
+        profile = []
+        for doc in docs:
+            # Removed labels whose Mongo doc is not deleted yet
+            if doc["embedding_id"] not in self.labels:
+                continue
+            confidence = float(doc.get("confidence", 0.6))
+            profile.append({
+                "type": "persona",
+                "content": doc["content"],
+                "support_count": int(doc.get("support_count", 1)),
+                "confidence": confidence,
+                "score": round(confidence, 3),
+                "last_seen": doc["last_seen"].isoformat() if doc.get("last_seen") else None
+            })
+            if len(profile) == PERSONA_PROFILE_SIZE:
+                break
+        return profile
 
-        self.bm25_indices[mem_type].add(content)
+    # --------------------------------------------------
+    # NEAREST EXISTING MEMORY (novelty check)
+    # --------------------------------------------------
+    def nearest_similarity(self, embedding, user_id=None):
+        """
+        Highest cosine similarity between `embedding` and any stored
+        memory of `user_id` (0.0 when there is none). Other users'
+        memories are filtered out inside HNSW, not after the top k.
+        """
+        with self.lock.read():
+            count, allow = self._scope_filter(None, user_id)
+            if count == 0:
+                return 0.0
+            _, distances = self.index.knn_query(
+                np.array([embedding]),
+                k=1,
+                filter=allow
+            )
 
-        self.next_id += 1
-        self.index.save_index(self.index_path)
+        return 1 - float(distances[0][0])
+
+    # --------------------------------------------------
+    # COUNT
+    # --------------------------------------------------
+    def count(self):
+        with self.lock.read():
+            return len(self.labels)
+
+    # --------------------------------------------------
+    # REMOVE + COMPACT (used by compaction.py)
+    # --------------------------------------------------
+    def remove(self, embedding_ids):
+        """
+        Mark memories deleted in HNSW and drop them from BM25 so
+        searches stop returning them. Mongo docs are deleted by the
+        caller afterwards. Returns how many labels were removed.
+        """
+        with self.write_mutex, self.lock.write():
+            removed = {int(i) for i in embedding_ids if int(i) in self.labels}
+            for label in removed:
+                self.index.mark_deleted(label)
+                self._drop_label(label)
+            self.support.discard(removed)
+
+            for index in self.bm25_indices.values():
+                index.remove(removed)
+
+            if removed:
+                save_index_atomic(self.index, self.index_path)
+        return len(removed)
+
+    def fragmentation(self):
+        total = self.index.get_current_count()
+        return 1 - len(self.labels) / total if total else 0.0
+
+    def compact_index(self, min_fragmentation=0.0):
+        """
+        Rebuild HNSW without deleted slots (from stored vectors) when
+        more than `min_fragmentation` of it is deleted.
+        """
+        with self.write_mutex, self.lock.write():
+            total = self.index.get_current_count()
+            if total and 1 - len(self.labels) / total > min_fragmentation:
+                self.index = rebuild_index(self.index, self.labels)
+                save_index_atomic(self.index, self.index_path)
+
+    def index_stats(self):
+        with self.lock.read():
+            return index_stats(self.index, len(self.labels))
 
     # --------------------------------------------------
     # HYBRID SEARCH (BM25 + VECTOR)
@@ -204,83 +823,183 @@ class SemanticMemory:
         user_id=None,
         similarity_threshold=0.35,
         max_age_days=60,
-        alpha=0.7
+        alpha=None,
+        fusion=None
     ):
-        if self.index.get_current_count() == 0:
-            return []
+        return self.search_batch(
+            [embedding],
+            [query_text],
+            k=k,
+            mem_type=mem_type,
+            user_ids=[user_id],
+            similarity_threshold=similarity_threshold,
+            max_age_days=max_age_days,
+            alpha=alpha,
+            fusion=fusion
+        )[0]
 
-        labels, distances = self.index.knn_query(
-            np.array([embedding]),
-            k=min(k * 4, self.index.get_current_count())
+    # --------------------------------------------------
+    # BATCH HYBRID SEARCH (vector ∪ BM25, ONE MONGO FETCH)
+    # --------------------------------------------------
+    def search_batch(
+        self,
+        embeddings,
+        query_texts,
+        k=2,
+        mem_type=None,
+        user_ids=None,
+        similarity_threshold=0.35,
+        max_age_days=60,
+        alpha=None,
+        scoring=None,
+        fusion=None
+    ):
+        """
+        Same contract as search(), for many query rows at once.
+        `user_ids` holds one user per row (None = any user).
+        Returns one result list per input row, in order.
+
+        Candidates are the union of the vector top hits and the BM25
+        top hits (so lexical-only matches such as names and code
+        identifiers are considered). Fusion is either
+          "linear": alpha * vector_score + (1 - alpha) * bm25 / max_bm25
+          "rrf":    sum of 1 / (rrf_k + rank) over both rankings
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+
+        n_rows = len(embeddings)
+        if user_ids is None:
+            user_ids = [None] * n_rows
+
+        scoring = scoring or SEMANTIC_SCORING
+        alpha = scoring["alpha"] if alpha is None else alpha
+        fusion = fusion or scoring["fusion"]
+        fetch_k = k * 2
+
+        bm25_indices = (
+            [self.bm25_indices[mem_type]] if mem_type in self.bm25_indices
+            else [] if mem_type else list(self.bm25_indices.values())
         )
 
-        now = datetime.utcnow()
-        vector_hits = {}
-
-        for idx, dist in zip(labels[0], distances[0]):
-            similarity = 1 - dist
-            if similarity < similarity_threshold:
-                continue
-
-            query = {"embedding_id": int(idx)}
-            if mem_type:
-                query["type"] = mem_type
-            if user_id:
-                query["user_id"] = user_id
-
-            doc = self.collection.find_one(query)
-            if not doc:
-                continue
+        rows = []
+        with self.lock.read():
+            if self.index.get_current_count() == 0 or n_rows == 0:
+                return [[] for _ in range(n_rows)]
 
-            age_days = (now - doc["last_seen"]).days
-            if age_days > max_age_days:
-                continue
+            for row in range(n_rows):
+                user_id = user_ids[row]
 
-            recency_penalty = min(age_days * 0.015, 0.3)
-            support_boost = min(doc.get("support_count", 1) * 0.05, 0.25)
+                # ---- Vector candidates (type/user filtered inside HNSW) ----
+                allowed, allow = self._scope_filter(mem_type, user_id)
 
-            vector_score = similarity - recency_penalty + support_boost
-
-            vector_hits[doc["content"]] = {
-                "doc": doc,
-                "vector_score": vector_score
-            }
-
-        bm25_hits = []
-        if mem_type and mem_type in self.bm25_indices:
-            bm25_hits = self.bm25_indices[mem_type].search(
-                query_text,
-                top_k=k * 3
-            )
-
-        bm25_map = {
-            hit["content"]: hit["bm25_score"]
-            for hit in bm25_hits
-        }
-
-        results = []
-        for content, data in vector_hits.items():
-            bm25_score = bm25_map.get(content, 0.0)
+                vector = {}
+                if allowed:
+                    labels, distances = self.index.knn_query(
+                        embeddings[row:row + 1],
+                        k=min(fetch_k, allowed),
+                        filter=allow
+                    )
+                    vector = {
+                        int(label): 1.0 - float(dist)
+                        for label, dist in zip(labels[0], distances[0])
+                        if 1.0 - dist >= similarity_threshold
+                    }
+
+                # ---- Lexical candidates, normalized per query ----
+                # Top BM25 hits join the pool; vector hits get their
+                # (normalized) BM25 score too.
+                lexical = {}
+                for index in bm25_indices:
+                    scores = index.scores(query_texts[row], user_id)
+                    if not len(scores) or scores.max() <= 0:
+                        continue
+                    normalized = scores / scores.max()
+                    for idx in select_top_k(scores, fetch_k, scores > 0):
+                        lexical[index.ids[idx]] = float(normalized[idx])
+                    for doc_id in vector:
+                        idx = index.position.get(doc_id)
+                        if idx is not None and normalized[idx] > 0:
+                            lexical[doc_id] = float(normalized[idx])
+
+                # Cosine for lexical-only candidates from the stored vectors
+                lexical_only = [i for i in lexical if i not in vector]
+                if lexical_only:
+                    lexical_only, stored = self._stored_vectors(lexical_only)
+                    query = embeddings[row] / (np.linalg.norm(embeddings[row]) or 1.0)
+                    for doc_id, sim in zip(lexical_only, stored @ query):
+                        vector[doc_id] = float(sim)
+
+                rows.append((vector, lexical))
+
+        # ---- Resolve metadata for every candidate in one round trip ----
+        candidate_ids = sorted({i for vector, _ in rows for i in vector})
+        query = {"embedding_id": {"$in": candidate_ids}}
+        if mem_type:
+            query["type"] = mem_type
+        docs = list(self.collection.find(query)) if candidate_ids else []
+
+        table = ScoreTable(
+            docs,
+            id_field="embedding_id",
+            time_field="last_seen",
+            support_field="support_count"
+        )
 
-            hybrid_score = (
-                alpha * data["vector_score"]
-                + (1 - alpha) * bm25_score
-            )
+        batch_results = []
 
-            if hybrid_score < similarity_threshold:
+        for row, (vector, lexical) in enumerate(rows):
+            ids = np.array(list(vector), dtype=np.int64)
+            if not len(ids) or not len(table):
+                batch_results.append([])
                 continue
 
-            doc = data["doc"]
-            results.append({
-                "type": doc["type"],
-                "content": doc["content"],
-                "support_count": int(doc.get("support_count", 1)),
-                "confidence": float(doc.get("confidence", 0.6)),
-                "score": float(round(hybrid_score, 3)),
-                "vector_score": float(round(data["vector_score"], 3)),
-                "bm25_score": float(round(bm25_score, 3)),
-                "last_seen": doc["last_seen"].isoformat()
-            })
+            similarity = np.array(list(vector.values()), dtype=np.float32)
+            bm25 = np.array([lexical.get(i, 0.0) for i in vector], dtype=np.float32)
 
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:k]
+            positions, found = table.lookup(ids)
+            owners = table.column("user_id", positions)
+            scores = vector_scores(
+                similarity,
+                table.age_days[positions],
+                table.support[positions],
+                scoring
+            )
+            keep = found & (table.age_days[positions] <= max_age_days)
+            if user_ids[row]:
+                keep &= owners == user_ids[row]
+
+            if fusion == "rrf":
+                fused = (
+                    _rrf(scores, similarity >= similarity_threshold, scoring["rrf_k"])
+                    + _rrf(bm25, bm25 > 0, scoring["rrf_k"])
+                )
+                keep &= (similarity >= similarity_threshold) | (bm25 > 0)
+            else:
+                fused = alpha * scores + (1 - alpha) * bm25
+                keep &= fused >= similarity_threshold
+
+            results, seen = [], set()
+            for col in select_top_k(fused, k * 2, keep):
+                doc = table.docs[positions[col]]
+                if doc["content"] in seen:
+                    continue
+                seen.add(doc["content"])
+
+                results.append({
+                    "type": doc["type"],
+                    "content": doc["content"],
+                    "support_count": int(doc.get("support_count", 1)),
+                    "confidence": float(doc.get("confidence", 0.6)),
+                    "score": round(float(fused[col]), 4 if fusion == "rrf" else 3),
+                    "vector_score": round(float(scores[col]), 3),
+                    "bm25_score": round(float(bm25[col]), 3),
+                    "last_seen": doc["last_seen"].isoformat()
+                })
+                if len(results) == k:
+                    break
+
+            batch_results.append(results)
+
+        return batch_results
@@ -0,0 +1,103 @@
+import gzip
+import json
+import os
+from datetime import datetime
+import numpy as np
+from flask import Response, request
+
+
+# --------------------------------------------------
+# Compact /chat responses
+# --------------------------------------------------
+# Responses are lean unless the request sets "verbose": true:
+#   - no `context` (build_prompt's debug copy of every section plus the
+#     whole final prompt)
+#   - hits keep what a client shows: episodic summary / timestamp /
+#     score, semantic type / content / score
+# Encoding uses orjson when installed (stdlib json otherwise, compact
+# separators), and bodies over GZIP_MIN_BYTES are gzipped for clients
+# that accept it.
+#
+#   python bench_serialization.py    payload size / encode time
+# --------------------------------------------------
+
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+LEAN_EPISODIC_FIELDS = ("summary", "timestamp", "score")
+LEAN_SEMANTIC_FIELDS = ("type", "content", "score")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """
+    Compact JSON as bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            payload,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(
+        payload,
+        default=_default,
+        separators=(",", ":"),
+        ensure_ascii=False
+    ).encode("utf-8")
+
+
+def lean_result(result):
+    """
+    /chat or batch-item result without debug context and score
+    breakdowns.
+    """
+    lean = {key: value for key, value in result.items() if key != "context"}
+
+    if result.get("episodic_hits"):
+        lean["episodic_hits"] = [
+            {field: hit.get(field) for field in LEAN_EPISODIC_FIELDS}
+            for hit in result["episodic_hits"]
+        ]
+
+    semantic_hits = result.get("semantic_hits")
+    if isinstance(semantic_hits, dict):
+        lean["semantic_hits"] = {
+            mem_type: [
+                {field: hit.get(field) for field in LEAN_SEMANTIC_FIELDS}
+                for hit in hits
+            ]
+            for mem_type, hits in semantic_hits.items()
+        }
+    return lean
+
+
+def json_response(payload, status=200):
+    """
+    Flask response with compact JSON, gzipped when large enough and
+    the client sends Accept-Encoding: gzip.
+    """
+    body = dumps(payload)
+    headers = {"Vary": "Accept-Encoding"}
+
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("Accept-Encoding", ""):
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(body, status=status, mimetype="application/json", headers=headers)
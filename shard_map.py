@@ -0,0 +1,161 @@
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from db import DATA_DIR
+
+
+# --------------------------------------------------
+# Shard routing table
+# --------------------------------------------------
+# The routing table is a JSON file shared by the router and
+# rebalance.py, re-read when it changes:
+#
+#   {
+#     "shards":   {"shard0": "http://127.0.0.1:5001", ...},
+#     "draining": ["shard2"],          # reachable, but out of the ring
+#     "overrides": {"alice": "shard1"} # pinned users (moves in flight,
+#                                      # manual placement)
+#   }
+#
+# Without the file the shard list comes from SHARDS
+# ("shard0=http://127.0.0.1:5001,shard1=http://127.0.0.1:5002").
+# --------------------------------------------------
+
+ROUTING_FILE = os.getenv("ROUTING_FILE", os.path.join(DATA_DIR, "routing.json"))
+
+# Virtual nodes per shard: more points, more even split
+RING_VNODES = int(os.getenv("RING_VNODES", "128"))
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring: adding or removing a shard only moves the
+    users whose nearest point changed (about 1/N of them).
+    """
+
+    def __init__(self, shards, vnodes=RING_VNODES):
+        points = sorted(
+            (_hash(f"{shard}#{i}"), shard)
+            for shard in shards
+            for i in range(vnodes)
+        )
+        self.hashes = [h for h, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def get(self, key):
+        if not self.hashes:
+            raise ValueError("Hash ring has no shards")
+        i = bisect.bisect(self.hashes, _hash(str(key))) % len(self.hashes)
+        return self.shards[i]
+
+
+def parse_shards(spec):
+    """
+    "name=url,name=url" -> {name: url}
+    """
+    shards = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, url = entry.partition("=")
+        if not url:
+            raise ValueError(f"Bad shard entry {entry!r} (expected name=url)")
+        shards[name.strip()] = url.strip().rstrip("/")
+    return shards
+
+
+class ShardMap:
+    """
+    Routing table: shard URLs, the hash ring and per-user overrides.
+    """
+
+    def __init__(self, path=ROUTING_FILE, vnodes=RING_VNODES, check_interval=1.0):
+        self.path = path
+        self.vnodes = vnodes
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.checked_at = 0.0
+        self._apply(self._read())
+
+    # --------------------------------------------------
+    # Load / save
+    # --------------------------------------------------
+    def _read(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                table = json.load(f)
+            self.mtime = os.stat(self.path).st_mtime_ns
+        else:
+            table = {"shards": parse_shards(os.getenv("SHARDS"))}
+        table.setdefault("shards", {})
+        table.setdefault("draining", [])
+        table.setdefault("overrides", {})
+        return table
+
+    def _apply(self, table):
+        ring = HashRing(
+            [s for s in table["shards"] if s not in table["draining"]],
+            self.vnodes
+        )
+        with self.lock:
+            self.table = table
+            self.ring = ring
+
+    def refresh(self):
+        """
+        Re-read the file if it changed (checked at most once per
+        check_interval).
+        """
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self.mtime:
+            self._apply(self._read())
+
+    def save(self, table):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(table, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.mtime = os.stat(self.path).st_mtime_ns
+        self._apply(table)
+
+    def snapshot(self):
+        """
+        Deep copy of the table, for read-modify-save.
+        """
+        with self.lock:
+            return json.loads(json.dumps(self.table))
+
+    # --------------------------------------------------
+    # Lookups
+    # --------------------------------------------------
+    @property
+    def shards(self):
+        with self.lock:
+            return dict(self.table["shards"])
+
+    def ring_shard(self, user_id):
+        with self.lock:
+            return self.ring.get(user_id)
+
+    def shard_for(self, user_id):
+        with self.lock:
+            return self.table["overrides"].get(user_id) or self.ring.get(user_id)
+
+    def url(self, shard):
+        with self.lock:
+            return self.table["shards"][shard]
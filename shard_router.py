@@ -0,0 +1,208 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from flask import Flask, Response, jsonify, render_template, request
+from shard_map import ShardMap
+
+
+# --------------------------------------------------
+# User-sharded deployment (router)
+# --------------------------------------------------
+# Each shard is an ordinary app.py process with its own MONGO_DB and
+# DATA_DIR, so a user's episodic, semantic and cache data (Mongo docs
+# and HNSW indexes) live together on one shard. Users map to shards by
+# consistent hashing over the routing table in shard_map.py; moving
+# users around is rebalance.py's job.
+#
+#   ROUTER_PORT=5000 python shard_router.py
+# --------------------------------------------------
+
+ROUTER_TIMEOUT_SECONDS = float(os.getenv("ROUTER_TIMEOUT_SECONDS", "60"))
+
+# Same default as app.py
+DEFAULT_USER_ID = "test_user_1"
+
+
+# ===============================
+# Router
+# ===============================
+app = Flask(__name__)
+shard_map = ShardMap()
+http = requests.Session()
+http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=64))
+pool = ThreadPoolExecutor(max_workers=16)
+
+# Hop-by-hop and length headers are recomputed on the way out
+DROP_HEADERS = {"connection", "content-length", "content-encoding", "transfer-encoding", "keep-alive"}
+
+
+# End-to-end request headers the shards act on
+FORWARD_HEADERS = ("X-Request-Timeout-Ms",)
+
+
+def _forward_headers():
+    headers = {"Content-Type": request.headers.get("Content-Type", "application/json")}
+    for name in FORWARD_HEADERS:
+        if name in request.headers:
+            headers[name] = request.headers[name]
+    return headers
+
+
+def _user_id():
+    data = request.get_json(silent=True) or {}
+    return data.get("user_id") or request.args.get("user_id") or DEFAULT_USER_ID
+
+
+def _forward(shard, path):
+    try:
+        upstream = http.request(
+            request.method,
+            f"{shard_map.url(shard)}/{path}",
+            params=request.args,
+            data=request.get_data(),
+            headers=_forward_headers(),
+            timeout=ROUTER_TIMEOUT_SECONDS
+        )
+    except requests.RequestException as e:
+        return jsonify({"error": "Shard unavailable", "shard": shard, "detail": str(e)}), 502
+
+    headers = [
+        (name, value) for name, value in upstream.headers.items()
+        if name.lower() not in DROP_HEADERS
+    ]
+    headers.append(("X-Shard", shard))
+    return Response(upstream.content, upstream.status_code, headers)
+
+
+@app.before_request
+def _refresh_routing():
+    shard_map.refresh()
+
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    return _forward(shard_map.shard_for(_user_id()), "chat")
+
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch_route():
+    """
+    Split the batch by shard, run the sub-batches in parallel and put
+    the results back in request order.
+    """
+    start_time = time.time()
+    data = request.get_json() or {}
+    items = data.get('items', [])
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Empty batch'}), 400
+
+    by_shard = {}
+    for i, item in enumerate(items):
+        if isinstance(item, dict):
+            user_id = item.get("user_id") or DEFAULT_USER_ID
+        else:
+            user_id = item[0]
+        by_shard.setdefault(shard_map.shard_for(user_id), []).append(i)
+
+    headers = {
+        name: request.headers[name]
+        for name in FORWARD_HEADERS if name in request.headers
+    }
+
+    def run(shard, rows):
+        body = dict(data, items=[items[i] for i in rows])
+        try:
+            r = http.post(
+                f"{shard_map.url(shard)}/chat/batch",
+                json=body,
+                headers=headers,
+                timeout=ROUTER_TIMEOUT_SECONDS
+            )
+            if r.status_code != 200:
+                error = r.json().get("error", f"HTTP {r.status_code}")
+                return [{"error": error, "shard": shard}] * len(rows)
+            return r.json()["results"]
+        except (requests.RequestException, ValueError) as e:
+            return [{"error": f"Shard unavailable: {e}", "shard": shard}] * len(rows)
+
+    futures = {shard: pool.submit(run, shard, rows) for shard, rows in by_shard.items()}
+    results = [None] * len(items)
+    for shard, rows in by_shard.items():
+        for i, result in zip(rows, futures[shard].result()):
+            results[i] = result
+
+    return jsonify({
+        "results": results,
+        "count": len(results),
+        "shards": len(by_shard),
+        "processing_time": round((time.time() - start_time) * 1000, 2),
+        "timestamp": time.time()
+    })
+
+
+def _fan_out(path):
+    def get(url):
+        try:
+            r = http.get(f"{url}/{path}", timeout=ROUTER_TIMEOUT_SECONDS)
+            return r.status_code, r.json()
+        except (requests.RequestException, ValueError) as e:
+            return 502, {"error": str(e)}
+
+    shards = shard_map.shards
+    futures = {name: pool.submit(get, url) for name, url in shards.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    replies = _fan_out("stats")
+    table = shard_map.snapshot()
+    return jsonify({
+        "shards": {name: body for name, (_, body) in replies.items()},
+        "draining": table["draining"],
+        "overrides": len(table["overrides"])
+    })
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    replies = _fan_out("ready")
+    ok = bool(replies) and all(status == 200 for status, _ in replies.values())
+    return jsonify({
+        "ready": ok,
+        "shards": {name: status == 200 for name, (status, _) in replies.items()}
+    }), 200 if ok else 503
+
+
+@app.route('/route/<user_id>', methods=['GET'])
+def route(user_id):
+    """
+    Which shard serves `user_id` (debugging / tooling).
+    """
+    shard = shard_map.shard_for(user_id)
+    return jsonify({"user_id": user_id, "shard": shard, "url": shard_map.url(shard)})
+
+
+@app.route('/<path:path>', methods=['GET', 'POST'])
+def forward(path):
+    """
+    Anything else with a user_id (JSON body or query) goes to that
+    user's shard.
+    """
+    if path.startswith("admin/"):
+        return jsonify({"error": "Admin endpoints are per shard"}), 404
+    return _forward(shard_map.shard_for(_user_id()), path)
+
+
+if __name__ == '__main__':
+    shards = shard_map.shards
+    if not shards:
+        raise SystemExit(f"No shards: set SHARDS or create {shard_map.path}")
+    print(f"🧭 Routing {len(shards)} shards: {', '.join(f'{n}={u}' for n, u in shards.items())}")
+    app.run(host='0.0.0.0', port=int(os.getenv("ROUTER_PORT", "5000")), threaded=True)
@@ -1,7 +1,8 @@
-from langchain.memory import ConversationBufferWindowMemory
-
 class ShortTermMemory:
     def __init__(self, k=2):
+        # Imported here: langchain is slow to import
+        from langchain.memory import ConversationBufferWindowMemory
+
         self.memory = ConversationBufferWindowMemory(
             k=k,
             return_messages=True
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from db import DATA_DIR
+
+
+# --------------------------------------------------
+# Index snapshot bundles (replica warm start)
+# --------------------------------------------------
+# A bundle is a tar with, per store, the HNSW file(s), the in-memory
+# state that is normally rebuilt from Mongo at startup (label metadata,
+# BM25) and a manifest with the embedding model and each store's id
+# high-water mark:
+#
+#   manifest.json
+#   semantic/index.bin   semantic/state.pkl
+#   cache/index.bin      cache/state.pkl
+#   episodic/segments/YYYY-MM.index   episodic/state.pkl
+#
+#   python snapshot.py export bundle.tar [--socket ...]
+#   python snapshot.py import bundle.tar
+#
+# Import puts the files where the stores expect them and leaves the
+# state under data/snapshot/. The next time each store starts it loads
+# that state instead of scanning Mongo, embeds only documents above the
+# high-water mark, then deletes the state file.
+#
+# state.pkl is pickle: only import bundles you exported yourself.
+# --------------------------------------------------
+
+FORMAT_VERSION = 1
+SNAPSHOT_STATE_DIR = os.path.join(DATA_DIR, "snapshot")
+STORES = ("episodic", "semantic", "cache")
+
+
+# ===============================
+# Store-side helpers
+# ===============================
+def write_state(path, state):
+    with open(path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_snapshot_state(store, state_dir=SNAPSHOT_STATE_DIR):
+    """
+    State left by `import_bundle` for `store`, or None.
+    """
+    path = os.path.join(state_dir, f"{store}.pkl")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def clear_snapshot_state(store, state_dir=SNAPSHOT_STATE_DIR):
+    path = os.path.join(state_dir, f"{store}.pkl")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# ===============================
+# Export
+# ===============================
+def export_bundle(stores, bundle_path):
+    """
+    stores: {"episodic": ..., "semantic": ..., "cache": ...}, local or
+    index-service proxies (the service writes into the same directory,
+    so it must share this host's filesystem).
+    """
+    from embeddings import EMBEDDING_BACKEND, MODEL_NAME
+
+    started = time.perf_counter()
+    workdir = tempfile.mkdtemp(prefix="neuromind-snapshot-")
+    try:
+        manifest = {
+            "format": FORMAT_VERSION,
+            "created_at": datetime.utcnow().isoformat(),
+            "embedding_model": MODEL_NAME,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "stores": {}
+        }
+
+        for name in STORES:
+            directory = os.path.join(workdir, name)
+            os.makedirs(directory)
+            manifest["stores"][name] = stores[name].export_snapshot(os.path.abspath(directory))
+
+        with open(os.path.join(workdir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        with tarfile.open(bundle_path, "w") as tar:
+            for entry in sorted(os.listdir(workdir)):
+                tar.add(os.path.join(workdir, entry), arcname=entry)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    manifest["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return manifest
+
+
+# ===============================
+# Import
+# ===============================
+def import_bundle(bundle_path, force=False, state_dir=SNAPSHOT_STATE_DIR):
+    """
+    Unpack a bundle into the store paths. Existing index files are
+    replaced. Stores must not be running in this process or another.
+    """
+    from embeddings import MODEL_NAME
+    from episodic_memory import SEGMENT_DIR
+    from semantic_cache import INDEX_PATH as CACHE_INDEX_PATH
+    from semantic_memory import INDEX_PATH as SEMANTIC_INDEX_PATH
+
+    workdir = tempfile.mkdtemp(prefix="neuromind-snapshot-")
+    try:
+        with tarfile.open(bundle_path) as tar:
+            tar.extractall(workdir, filter="data")
+
+        with open(os.path.join(workdir, "manifest.json")) as f:
+            manifest = json.load(f)
+
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {manifest.get('format')!r}")
+        if manifest["embedding_model"] != MODEL_NAME and not force:
+            raise ValueError(
+                f"Snapshot was built with {manifest['embedding_model']!r}, "
+                f"this node embeds with {MODEL_NAME!r} (use --force to import anyway)"
+            )
+
+        os.makedirs(state_dir, exist_ok=True)
+        for path in (SEMANTIC_INDEX_PATH, CACHE_INDEX_PATH):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        shutil.copyfile(os.path.join(workdir, "semantic", "index.bin"), SEMANTIC_INDEX_PATH)
+        shutil.copyfile(os.path.join(workdir, "cache", "index.bin"), CACHE_INDEX_PATH)
+
+        # Segments not in the bundle would be stale: replace the set
+        if os.path.isdir(SEGMENT_DIR):
+            shutil.rmtree(SEGMENT_DIR)
+        shutil.copytree(os.path.join(workdir, "episodic", "segments"), SEGMENT_DIR)
+
+        for name in STORES:
+            shutil.copyfile(
+                os.path.join(workdir, name, "state.pkl"),
+                os.path.join(state_dir, f"{name}.pkl")
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return manifest
+
+
+def _open_stores(socket_path):
+    if socket_path:
+        from index_service import connect_stores
+        episodic, semantic, cache = connect_stores(socket_path)
+    else:
+        from episodic_memory import EpisodicMemory
+        from semantic_memory import SemanticMemory
+        from semantic_cache import SemanticCache
+        episodic, semantic, cache = EpisodicMemory(), SemanticMemory(), SemanticCache()
+    return {"episodic": episodic, "semantic": semantic, "cache": cache}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export / import index snapshot bundles")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = sub.add_parser("export")
+    export_cmd.add_argument("bundle")
+    export_cmd.add_argument("--socket", default=os.getenv("INDEX_SERVICE_SOCKET"))
+
+    import_cmd = sub.add_parser("import")
+    import_cmd.add_argument("bundle")
+    import_cmd.add_argument("--force", action="store_true", help="ignore embedding model mismatch")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        manifest = export_bundle(_open_stores(args.socket), args.bundle)
+        print(f"📦 Exported {args.bundle} in {manifest['duration_ms']} ms")
+    else:
+        manifest = import_bundle(args.bundle, force=args.force)
+        print(f"📦 Imported {args.bundle} (created {manifest['created_at']})")
+
+    for name, entry in manifest["stores"].items():
+        print(f"   {name:<9} {entry['count']:>8} items  high-water id {entry['high_water']}")
@@ -0,0 +1,120 @@
+import os
+import threading
+from datetime import datetime
+
+
+# --------------------------------------------------
+# Buffered access statistics
+# --------------------------------------------------
+# Hot paths (cache hits, semantic reinforcement) only bump an in-memory
+# counter. A background thread hands the accumulated increments to the
+# store's writer (one bulk_write) every `flush_seconds`, sooner once
+# `max_pending` keys are waiting; `close()` / `flush()` on shutdown.
+# Counters in Mongo lag by up to one interval, and a crash loses at
+# most that much.
+# --------------------------------------------------
+
+STATS_FLUSH_SECONDS = float(os.getenv("STATS_FLUSH_SECONDS", "5"))
+STATS_FLUSH_MAX = int(os.getenv("STATS_FLUSH_MAX", "1000"))
+
+
+class StatsBuffer:
+    """
+    {key: (count, last_touched)} increments waiting for `writer`.
+
+    writer(pending) gets that dict, writes it and returns how many
+    documents it updated. A failed write puts the increments back.
+    """
+
+    def __init__(
+        self,
+        writer,
+        name="stats",
+        flush_seconds=STATS_FLUSH_SECONDS,
+        max_pending=STATS_FLUSH_MAX
+    ):
+        self.writer = writer
+        self.name = name
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.metrics = {"flushes": 0, "written": 0, "errors": 0}
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, key, n=1, when=None):
+        self.add_many({key: n}, when)
+
+    def add_many(self, counts, when=None):
+        if not counts:
+            return
+        when = when or datetime.utcnow()
+        with self.lock:
+            for key, n in counts.items():
+                count, _ = self.pending.get(key, (0, when))
+                self.pending[key] = (count + n, when)
+            full = len(self.pending) >= self.max_pending
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-flush", daemon=True
+                )
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def discard(self, keys):
+        """
+        Drop pending increments for deleted documents.
+        """
+        with self.lock:
+            for key in keys:
+                self.pending.pop(key, None)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            if not pending:
+                return 0
+
+            try:
+                written = self.writer(pending)
+            except Exception:
+                with self.lock:
+                    for key, (n, when) in pending.items():
+                        count, latest = self.pending.get(key, (0, when))
+                        self.pending[key] = (count + n, max(when, latest))
+                    self.metrics["errors"] += 1
+                raise
+
+            with self.lock:
+                self.metrics["flushes"] += 1
+                self.metrics["written"] += written
+            return written
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        return self.flush()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.metrics, pending=len(self.pending))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ {self.name} flush failed: {e}; retrying")
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import sys
+from types import SimpleNamespace
+import mongomock
+import numpy as np
+import pytest
+
+# Modules live at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class HashEmbedder:
+    """
+    Bag-of-words hashing embedder: texts sharing words get similar
+    vectors. Stands in for the sentence-transformers model.
+    """
+
+    dim = 384
+
+    def encode(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector + 1 / np.sqrt(self.dim)
+
+    def encode_batch(self, texts, batch_size=64):
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.encode(text) for text in texts])
+
+
+@pytest.fixture
+def embedder():
+    return HashEmbedder()
+
+
+@pytest.fixture
+def make_stores(tmp_path, monkeypatch, embedder):
+    """
+    make_stores(name) -> episodic / semantic / cache stores on their
+    own mongomock database and data directory, like one shard.
+    """
+    import episodic_memory
+    import semantic_cache
+    import semantic_memory
+
+    monkeypatch.chdir(tmp_path)
+    created = []
+
+    def make(name="shard0"):
+        client = mongomock.MongoClient()
+        data_dir = tmp_path / name
+        data_dir.mkdir()
+
+        for module in (episodic_memory, semantic_memory, semantic_cache):
+            monkeypatch.setattr(module, "MongoClient", lambda *args, **kwargs: client)
+            monkeypatch.setattr(module, "MONGO_DB", name)
+        monkeypatch.setattr(episodic_memory, "SEGMENT_DIR", str(data_dir / "episodic"))
+        monkeypatch.setattr(semantic_memory, "INDEX_PATH", str(data_dir / "semantic_hnsw.index"))
+        monkeypatch.setattr(semantic_cache, "INDEX_PATH", str(data_dir / "cache_hnsw.index"))
+
+        stores = SimpleNamespace(
+            db=client[name],
+            episodic=episodic_memory.EpisodicMemory(embedder=embedder),
+            semantic=semantic_memory.SemanticMemory(embedder=embedder),
+            cache=semantic_cache.SemanticCache(embedder=embedder)
+        )
+        created.append(stores)
+        return stores
+
+    yield make
+
+    for stores in created:
+        stores.semantic.support.close()
+        stores.cache.hits.close()
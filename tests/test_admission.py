@@ -0,0 +1,166 @@
+import threading
+import time
+import pytest
+import shard_router
+from admission import CACHE_ONLY, NO_EXTRACTION, NORMAL, AdmissionController, Rejected, client_timeout
+from shard_map import ShardMap
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def _queue(controller, user_id, granted, hold=None):
+    """
+    Start a request for user_id that waits for a slot, records
+    (user_id, ticket) once admitted and releases after `hold` is set.
+    """
+    depth = controller.depth
+
+    def run():
+        with controller.admit(user_id) as ticket:
+            granted.append((user_id, ticket))
+            if hold is not None:
+                hold.wait(5)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert _wait_for(lambda: controller.depth == depth + 1)
+    return thread
+
+
+def test_slots_are_granted_round_robin_across_users():
+    controller = AdmissionController(max_in_flight=1, queue_timeout=5)
+    holder = controller.acquire("u0")
+    granted = []
+    threads = [_queue(controller, user, granted) for user in ("u1", "u1", "u1", "u2")]
+
+    controller.release(holder)
+    for thread in threads:
+        thread.join(5)
+
+    # u2 does not wait behind all of u1's requests
+    assert [user for user, _ in granted] == ["u1", "u2", "u1", "u1"]
+    stats = controller.stats()
+    assert stats["queued"] == 4 and stats["in_flight"] == 0 and stats["queue_depth"] == 0
+    assert 0 < stats["queue_wait_p50_ms"] <= stats["queue_wait_p95_ms"]
+
+
+def test_user_over_their_queue_share_gets_429():
+    controller = AdmissionController(max_in_flight=1, max_queue_per_user=1, queue_timeout=5)
+    holder = controller.acquire("u0")
+    hold = threading.Event()
+    granted = []
+    thread = _queue(controller, "u1", granted, hold)
+
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire("u1")
+    assert rejected.value.status == 429
+
+    # Other users still queue
+    _queue(controller, "u2", granted, hold)
+    hold.set()
+    controller.release(holder)
+    thread.join(5)
+    assert controller.stats()["shed_user_limit"] == 1
+
+
+def test_full_queue_sheds_with_retry_after():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+    holder = controller.acquire("u0")
+    thread = _queue(controller, "u1", [])
+
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire("u2")
+    assert rejected.value.status == 503
+    assert rejected.value.retry_after >= 1
+
+    controller.release(holder)
+    thread.join(5)
+    assert controller.stats()["shed_queue_full"] == 1
+
+
+def test_client_deadline_cuts_the_wait_short():
+    controller = AdmissionController(max_in_flight=1, queue_timeout=5)
+    controller.acquire("u0")
+
+    started = time.monotonic()
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire("u1", timeout=0.05)
+    assert rejected.value.status == 503
+    assert time.monotonic() - started < 1
+
+    stats = controller.stats()
+    assert stats["shed_timeout"] == 1
+    assert stats["queue_depth"] == 0 and stats["queued_users"] == 0
+
+
+def test_queue_depth_degrades_admitted_work():
+    controller = AdmissionController(max_in_flight=1, degrade_depth=1, cache_only_depth=3, queue_timeout=5)
+    holder = controller.acquire("u0")
+    assert holder.mode == NORMAL
+
+    hold = threading.Event()
+    granted = []
+    threads = [_queue(controller, user, granted, hold) for user in ("u1", "u2", "u3")]
+
+    # Deep queue: new requests skip it and may only be served from cache
+    ticket = controller.acquire("u4")
+    assert ticket.mode == CACHE_ONLY and not ticket.slot
+
+    # u1 is admitted with two requests still behind it
+    controller.release(holder)
+    assert _wait_for(lambda: granted)
+    assert granted[0][1].mode == NO_EXTRACTION
+
+    hold.set()
+    for thread in threads:
+        thread.join(5)
+    assert [ticket.mode for _, ticket in granted] == [NO_EXTRACTION, NO_EXTRACTION, NORMAL]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("250", 0.25),
+    ("1500.5", 1.5005),
+    (None, None),
+    ("", None),
+    ("soon", None),
+    ("0", None),
+    ("-100", None),
+    ("nan", None),
+    ("inf", None),
+])
+def test_client_timeout_header(value, expected):
+    assert client_timeout(value) == expected
+
+
+class _Upstream:
+    status_code = 200
+    content = b'{"response": "ok"}'
+    headers = {"Content-Type": "application/json"}
+
+
+def test_router_forwards_the_client_deadline(tmp_path, monkeypatch):
+    sent = []
+
+    class Http:
+        def request(self, method, url, **kwargs):
+            sent.append(kwargs["headers"])
+            return _Upstream()
+
+    monkeypatch.setenv("SHARDS", "a=http://shard-a")
+    monkeypatch.setattr(shard_router, "shard_map", ShardMap(path=str(tmp_path / "routing.json")))
+    monkeypatch.setattr(shard_router, "http", Http())
+
+    client = shard_router.app.test_client()
+    r = client.post("/chat", json={"user_id": "u1", "message": "hi"}, headers={"X-Request-Timeout-Ms": "800"})
+    assert r.status_code == 200 and r.headers["X-Shard"] == "a"
+    assert sent[0]["X-Request-Timeout-Ms"] == "800"
+
+    client.post("/chat", json={"user_id": "u1", "message": "hi"})
+    assert "X-Request-Timeout-Ms" not in sent[1]
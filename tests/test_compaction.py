@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+from compaction import Compactor
+
+
+def _idle(db, content, days):
+    db.semantic_memory.update_one(
+        {"content": content},
+        {"$set": {"last_seen": datetime.utcnow() - timedelta(days=days)}}
+    )
+
+
+def test_unreinforced_memories_outlive_the_low_confidence_rule(make_stores, embedder, tmp_path):
+    stores = make_stores()
+    facts = ["the team deploys on fridays", "staging runs postgres 15"]
+    stores.semantic.add_memories(embedder.encode_batch(facts), facts, ["knowledge"] * 2, ["u1"] * 2)
+    # Both start at confidence 0.6; one is idle past search's cutoff
+    _idle(stores.db, facts[0], 20)
+    _idle(stores.db, facts[1], 61)
+
+    compactor = Compactor(stores.episodic, stores.semantic, stores.cache, db=stores.db, archive_dir=str(tmp_path / "archive"))
+    strict = Compactor(
+        stores.episodic, stores.semantic, stores.cache, db=stores.db,
+        retention={"semantic_min_confidence": 0.65}, archive_dir=str(tmp_path / "archive")
+    )
+    assert strict.run(dry_run=True)["expired"]["semantic"] == 2
+
+    assert compactor.run()["expired"]["semantic"] == 1
+    assert [doc["content"] for doc in stores.db.semantic_memory.find()] == [facts[0]]
+    assert stores.semantic.count() == 1
@@ -0,0 +1,33 @@
+from episodic_memory import EpisodicMemory
+
+
+def _users(hits):
+    return sorted(hit["user"] for hit in hits)
+
+
+def _search(episodic, embedder, user_id):
+    return _users(episodic.search(embedder.encode("run"), k=5, similarity_threshold=0.0, user_id=user_id))
+
+
+def test_assign_owner_scopes_legacy_episodes(make_stores, embedder):
+    stores = make_stores()
+    episodic = stores.episodic
+    episodic.add_episode(embedder.encode("morning run"), "morning run", "ok", user_id="u1")
+    # Written before user_id existed: no field at all, or null
+    episodic.add_episode(embedder.encode("evening run"), "evening run", "ok")
+    stores.db.episodic_memory.update_one({"user": "evening run"}, {"$unset": {"user_id": ""}})
+    episodic.add_episode(embedder.encode("lunch run"), "lunch run", "ok", user_id=None)
+
+    assert _search(episodic, embedder, "legacy") == []
+    assert episodic.assign_owner("legacy") == 2
+
+    assert _search(episodic, embedder, "legacy") == ["evening run", "lunch run"]
+    assert _search(episodic, embedder, "u1") == ["morning run"]
+    assert stores.db.episodic_memory.count_documents({"user_id": None}) == 0
+    assert episodic.assign_owner("legacy") == 0
+
+    # Segments loaded later read the owner from Mongo
+    episodic.persist()
+    reopened = EpisodicMemory(embedder=embedder)
+    assert _search(reopened, embedder, "legacy") == ["evening run", "lunch run"]
+
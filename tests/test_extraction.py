@@ -0,0 +1,84 @@
+import time
+import pytest
+import batch_chat
+import extraction
+from extraction import ExtractionPipeline
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    """
+    Turn texts passed to the extraction LLM call, one list per call.
+    """
+    calls = []
+
+    def fake_extract(turns):
+        calls.append(list(turns))
+        return []
+
+    monkeypatch.setattr(extraction, "extract_semantic_memories", fake_extract)
+    return calls
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_sweep_extracts_buffers_of_idle_users(make_stores, embedder, extracted):
+    stores = make_stores()
+    pipeline = ExtractionPipeline(stores.semantic, embedder, batch_size=4, max_wait_seconds=0.1)
+    try:
+        assert pipeline.submit("u1", "I work on the payments service", "noted") == "buffered"
+
+        # No further turns from u1 (or anyone): the sweep flushes it
+        assert _wait_for(lambda: extracted)
+        assert "payments service" in extracted[0][0]
+        assert pipeline.stats()["stale_flushes"] == 1
+        assert pipeline.buffers == {}
+    finally:
+        pipeline.close()
+
+
+def test_close_extracts_what_is_left(make_stores, embedder, extracted):
+    stores = make_stores()
+    pipeline = ExtractionPipeline(stores.semantic, embedder, batch_size=4, max_wait_seconds=60)
+    pipeline.submit("u1", "I prefer tabs over spaces", "ok")
+    pipeline.close()
+    assert len(extracted) == 1
+
+
+def test_batch_leaves_shared_buffers_alone(make_stores, embedder, extracted, monkeypatch):
+    stores = make_stores()
+    monkeypatch.setattr(batch_chat, "call_llm", lambda prompt: "an answer")
+    shared = ExtractionPipeline(stores.semantic, embedder, batch_size=4, max_wait_seconds=60)
+    try:
+        # A /chat turn from another user, waiting for more turns
+        shared.submit("u2", "I use vim for everything at work", "nice")
+
+        batch_chat.chat_batch(
+            [{"user_id": "u1", "message": "I am building a compiler in rust"}],
+            embedder, stores.episodic, stores.semantic, stores.cache,
+            extractor=shared
+        )
+
+        time.sleep(0.1)
+        assert extracted == []
+        assert set(shared.buffers) == {"u1", "u2"}
+    finally:
+        shared.close()
+
+
+def test_batch_with_its_own_pipeline_extracts_before_returning(make_stores, embedder, extracted, monkeypatch):
+    stores = make_stores()
+    monkeypatch.setattr(batch_chat, "call_llm", lambda prompt: "an answer")
+
+    batch_chat.chat_batch(
+        [{"user_id": "u1", "message": "I am building a compiler in rust"}],
+        embedder, stores.episodic, stores.semantic, stores.cache
+    )
+    assert len(extracted) == 1
@@ -0,0 +1,73 @@
+import os
+import stat
+import threading
+import time
+import pytest
+import index_service
+from index_service import IndexService, IndexServiceClient, IndexServiceError, connect_stores
+
+
+@pytest.fixture
+def key_file(tmp_path, monkeypatch):
+    path = tmp_path / "keys" / "index_service.key"
+    monkeypatch.delenv("INDEX_SERVICE_AUTHKEY", raising=False)
+    monkeypatch.setenv("INDEX_SERVICE_AUTHKEY_FILE", str(path))
+    return path
+
+
+def test_service_generates_a_private_key(key_file):
+    key = index_service._authkey(create=True)
+
+    assert len(key) == 64
+    assert stat.S_IMODE(os.stat(key_file).st_mode) == 0o600
+    assert index_service._authkey() == key
+    assert index_service._authkey(create=True) == key
+
+
+def test_client_without_key_fails(key_file):
+    with pytest.raises(IndexServiceError, match="INDEX_SERVICE_AUTHKEY"):
+        index_service._authkey()
+
+
+def test_readable_key_file_is_refused(key_file):
+    index_service._authkey(create=True)
+    os.chmod(key_file, 0o644)
+
+    with pytest.raises(IndexServiceError, match="0600"):
+        index_service._authkey()
+
+
+def test_env_key_wins(key_file, monkeypatch):
+    monkeypatch.setenv("INDEX_SERVICE_AUTHKEY", "s3cret")
+    assert index_service._authkey() == b"s3cret"
+    assert not key_file.exists()
+
+
+def test_socket_is_private_and_serves_calls(tmp_path, key_file, make_stores, embedder):
+    stores = make_stores()
+    service = IndexService.__new__(IndexService)
+    service.socket_path = str(tmp_path / "index.sock")
+    service.stores = {"episodic": stores.episodic, "semantic": stores.semantic, "cache": stores.cache}
+    service.sync = None
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+
+    for _ in range(100):
+        if os.path.exists(service.socket_path):
+            break
+        time.sleep(0.02)
+    assert stat.S_IMODE(os.stat(service.socket_path).st_mode) == 0o600
+
+    episodic, _, _ = connect_stores(service.socket_path)
+    episodic.add_episode(embedder.encode("hello there"), "hello there", "hi", user_id="u1")
+    assert episodic.count() == 1
+
+    # A client holding a different key is turned away
+    os.environ["INDEX_SERVICE_AUTHKEY"] = "wrong"
+    try:
+        with pytest.raises(Exception):
+            IndexServiceClient(service.socket_path).call("episodic", "count")
+    finally:
+        del os.environ["INDEX_SERVICE_AUTHKEY"]
+
+    # ... and the service keeps accepting the others
+    assert connect_stores(service.socket_path)[0].count() == 1
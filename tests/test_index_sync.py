@@ -0,0 +1,159 @@
+import threading
+from datetime import datetime
+import mongomock
+from index_sync import IndexSync
+
+
+def _texts(hits):
+    return sorted(hit["user"] for hit in hits)
+
+
+def test_episodic_reconcile_applies_mongo_diff(make_stores, embedder):
+    stores = make_stores()
+    episodic = stores.episodic
+    for text in ("morning run by the river", "evening run in the park"):
+        episodic.add_episode(embedder.encode(text), text, "nice", user_id="u1")
+
+    # Another node deleted one episode and inserted one
+    stores.db.episodic_memory.delete_one({"user": "evening run in the park"})
+    stores.db.episodic_memory.insert_one({
+        "_id": 1000, "user": "lunch run downtown", "assistant": "ok",
+        "user_id": "u1", "timestamp": datetime.utcnow()
+    })
+
+    assert episodic.reconcile() == {"missing": 1, "orphans": 1}
+    hits = episodic.search(embedder.encode("run"), k=5, similarity_threshold=0.0, user_id="u1")
+    assert _texts(hits) == ["lunch run downtown", "morning run by the river"]
+
+
+def test_episodic_reconcile_reads_mongo_without_blocking_searches(make_stores, embedder, monkeypatch):
+    stores = make_stores()
+    episodic = stores.episodic
+    episodic.add_episode(embedder.encode("first run"), "first run", "ok", user_id="u1")
+
+    scan = episodic._segment_users
+    during = {}
+
+    def slow_scan(key):
+        users = scan(key)
+        # A search and a write while reconcile is reading Mongo
+        searcher = threading.Thread(target=lambda: during.setdefault(
+            "hits", episodic.search(embedder.encode("first run"), k=5, user_id="u1")
+        ))
+        searcher.start()
+        searcher.join(timeout=5)
+        during["blocked"] = searcher.is_alive()
+        if not during["blocked"]:
+            episodic.add_episode(embedder.encode("second run"), "second run", "ok", user_id="u1")
+        return users
+
+    monkeypatch.setattr(episodic, "_segment_users", slow_scan)
+    episodic.reconcile()
+
+    assert not during["blocked"]
+    assert _texts(during["hits"]) == ["first run"]
+
+    # The episode added mid-reconcile is kept, not dropped as an orphan
+    hits = episodic.search(embedder.encode("run"), k=5, similarity_threshold=0.0, user_id="u1")
+    assert _texts(hits) == ["first run", "second run"]
+    assert episodic.count() == 2
+
+
+def test_episodic_sync_embeds_without_blocking_searches(make_stores, embedder, monkeypatch):
+    stores = make_stores()
+    episodic = stores.episodic
+    episodic.add_episode(embedder.encode("first run"), "first run", "ok", user_id="u1")
+    # Another node's insert
+    stores.db.episodic_memory.insert_one({
+        "_id": 1000, "user": "second run", "assistant": "ok",
+        "user_id": "u1", "timestamp": datetime.utcnow()
+    })
+
+    encode_batch = episodic.embedder.encode_batch
+    during = {}
+
+    def slow_encode(texts):
+        searcher = threading.Thread(target=lambda: during.setdefault(
+            "hits", episodic.search(embedder.encode("first run"), k=5, user_id="u1")
+        ))
+        searcher.start()
+        searcher.join(timeout=5)
+        during["blocked"] = searcher.is_alive()
+        return encode_batch(texts)
+
+    monkeypatch.setattr(episodic.embedder, "encode_batch", slow_encode)
+    assert episodic.sync_ids([1000]) == 1
+    assert not during["blocked"]
+    assert _texts(during["hits"]) == ["first run"]
+
+    # Already indexed: nothing is embedded again
+    during.clear()
+    assert episodic.sync_ids([1000]) == 0
+    assert during == {}
+
+
+def test_poll_indexes_ids_that_land_late(make_stores, embedder, monkeypatch):
+    stores = make_stores()
+    synced = []
+    sync_ids = stores.episodic.sync_ids
+    monkeypatch.setattr(stores.episodic, "sync_ids", lambda ids: synced.append(list(ids)) or sync_ids(ids))
+    sync = IndexSync(stores.episodic, stores.semantic, stores.cache, db=stores.db, state_path="index_sync.json")
+
+    def insert(eid, text):
+        stores.db.episodic_memory.insert_one({
+            "_id": eid, "user": text, "assistant": "ok",
+            "user_id": "u1", "timestamp": datetime.utcnow()
+        })
+
+    def poll():
+        return sync._poll_store("episodic_memory", "episodic", "_id")
+
+    assert poll() == 0  # first poll: high-water only
+    # Another node reserved ids 0..1000 but only its last insert landed
+    insert(1000, "evening run")
+    assert poll() == 1
+    assert poll() == 0
+    assert synced == [[1000]]
+
+    # ... the rest of that reservation lands well below the high-water mark
+    insert(1, "morning run")
+    assert poll() == 1
+    hits = stores.episodic.search(embedder.encode("run"), k=5, similarity_threshold=0.0, user_id="u1")
+    assert _texts(hits) == ["evening run", "morning run"]
+    assert len(sync.state["pending"]["episodic"]) == 999
+
+
+class _Store:
+    def __init__(self):
+        self.reconciles = 0
+
+    def sync_ids(self, ids):
+        return 0
+
+    def reconcile(self):
+        self.reconciles += 1
+
+
+def _poll_once(poll_reconcile_interval):
+    stores = [_Store(), _Store(), _Store()]
+    sync = IndexSync(
+        *stores,
+        db=mongomock.MongoClient().db,
+        mode="poll",
+        poll_interval=0.01,
+        reconcile_interval=0,
+        poll_reconcile_interval=poll_reconcile_interval,
+        state_path="index_sync.json"
+    )
+    thread = threading.Thread(target=sync._poll_loop)
+    thread.start()
+    sync._stop.wait(0.2)
+    sync.stop()
+    thread.join()
+    return [store.reconciles for store in stores]
+
+
+def test_poll_mode_reconciles_on_its_own_interval(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert _poll_once(poll_reconcile_interval=3600) == [0, 0, 0]
+    assert min(_poll_once(poll_reconcile_interval=0)) >= 1
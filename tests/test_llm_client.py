@@ -0,0 +1,104 @@
+import threading
+import time
+import pytest
+from llm_client import FakeProvider, LLMClient, LLMError, LLMUnavailable
+
+
+def make_client(provider, **kwargs):
+    options = dict(
+        timeout=1.0,
+        max_retries=0,
+        max_concurrency=1,
+        breaker_threshold=2,
+        breaker_reset_seconds=0.1
+    )
+    options.update(kwargs)
+    return LLMClient(provider, **options)
+
+
+def trip(client, provider):
+    provider.failure_rate = 1.0
+    for _ in range(client.breaker.failure_threshold):
+        with pytest.raises(LLMError):
+            client.complete("hi")
+    assert client.breaker.state == "open"
+
+
+def test_breaker_opens_and_fails_fast():
+    provider = FakeProvider(latency=0.0)
+    client = make_client(provider)
+    trip(client, provider)
+
+    calls = provider.calls
+    with pytest.raises(LLMUnavailable):
+        client.complete("hi")
+    assert provider.calls == calls
+
+
+def test_half_open_trial_closes_breaker():
+    provider = FakeProvider(latency=0.0)
+    client = make_client(provider)
+    trip(client, provider)
+
+    time.sleep(0.15)
+    assert client.breaker.state == "half_open"
+    provider.failure_rate = 0.0
+    assert client.complete("hi").startswith("[fake]")
+    assert client.breaker.state == "closed"
+
+
+def test_half_open_trial_failure_reopens():
+    provider = FakeProvider(latency=0.0)
+    client = make_client(provider)
+    trip(client, provider)
+
+    time.sleep(0.15)
+    with pytest.raises(LLMError):
+        client.complete("hi")
+    assert client.breaker.state == "open"
+
+
+def test_saturated_call_does_not_strand_half_open_trial():
+    provider = FakeProvider(latency=0.0)
+    client = make_client(provider, queue_timeout=0.05)
+    trip(client, provider)
+    time.sleep(0.15)
+    assert client.breaker.state == "half_open"
+
+    # Another caller holds the only slot: this one gives up waiting
+    client.semaphore.acquire()
+    try:
+        with pytest.raises(LLMUnavailable, match="saturated"):
+            client.complete("hi")
+    finally:
+        client.semaphore.release()
+
+    assert not client.breaker.trial_in_flight
+    provider.failure_rate = 0.0
+    assert client.complete("hi").startswith("[fake]")
+    assert client.breaker.state == "closed"
+
+
+def test_half_open_admits_a_single_trial():
+    provider = FakeProvider(latency=0.2)
+    client = make_client(provider, max_concurrency=4)
+    trip(client, provider)
+    time.sleep(0.15)
+    provider.failure_rate = 0.0
+
+    results = []
+
+    def call():
+        try:
+            results.append(client.complete("hi"))
+        except LLMUnavailable:
+            results.append(None)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(r is not None for r in results) == 1
+    assert client.breaker.state == "closed"
@@ -0,0 +1,26 @@
+import time
+from datetime import datetime, timedelta
+from persona_cache import PersonaCache
+
+
+def test_profile_skips_persona_memories_search_would_drop(make_stores, embedder):
+    semantic = make_stores().semantic
+    facts = ["user is a backend engineer", "user lives in lisbon"]
+    semantic.add_memories(embedder.encode_batch(facts), facts, ["persona"] * 2, ["u1"] * 2)
+    semantic.collection.update_one(
+        {"content": "user lives in lisbon"},
+        {"$set": {"last_seen": datetime.utcnow() - timedelta(days=90)}}
+    )
+
+    assert [hit["content"] for hit in semantic.persona_profile("u1")] == ["user is a backend engineer"]
+
+
+def test_cached_profile_expires():
+    loads = []
+    cache = PersonaCache(lambda user_id: loads.append(user_id) or [len(loads)], ttl=0.05)
+
+    assert cache.get("u1") == [1]
+    assert cache.get("u1") == [1]
+    time.sleep(0.06)
+    assert cache.get("u1") == [2]
+    assert cache.stats()["expired"] == 1
@@ -0,0 +1,131 @@
+from bson import json_util
+import pytest
+import rebalance
+from shard_map import HashRing, ShardMap
+
+
+def _wire(payload):
+    # What the admin endpoints do to bodies (extended JSON both ways)
+    return json_util.loads(json_util.dumps(payload))
+
+
+class InProcessShard:
+    """
+    ShardClient stand-in calling rebalance's shard-side functions on
+    local stores, as app.py's /admin/* handlers do.
+    """
+
+    def __init__(self, name, stores):
+        self.name = name
+        self.db = stores.db
+        self.stores = {"episodic": stores.episodic, "semantic": stores.semantic, "cache": stores.cache}
+        self.after_export = None
+
+    def users(self, user_id=None):
+        return _wire(rebalance.list_users(self.db, user_id))
+
+    def export_user(self, user_id, after=None):
+        exported = _wire(rebalance.export_user(self.db, user_id, after))
+        if self.after_export:
+            hook, self.after_export = self.after_export, None
+            hook()
+        return exported
+
+    def import_user(self, exported):
+        return rebalance.import_user(self.db, self.stores, _wire(exported))
+
+    def delete_user(self, user_id):
+        return rebalance.delete_user(self.db, self.stores, user_id)
+
+
+def _seed(stores, embedder, user_id):
+    for text in (f"{user_id} asked about hiking trails", f"{user_id} asked about pasta recipes"):
+        stores.episodic.add_episode(embedder.encode(text), text, "sure", user_id=user_id)
+    facts = [f"{user_id} enjoys mountain hiking", f"{user_id} cooks italian pasta"]
+    stores.semantic.add_memories(
+        embedder.encode_batch(facts), facts, ["knowledge", "knowledge"], [user_id, user_id]
+    )
+    query = f"what does {user_id} like"
+    stores.cache.add(embedder.encode(query), user_id=user_id, query=query, response=f"{user_id} likes hiking")
+
+
+@pytest.fixture
+def cluster(tmp_path, make_stores, embedder, monkeypatch):
+    shard_map = ShardMap(path=str(tmp_path / "routing.json"), check_interval=0)
+    shard_map.save({
+        "shards": {"shard0": "inproc://0", "shard1": "inproc://1"},
+        "draining": [],
+        "overrides": {}
+    })
+    stores = {"shard0": make_stores("shard0"), "shard1": make_stores("shard1")}
+    clients = {name: InProcessShard(name, s) for name, s in stores.items()}
+
+    rebalancer = rebalance.Rebalancer(shard_map)
+    monkeypatch.setattr(rebalancer, "client", lambda shard: clients[shard])
+    return rebalancer, stores, clients
+
+
+def test_move_round_trip(cluster, embedder):
+    rebalancer, stores, clients = cluster
+    source = rebalancer.shard_map.shard_for("alice")
+    target = "shard1" if source == "shard0" else "shard0"
+    src, dst = stores[source], stores[target]
+
+    _seed(src, embedder, "alice")
+    _seed(src, embedder, "bob")
+
+    # A write landing on the source while the first copy is in flight
+    late = "alice asked about ski resorts"
+    clients[source].after_export = lambda: src.episodic.add_episode(
+        embedder.encode(late), late, "sure", user_id="alice"
+    )
+
+    result = rebalancer.move("alice", target)
+
+    assert result["imported"] == {"episodic": 3, "semantic": 2, "cache": 1}
+    assert result["deleted"] == {"episodic": 3, "semantic": 2, "cache": 1}
+    assert rebalancer.shard_map.shard_for("alice") == target
+
+    assert set(rebalance.list_users(dst.db)) == {"alice"}
+    assert set(rebalance.list_users(src.db)) == {"bob"}
+
+    # Indexed on the target, gone from the source indexes
+    hits = dst.episodic.search(embedder.encode(late), k=3, user_id="alice")
+    assert late in [hit["user"] for hit in hits]
+    assert src.episodic.search(embedder.encode(late), k=3, user_id="alice") == []
+
+    fact = "alice enjoys mountain hiking"
+    assert [h["content"] for h in dst.semantic.search(
+        embedder.encode(fact), fact, k=1, mem_type="knowledge", user_id="alice"
+    )] == [fact]
+    assert src.semantic.search(
+        embedder.encode(fact), fact, k=1, mem_type="knowledge", user_id="alice"
+    ) == []
+
+    query = embedder.encode("what does alice like")
+    assert dst.cache.lookup(query, user_id="alice") == "alice likes hiking"
+    assert src.cache.lookup(query, user_id="alice") is None
+
+    # Bob stays where he was
+    assert src.cache.lookup(embedder.encode("what does bob like"), user_id="bob") == "bob likes hiking"
+
+
+def test_move_refuses_to_merge_by_default(cluster, embedder):
+    rebalancer, stores, _ = cluster
+    source = rebalancer.shard_map.shard_for("alice")
+    target = "shard1" if source == "shard0" else "shard0"
+    _seed(stores[source], embedder, "alice")
+    _seed(stores[target], embedder, "alice")
+
+    with pytest.raises(RuntimeError, match="already has data"):
+        rebalancer.move("alice", target)
+
+
+def test_hash_ring_moves_about_one_nth_of_users():
+    users = [f"user{i}" for i in range(2000)]
+    before = HashRing(["shard0", "shard1", "shard2"])
+    after = HashRing(["shard0", "shard1", "shard2", "shard3"])
+
+    moved = [u for u in users if before.get(u) != after.get(u)]
+    assert all(after.get(u) == "shard3" for u in moved)
+    assert 0.15 < len(moved) / len(users) < 0.35
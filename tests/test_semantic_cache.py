@@ -0,0 +1,40 @@
+def _fill(cache, embedder, entries):
+    """
+    entries: [(user_id, query, response)]
+    """
+    users, queries, responses = map(list, zip(*entries))
+    return cache.add_batch(embedder.encode_batch(queries), users, queries, responses)
+
+
+def test_other_users_do_not_crowd_out_the_callers_entry(make_stores, embedder):
+    cache = make_stores().cache
+    # Other users' identical queries fill any unfiltered top-k
+    _fill(cache, embedder, [
+        (f"other{i}", "how do i reset my password", f"answer {i}") for i in range(20)
+    ] + [("u1", "how do i reset my password please", "u1 answer")])
+
+    query = embedder.encode("how do i reset my password")
+    assert cache.lookup(query, "u1", similarity_threshold=0.5) == "u1 answer"
+    assert cache.nearest_similarity(query, "u1") > 0.5
+    assert cache.nearest_similarity(query, "nobody") == 0.0
+    assert cache.lookup(query, "nobody", similarity_threshold=0.0) is None
+
+
+def test_lookup_batch_answers_each_row_from_its_own_user(make_stores, embedder):
+    cache = make_stores().cache
+    _fill(cache, embedder, [
+        ("u1", "what is the deploy command", "make deploy"),
+        ("u2", "what is the deploy command", "just ship it"),
+    ])
+
+    query = embedder.encode("what is the deploy command")
+    assert cache.lookup_batch([query, query, query], ["u2", "u1", "u3"]) == ["just ship it", "make deploy", None]
+
+
+def test_removed_entries_leave_the_users_scope(make_stores, embedder):
+    cache = make_stores().cache
+    cids = _fill(cache, embedder, [("u1", "what is the deploy command", "make deploy")])
+
+    assert cache.remove(cids) == 1
+    assert cache.users == {}
+    assert cache.lookup(embedder.encode("what is the deploy command"), "u1") is None
@@ -0,0 +1,105 @@
+import pytest
+
+
+def _add(semantic, embedder, facts):
+    """
+    facts: [(user_id, mem_type, content)]
+    """
+    users, types, contents = zip(*facts)
+    semantic.add_memories(embedder.encode_batch(list(contents)), list(contents), list(types), list(users))
+
+
+def _search(semantic, embedder, text, **kwargs):
+    kwargs.setdefault("similarity_threshold", 0.0)
+    return [hit["content"] for hit in semantic.search(embedder.encode(text), text, **kwargs)]
+
+
+@pytest.fixture
+def semantic(make_stores, embedder):
+    semantic = make_stores().semantic
+    _add(semantic, embedder, [
+        ("u1", "knowledge", "the staging database runs postgres 15"),
+        ("u1", "process", "deploy staging with make deploy"),
+        ("u2", "knowledge", "the staging database runs mysql 8"),
+        ("u2", "knowledge", "staging database backups run nightly"),
+    ])
+    return semantic
+
+
+@pytest.mark.parametrize("fusion", ["linear", "rrf"])
+def test_search_is_scoped_to_user_and_type(semantic, embedder, fusion):
+    query = "which database does staging run"
+
+    assert _search(semantic, embedder, query, k=5, mem_type="knowledge", user_id="u1", fusion=fusion) == [
+        "the staging database runs postgres 15"
+    ]
+    assert set(_search(semantic, embedder, query, k=5, mem_type="knowledge", user_id="u2", fusion=fusion)) == {
+        "the staging database runs mysql 8", "staging database backups run nightly"
+    }
+    assert _search(semantic, embedder, query, k=5, mem_type="process", user_id="u2", fusion=fusion) == []
+    assert len(_search(semantic, embedder, query, k=5, mem_type="knowledge", fusion=fusion)) == 3
+
+
+def test_lexical_only_match_stays_scoped(semantic, embedder):
+    # "postgres" alone: found through BM25 for its owner only
+    assert _search(semantic, embedder, "postgres", k=3, mem_type="knowledge", user_id="u1", fusion="rrf") == [
+        "the staging database runs postgres 15"
+    ]
+    assert "the staging database runs postgres 15" not in _search(
+        semantic, embedder, "postgres", k=3, mem_type="knowledge", user_id="u2", fusion="rrf"
+    )
+
+
+def test_scopes_follow_add_and_remove(semantic, embedder):
+    doc = semantic.collection.find_one({"content": "the staging database runs postgres 15"})
+    semantic.remove([doc["embedding_id"]])
+
+    assert _search(semantic, embedder, "staging database", k=5, mem_type="knowledge", user_id="u1") == []
+    assert ("knowledge", "u1") not in semantic.scopes
+
+    _add(semantic, embedder, [("u1", "knowledge", "the staging database moved to aurora")])
+    assert _search(semantic, embedder, "staging database", k=5, mem_type="knowledge", user_id="u1") == [
+        "the staging database moved to aurora"
+    ]
+    assert sum(map(len, semantic.scopes.values())) == semantic.count()
+
+
+def test_nearest_similarity_ignores_other_users(make_stores, embedder):
+    semantic = make_stores().semantic
+    # Other users' near-identical facts fill any unfiltered top-k
+    _add(semantic, embedder, [
+        (f"other{i}", "knowledge", f"user prefers dark roast coffee {i}") for i in range(20)
+    ] + [("u1", "knowledge", "user prefers green tea in the morning")])
+
+    query = embedder.encode("user prefers dark roast coffee")
+    assert semantic.nearest_similarity(query, "u1") > 0.2
+    assert semantic.nearest_similarity(query, "u1") < semantic.nearest_similarity(query, "other3")
+    assert semantic.nearest_similarity(query, "nobody") == 0.0
+
+
+
+def test_stale_index_file_does_not_break_search(semantic, embedder, monkeypatch):
+    import semantic_memory
+    from semantic_memory import SemanticMemory
+
+    semantic.persist()
+    # Written after the index file was saved (crash before the next save)
+    semantic.collection.insert_one({
+        "embedding_id": 999, "content": "the staging database runs postgres 16",
+        "type": "knowledge", "user_id": "u1", "support_count": 1, "confidence": 0.6
+    })
+    monkeypatch.setattr(semantic_memory, "RECONCILE_ON_START", False)
+    reopened = SemanticMemory(embedder=embedder)
+    try:
+        for fusion in ("linear", "rrf"):
+            assert _search(reopened, embedder, "postgres", k=3, mem_type="knowledge", user_id="u1", fusion=fusion) == [
+                "the staging database runs postgres 15"
+            ]
+        # ... and catch-up still indexes it
+        assert reopened.sync_ids([999]) == 1
+    finally:
+        reopened.support.close()
+
+    # BM25 candidates HNSW lacks are skipped, not looked up
+    labels, vectors = semantic._stored_vectors([0, 999])
+    assert labels == [0] and vectors.shape == (1, 384)